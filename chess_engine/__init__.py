@@ -0,0 +1,16 @@
+"""
+Headless chess engine: rules, pieces, game state and the computer opponent.
+
+Nothing in this package imports pygame, so it can be used from workers,
+servers and batch jobs without a display stack.
+"""
+
+from .pieces import BOARD_SIZE, Color, PieceType, Piece
+from .ai import AIDifficulty, ChessAI, DifficultyProfile
+from .game import GameMode, GameState
+
+__all__ = [
+    'BOARD_SIZE', 'Color', 'PieceType', 'Piece',
+    'AIDifficulty', 'ChessAI', 'DifficultyProfile',
+    'GameMode', 'GameState',
+]
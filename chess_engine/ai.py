@@ -0,0 +1,978 @@
+"""
+Computer opponent: minimax search with alpha-beta pruning
+"""
+
+import json
+import os
+import random
+import time
+import zlib
+from enum import Enum
+
+from .cache import MAX_NODE_BUDGET
+from .notation import search_move_to_uci
+from .pieces import (BOARD_SIZE, MAX_PIECE_MOVES, MOVE_CODES, SQUARE_COORDS, Color, PieceType,
+                     least_valuable_attacker)
+
+INFINITY = float('inf')
+MATE_SCORE = 100000
+MAX_SEARCH_DEPTH = 64
+
+# Nodes between checks of the clock and stop flag; the node limit itself is exact
+CHECK_LIMITS_INTERVAL = 256
+
+# Losing captures (negative static exchange) are skipped at nodes this close to the horizon
+SEE_PRUNE_DEPTH = 2
+
+# Per-ply move buffers: room for every pseudo-legal move of a position, and for
+# the plies of the deepest search plus its quiescence tail
+MAX_MOVES = 256
+MAX_PLY = 2 * MAX_SEARCH_DEPTH
+# Longest capture sequence on one square (every piece on the board taking part)
+MAX_EXCHANGE = 32
+
+# MovePicker stages, in the order moves are handed out
+PICK_HASH = 0
+PICK_GENERATE_CAPTURES = 1
+PICK_GOOD_CAPTURES = 2
+PICK_KILLER_1 = 3
+PICK_KILLER_2 = 4
+PICK_GENERATE_QUIETS = 5
+PICK_QUIETS = 6
+PICK_LOSING_CAPTURES = 7
+PICK_DONE = 8
+
+NO_KILLERS = (0, 0)
+
+# Transposition table entry flags
+EXACT = 0
+LOWER_BOUND = 1
+UPPER_BOUND = 2
+
+# Rough size of one transposition table entry (dict slot, key, tuple), used to
+# turn a hash size in megabytes into an entry limit
+TABLE_ENTRY_BYTES = 200
+DEFAULT_HASH_MB = 16
+
+# Format version of evaluation weight files written by chess_engine.tune
+EVALUATION_WEIGHTS_VERSION = 1
+
+class SearchStopped(Exception):
+    """Raised inside the search when the stop flag is set or the deadline passes"""
+
+def score_to_table(score, ply):
+    # Mate scores are stored relative to the node, not the root
+    if score >= MATE_SCORE - MAX_SEARCH_DEPTH:
+        return score + ply
+    if score <= -MATE_SCORE + MAX_SEARCH_DEPTH:
+        return score - ply
+    return score
+
+def score_from_table(score, ply):
+    if score >= MATE_SCORE - MAX_SEARCH_DEPTH:
+        return score - ply
+    if score <= -MATE_SCORE + MAX_SEARCH_DEPTH:
+        return score + ply
+    return score
+
+class MovePicker:
+    """Staged move selection for one ply of the search, in buffers allocated once.
+
+    Hands out move codes (pieces.MOVE_CODES): the hash move, winning and
+    even captures by most valuable victim / least valuable attacker, the
+    killer moves, the other quiet moves and finally captures that lose
+    material by static exchange. Moves are checked for legality only when
+    they are handed out, and quiet moves are only generated if no earlier
+    move caused a cutoff. next_move returns 0 once the moves run out.
+    """
+
+    def __init__(self, ai):
+        self.ai = ai
+        self.moves = [0] * MAX_MOVES
+        self.scores = [0] * MAX_MOVES
+        self.losing = [0] * MAX_MOVES
+        self.losing_scores = [0] * MAX_MOVES
+        self.scratch = [0] * MAX_PIECE_MOVES
+        self.game = None
+        self.board = None
+        self.king = None
+        self.hash_move = 0
+        self.killer_1 = 0
+        self.killer_2 = 0
+        self.prune_losing = False
+        self.captures_only = False
+        self.searched = False
+        self.stage = PICK_DONE
+        self.count = 0
+        self.index = 0
+        self.losing_count = 0
+        self.losing_index = 0
+
+    def reset(self, game, hash_move=0, killers=NO_KILLERS, prune_losing=False, captures_only=False):
+        """Start over on the side to move in game.
+
+        With prune_losing the losing captures are skipped unless they are the
+        only legal moves; with captures_only (quiescence) picking stops after
+        the winning and even captures.
+        """
+        self.game = game
+        self.board = game.board
+        self.king = game.find_king(game.turn)
+        self.hash_move = hash_move
+        self.killer_1, self.killer_2 = killers
+        self.prune_losing = prune_losing
+        self.captures_only = captures_only
+        self.searched = False
+        self.stage = PICK_GENERATE_CAPTURES if captures_only else PICK_HASH
+
+    def next_move(self):
+        """The next legal move code, or 0"""
+        while True:
+            stage = self.stage
+            if stage == PICK_GOOD_CAPTURES:
+                if self.index < self.count:
+                    code = self.select_best(self.moves, self.scores, self.index, self.count)
+                    self.index += 1
+                    if code != self.hash_move and self.is_legal(code):
+                        self.searched = True
+                        return code
+                    continue
+                self.stage = PICK_DONE if self.captures_only else PICK_KILLER_1
+            elif stage == PICK_QUIETS:
+                if self.index < self.count:
+                    code = self.moves[self.index]
+                    self.index += 1
+                    if code != self.hash_move and code != self.killer_1 and code != self.killer_2 and \
+                       self.is_legal(code):
+                        self.searched = True
+                        return code
+                    continue
+                self.stage = PICK_LOSING_CAPTURES
+            elif stage == PICK_HASH:
+                self.stage = PICK_GENERATE_CAPTURES
+                code = self.hash_move
+                if code and self.is_pseudo_legal(code) and self.is_legal(code):
+                    self.searched = True
+                    return code
+            elif stage == PICK_GENERATE_CAPTURES:
+                self.generate_captures()
+                self.stage = PICK_GOOD_CAPTURES
+            elif stage == PICK_KILLER_1 or stage == PICK_KILLER_2:
+                self.stage = stage + 1
+                code = self.killer_1 if stage == PICK_KILLER_1 else self.killer_2
+                if code and code != self.hash_move and self.is_pseudo_legal(code, quiet=True) and self.is_legal(code):
+                    self.searched = True
+                    return code
+            elif stage == PICK_GENERATE_QUIETS:
+                self.generate_quiets()
+                self.stage = PICK_QUIETS
+            elif stage == PICK_LOSING_CAPTURES:
+                if self.losing_index >= self.losing_count or (self.prune_losing and self.searched):
+                    self.stage = PICK_DONE
+                    return 0
+                code = self.select_best(self.losing, self.losing_scores, self.losing_index, self.losing_count)
+                self.losing_index += 1
+                if code != self.hash_move and self.is_legal(code):
+                    return code
+            else:
+                return 0
+
+    @staticmethod
+    def select_best(moves, scores, start, count):
+        """Bring the best scored of moves[start:count] to start, the others keeping their order"""
+        best = start
+        best_score = scores[start]
+        index = start + 1
+        while index < count:
+            if scores[index] > best_score:
+                best = index
+                best_score = scores[index]
+            index += 1
+        code = moves[best]
+        while best > start:
+            moves[best] = moves[best - 1]
+            scores[best] = scores[best - 1]
+            best -= 1
+        moves[start] = code
+        scores[start] = best_score
+        return code
+
+    def generate_captures(self):
+        """Fill the capture buffers, scoring each capture by MVV-LVA or its losing exchange.
+
+        A capture by a cheaper piece can't lose material, so only captures
+        by more valuable pieces get a full static exchange evaluation.
+        """
+        ai = self.ai
+        piece_values = ai.piece_values
+        use_exchange = 'see' in ai.features
+        board = self.board
+        last_move = self.game.last_move
+        turn = self.game.turn
+        moves = self.moves
+        scores = self.scores
+        losing = self.losing
+        losing_scores = self.losing_scores
+        scratch = self.scratch
+        count = 0
+        losing_count = 0
+        for board_row in board:
+            for piece in board_row:
+                if piece is None or piece.color != turn:
+                    continue
+                attacker_value = piece_values[piece.type]
+                piece_count = piece.generate_moves(board, last_move, scratch, 0, quiets=False)
+                index = 0
+                while index < piece_count:
+                    code = scratch[index]
+                    index += 1
+                    target_square = SQUARE_COORDS[code >> 6]
+                    target = board[target_square[0]][target_square[1]]
+                    # An empty target square is an en passant capture
+                    victim_value = piece_values[target.type if target else PieceType.PAWN]
+                    exchange = victim_value - attacker_value
+                    if exchange < 0:
+                        # Without static exchange evaluation every capture counts as even
+                        exchange = ai.static_exchange(board, piece, target_square) if use_exchange else 0
+                    if exchange < 0:
+                        losing[losing_count] = code
+                        losing_scores[losing_count] = exchange
+                        losing_count += 1
+                    else:
+                        moves[count] = code
+                        scores[count] = victim_value * 10 - attacker_value // 10
+                        count += 1
+        self.count = count
+        self.index = 0
+        self.losing_count = losing_count
+        self.losing_index = 0
+
+    def generate_quiets(self):
+        """Fill the move buffer with the quiet moves, in board order"""
+        board = self.board
+        last_move = self.game.last_move
+        turn = self.game.turn
+        moves = self.moves
+        count = 0
+        for board_row in board:
+            for piece in board_row:
+                if piece is not None and piece.color == turn:
+                    count = piece.generate_moves(board, last_move, moves, count, captures=False)
+        self.count = count
+        self.index = 0
+
+    def is_pseudo_legal(self, code, quiet=False):
+        """Whether a move from the table or killer slots is playable here, ignoring checks"""
+        board = self.board
+        from_row, from_col = SQUARE_COORDS[code & 63]
+        piece = board[from_row][from_col]
+        if piece is None or piece.color != self.game.turn:
+            return False
+        if quiet:
+            to_row, to_col = SQUARE_COORDS[code >> 6]
+            if board[to_row][to_col] is not None or (piece.type == PieceType.PAWN and from_col != to_col):
+                return False
+        scratch = self.scratch
+        count = piece.generate_moves(board, self.game.last_move, scratch, 0, captures=not quiet)
+        index = 0
+        while index < count:
+            if scratch[index] == code:
+                return True
+            index += 1
+        return False
+
+    def is_legal(self, code):
+        """Whether a pseudo-legal move keeps the mover's king safe"""
+        board = self.board
+        from_row, from_col = SQUARE_COORDS[code & 63]
+        return not board[from_row][from_col].move_would_cause_check(board, SQUARE_COORDS[code >> 6], self.king)
+
+class AIDifficulty(Enum):
+    EASY = 1
+    MEDIUM = 2
+    HARD = 3
+    EXPERT = 4
+
+# Optional parts of the search a difficulty profile can switch on. 'nnue' uses
+# the neural evaluation (chess_engine.nnue) when a weights file is available
+SEARCH_FEATURES = frozenset(('transposition', 'killers', 'quiescence', 'see', 'nnue'))
+
+class DifficultyProfile:
+    """How much work the AI puts into a move and how well it judges positions.
+
+    node_budget and time_budget (seconds) bound every move; whichever runs
+    out first ends the search, which plays the best move of the last
+    finished iteration. max_depth stops the iterations early in simple
+    positions. eval_noise adds up to that many tenths of a pawn, either
+    way, to every evaluation, and features is the subset of
+    SEARCH_FEATURES the search uses.
+    """
+
+    def __init__(self, max_depth, node_budget=None, time_budget=None, eval_noise=0, features=SEARCH_FEATURES):
+        unknown = set(features) - SEARCH_FEATURES
+        if unknown:
+            raise ValueError(f"Unknown search features: {', '.join(sorted(unknown))}")
+        self.max_depth = max_depth
+        self.node_budget = node_budget
+        self.time_budget = time_budget
+        self.eval_noise = eval_noise
+        self.features = frozenset(features)
+
+    def __repr__(self):
+        return (f"DifficultyProfile(max_depth={self.max_depth}, node_budget={self.node_budget}, "
+                f"time_budget={self.time_budget}, eval_noise={self.eval_noise}, "
+                f"features={sorted(self.features)})")
+
+# The node budget sets the cost of a move (about 70 microseconds per node with
+# the tables, more with the neural evaluation); the time budget is a backstop
+DIFFICULTY_PROFILES = {
+    AIDifficulty.EASY: DifficultyProfile(2, node_budget=300, time_budget=0.25, eval_noise=30, features=()),
+    AIDifficulty.MEDIUM: DifficultyProfile(3, node_budget=2000, time_budget=0.5, eval_noise=8,
+                                           features=('transposition', 'quiescence', 'see')),
+    AIDifficulty.HARD: DifficultyProfile(4, node_budget=10000, time_budget=2.0),
+    AIDifficulty.EXPERT: DifficultyProfile(6, node_budget=40000, time_budget=6.0),
+}
+
+NNUE_WEIGHTS_ENV = 'CHESS_NNUE_WEIGHTS'
+DEFAULT_NNUE_WEIGHTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'nnue.npz')
+
+class ChessAI:
+    def __init__(self, difficulty=AIDifficulty.MEDIUM, profile=None):
+        # Accumulator of the neural evaluation, or None for the piece-square tables
+        self.nnue = None
+        # Persistent chess_engine.cache.AnalysisCache consulted before each search
+        self.analysis_cache = None
+        # chess_engine.trace.SearchTrace recording each search's spans, or None
+        self.trace = None
+        # Moves at plies below this are traced (0 when not tracing)
+        self.trace_ply = 0
+        # Evaluation id of the piece-square tables, kept while the network is in use
+        self.tables_id = 'tables'
+        self.evaluation_id = self.tables_id
+        self.transposition_table = {}
+        self.set_hash_size(DEFAULT_HASH_MB)
+        self.nodes = 0
+        self.deadline = None
+        self.stop_event = None
+        self.start_time = 0.0
+        self.last_pv = []
+        self.last_score = 0
+        self.last_depth = 0
+        self.last_lines = []
+        # Two quiet moves (codes) per ply that recently caused a beta cutoff
+        self.killers = [[0, 0] for _ in range(MAX_SEARCH_DEPTH + 1)]
+        # One MovePicker per ply, created by the first search
+        self.pickers = []
+        # static_exchange scratch space
+        self.exchange_gains = [0] * MAX_EXCHANGE
+        self.exchange_pieces = [None] * MAX_EXCHANGE
+        self.piece_values = {
+            PieceType.PAWN: 10,
+            PieceType.KNIGHT: 30,
+            PieceType.BISHOP: 30,
+            PieceType.ROOK: 50,
+            PieceType.QUEEN: 90,
+            PieceType.KING: 900
+        }
+
+        # Position evaluation tables to encourage good piece positioning
+        self.position_values = {
+            PieceType.PAWN: [
+                [0, 0, 0, 0, 0, 0, 0, 0],
+                [50, 50, 50, 50, 50, 50, 50, 50],
+                [10, 10, 20, 30, 30, 20, 10, 10],
+                [5, 5, 10, 25, 25, 10, 5, 5],
+                [0, 0, 0, 20, 20, 0, 0, 0],
+                [5, -5, -10, 0, 0, -10, -5, 5],
+                [5, 10, 10, -20, -20, 10, 10, 5],
+                [0, 0, 0, 0, 0, 0, 0, 0]
+            ],
+            PieceType.KNIGHT: [
+                [-50, -40, -30, -30, -30, -30, -40, -50],
+                [-40, -20, 0, 0, 0, 0, -20, -40],
+                [-30, 0, 10, 15, 15, 10, 0, -30],
+                [-30, 5, 15, 20, 20, 15, 5, -30],
+                [-30, 0, 15, 20, 20, 15, 0, -30],
+                [-30, 5, 10, 15, 15, 10, 5, -30],
+                [-40, -20, 0, 5, 5, 0, -20, -40],
+                [-50, -40, -30, -30, -30, -30, -40, -50]
+            ],
+            PieceType.BISHOP: [
+                [-20, -10, -10, -10, -10, -10, -10, -20],
+                [-10, 0, 0, 0, 0, 0, 0, -10],
+                [-10, 0, 10, 10, 10, 10, 0, -10],
+                [-10, 5, 5, 10, 10, 5, 5, -10],
+                [-10, 0, 5, 10, 10, 5, 0, -10],
+                [-10, 10, 10, 10, 10, 10, 10, -10],
+                [-10, 5, 0, 0, 0, 0, 5, -10],
+                [-20, -10, -10, -10, -10, -10, -10, -20]
+            ],
+            PieceType.ROOK: [
+                [0, 0, 0, 0, 0, 0, 0, 0],
+                [5, 10, 10, 10, 10, 10, 10, 5],
+                [-5, 0, 0, 0, 0, 0, 0, -5],
+                [-5, 0, 0, 0, 0, 0, 0, -5],
+                [-5, 0, 0, 0, 0, 0, 0, -5],
+                [-5, 0, 0, 0, 0, 0, 0, -5],
+                [-5, 0, 0, 0, 0, 0, 0, -5],
+                [0, 0, 0, 5, 5, 0, 0, 0]
+            ],
+            PieceType.QUEEN: [
+                [-20, -10, -10, -5, -5, -10, -10, -20],
+                [-10, 0, 0, 0, 0, 0, 0, -10],
+                [-10, 0, 5, 5, 5, 5, 0, -10],
+                [-5, 0, 5, 5, 5, 5, 0, -5],
+                [0, 0, 5, 5, 5, 5, 0, -5],
+                [-10, 5, 5, 5, 5, 5, 0, -10],
+                [-10, 0, 5, 0, 0, 0, 0, -10],
+                [-20, -10, -10, -5, -5, -10, -10, -20]
+            ],
+            PieceType.KING: [
+                [-30, -40, -40, -50, -50, -40, -40, -30],
+                [-30, -40, -40, -50, -50, -40, -40, -30],
+                [-30, -40, -40, -50, -50, -40, -40, -30],
+                [-30, -40, -40, -50, -50, -40, -40, -30],
+                [-20, -30, -30, -40, -40, -30, -30, -20],
+                [-10, -20, -20, -20, -20, -20, -20, -10],
+                [20, 20, 0, 0, 0, 0, 20, 20],
+                [20, 30, 10, 0, 0, 10, 30, 20]
+            ]
+        }
+        self.update_attacker_order()
+
+        self.set_difficulty(difficulty, profile)
+
+    def set_difficulty(self, difficulty, profile=None):
+        """Switch to a difficulty level, with its DIFFICULTY_PROFILES entry unless a profile is given"""
+        self.difficulty = difficulty
+        self.profile = profile or DIFFICULTY_PROFILES[difficulty]
+        self.features = self.profile.features
+        self.eval_noise = self.profile.eval_noise
+
+        if 'nnue' not in self.features:
+            if self.nnue is not None:
+                self.nnue = None
+                self.evaluation_id = self.tables_id
+            return
+        if self.nnue is not None:
+            return
+        weights_path = os.environ.get(NNUE_WEIGHTS_ENV, DEFAULT_NNUE_WEIGHTS)
+        if os.path.exists(weights_path):
+            try:
+                self.load_nnue(weights_path)
+            except ImportError:
+                # NumPy is not installed: keep the piece-square evaluation
+                pass
+
+    def get_move(self, game):
+        """Pick a move for the side to move within the profile's budgets; returns (piece, target) or None"""
+        profile = self.profile
+        deadline = time.time() + profile.time_budget if profile.time_budget else None
+        return self.search(game, max_depth=profile.max_depth, deadline=deadline, node_limit=profile.node_budget)
+
+    def load_evaluation(self, path):
+        """Replace the piece values and piece-square tables with tuned ones.
+
+        The file is JSON as written by chess_engine.tune: piece_values maps
+        piece letters to values and position_values maps them to 8x8 tables
+        seen from white's side (row 0 is the eighth rank).
+        """
+        with open(path) as weights_file:
+            text = weights_file.read()
+        weights = json.loads(text)
+        if weights.get('version') != EVALUATION_WEIGHTS_VERSION:
+            raise ValueError(f"Evaluation weights {path!r} have version {weights.get('version')}, "
+                             f"expected {EVALUATION_WEIGHTS_VERSION}")
+        for piece_type in PieceType:
+            self.piece_values[piece_type] = weights['piece_values'][piece_type.value]
+            self.position_values[piece_type] = [list(row) for row in weights['position_values'][piece_type.value]]
+        self.update_attacker_order()
+        self.tables_id = f"tables:{zlib.crc32(text.encode()):08x}"
+        if self.nnue is None:
+            self.evaluation_id = self.tables_id
+
+    def load_nnue(self, path):
+        """Evaluate with the neural network in a chess_engine.nnue weights file"""
+        from .nnue import Accumulator, load_network
+        self.nnue = Accumulator(load_network(path))
+        with open(path, 'rb') as weights_file:
+            self.evaluation_id = f"nnue:{zlib.crc32(weights_file.read()):08x}"
+
+    def update_attacker_order(self):
+        """Piece types cheapest first, the order static_exchange looks for recapturers in"""
+        # Equal values keep the order square_attackers finds pieces in
+        scan_order = (PieceType.KNIGHT, PieceType.PAWN, PieceType.ROOK, PieceType.QUEEN, PieceType.BISHOP,
+                      PieceType.KING)
+        self.attacker_order = tuple(sorted(scan_order, key=lambda piece_type: self.piece_values[piece_type]))
+
+    def set_hash_size(self, megabytes):
+        self.hash_size_mb = megabytes
+        self.max_table_entries = max(1, megabytes * 1024 * 1024 // TABLE_ENTRY_BYTES)
+        self.transposition_table.clear()
+
+    def clear_hash(self):
+        self.transposition_table.clear()
+
+    def search(self, game, max_depth=None, deadline=None, stop_event=None, info_callback=None,
+               multipv=1, lines_callback=None, node_limit=None, search_moves=None):
+        """Iterative deepening alpha-beta search.
+
+        Searches depth 1, 2, ... up to max_depth (or until the deadline,
+        stop_event or node_limit nodes, which is never exceeded), reporting each finished iteration to info_callback as
+        info_callback(depth, score, nodes, elapsed_seconds, pv) where pv is a
+        list of (from, to) pairs. Returns (piece, target) on the given game's
+        board, or None if there are no legal moves. The score and depth of
+        the last finished iteration are left in last_score and last_depth.
+
+        With multipv > 1 the best multipv root moves get exact scores; each
+        iteration's lines, a list of (score, pv) best first, are kept in
+        last_lines and passed to lines_callback(depth, lines).
+
+        search_moves, a list of (from, to) pairs, restricts the root to those
+        moves, so last_score is the best of them searched with a full window.
+        Such a score is not the position's value, so the root is then left
+        out of the transposition table.
+
+        With an analysis_cache attached, a single-line search returns a stored
+        result at least max_depth deep, or from a search of at least
+        node_limit nodes, without searching, and every finished search is
+        stored with the nodes it searched.
+        """
+        # Work on a detached copy of the rules state to avoid modifying the original.
+        # Root moves come from the game's cached legal move list, mapped onto the copy.
+        game_copy = game.copy()
+        root_moves = [(game_copy.board[piece.position[0]][piece.position[1]], move)
+                      for piece, move in game.legal_moves()]
+        if search_moves is not None:
+            root_moves = [(piece, move) for piece, move in root_moves if (piece.position, move) in search_moves]
+        if not root_moves:
+            return None
+
+        # A stopped iteration unwinds without unmaking its moves, so remember
+        # where each root piece started
+        origins = {id(piece): piece.position for piece, _ in root_moves}
+
+        self.nodes = 0
+        self.deadline = deadline
+        self.stop_event = stop_event
+        self.node_limit = node_limit
+        self.next_check = min(CHECK_LIMITS_INTERVAL, node_limit) if node_limit is not None else CHECK_LIMITS_INTERVAL
+        # Noise is fixed per position within a search, so transpositions agree
+        self.noise_seed = random.getrandbits(64) if self.eval_noise else 0
+        self.trace_ply = 0
+        self.start_time = time.time()
+        self.last_pv = []
+        self.last_score = 0
+        self.last_depth = 0
+        self.last_lines = []
+        for killers in self.killers:
+            killers[0] = killers[1] = 0
+        if not self.pickers:
+            self.pickers = [MovePicker(self) for _ in range(MAX_PLY + 1)]
+        if self.nnue is not None:
+            self.nnue.refresh(game_copy.board)
+
+        # Noisy results are not analysis worth keeping
+        cache_key = None
+        if self.analysis_cache is not None and multipv == 1 and search_moves is None and not self.eval_noise:
+            cache_key = self.cache_key(game_copy)
+            cached = self.cached_move(game, cache_key, max_depth, node_limit, info_callback)
+            if cached is not None:
+                return cached
+
+        trace = self.trace
+        if trace is not None:
+            trace_depth = len(trace.stack)
+            move_number = f"{game.fullmove_number}{'.' if game.turn == Color.WHITE else '...'}"
+            trace.begin(f"search {move_number}", 'search', 0, {'fen': game.to_fen()})
+
+        best_move = root_moves[0]
+        stopped = False
+        for depth in range(1, (max_depth or MAX_SEARCH_DEPTH) + 1):
+            if trace is not None:
+                trace.begin(f"depth {depth}", 'iteration', self.nodes)
+            try:
+                score, best_move, ranked = self.search_root(game_copy, root_moves, depth, multipv,
+                                                            store=search_moves is None)
+            except SearchStopped:
+                stopped = True
+                if trace is not None:
+                    trace.unwind(trace_depth + 1, self.nodes)
+                # The previous best move is searched first, so anything that
+                # beat it in the unfinished iteration is at least as good
+                if self.partial_best is not None:
+                    best_move = self.partial_best
+                break
+            if trace is not None:
+                trace.end(self.nodes, {'score': score})
+
+            # Search the previous best moves first in the next iteration
+            for _, root_move in reversed(ranked):
+                root_moves.remove(root_move)
+                root_moves.insert(0, root_move)
+
+            if search_moves is None:
+                self.last_pv = self.principal_variation(game_copy, depth)
+            else:
+                self.last_pv = self.root_line(game_copy, best_move, depth)
+            self.last_score = score
+            self.last_depth = depth
+            if info_callback:
+                info_callback(depth, score, self.nodes, time.time() - self.start_time, self.last_pv)
+            if multipv > 1:
+                self.last_lines = [(line_score, self.root_line(game_copy, root_move, depth))
+                                   for line_score, root_move in ranked]
+                if lines_callback:
+                    lines_callback(depth, self.last_lines)
+
+            # No point searching deeper once a forced mate is found
+            if abs(score) >= MATE_SCORE - MAX_SEARCH_DEPTH:
+                break
+
+        if trace is not None:
+            trace.end(self.nodes, {'depth': self.last_depth, 'score': self.last_score})
+        piece, move = best_move
+        row, col = origins[id(piece)]
+        if cache_key is not None and self.last_depth:
+            # Record the work actually done, so a search cut short by time is
+            # not taken for one that used its whole node budget
+            node_budget = self.nodes
+            if not stopped and (self.last_depth >= MAX_SEARCH_DEPTH or
+                                abs(self.last_score) >= MATE_SCORE - MAX_SEARCH_DEPTH):
+                node_budget = MAX_NODE_BUDGET
+            self.analysis_cache.put(cache_key, self.last_depth, self.last_score, (row, col), move,
+                                    node_budget=node_budget)
+        return game.board[row][col], move
+
+    def cache_key(self, game):
+        """Analysis cache key: the position key, kept apart per evaluation"""
+        evaluation_hash = zlib.crc32(self.evaluation_id.encode())
+        return game.position_key() ^ (evaluation_hash << 32 | evaluation_hash)
+
+    def cached_move(self, game, cache_key, max_depth, node_limit, info_callback):
+        """The stored (piece, target) for the game's position if it is deep enough and legal.
+
+        Node budgets rarely let a search reach max_depth, so an entry from a
+        search of at least node_limit nodes is good enough too.
+        """
+        if max_depth is None and node_limit is None:
+            return None
+        cached = self.analysis_cache.get(cache_key)
+        if cached is None:
+            return None
+        depth, score, (from_pos, to_pos, _), node_budget = cached
+        deep_enough = max_depth is not None and depth >= max_depth
+        if not deep_enough and (node_limit is None or node_budget < node_limit):
+            return None
+        piece = game.board[from_pos[0]][from_pos[1]]
+        if piece is None or piece.color != game.turn or to_pos not in game.legal_moves_for(piece):
+            return None
+        self.last_pv = [(from_pos, to_pos)]
+        self.last_score = score
+        self.last_depth = depth
+        if info_callback:
+            info_callback(depth, score, 0, time.time() - self.start_time, self.last_pv)
+        return piece, to_pos
+
+    def check_limits(self):
+        if self.node_limit is not None and self.nodes >= self.node_limit:
+            raise SearchStopped()
+        if self.stop_event is not None and self.stop_event.is_set():
+            raise SearchStopped()
+        if self.deadline is not None and time.time() >= self.deadline:
+            raise SearchStopped()
+        self.next_check = self.nodes + CHECK_LIMITS_INTERVAL
+        if self.node_limit is not None:
+            self.next_check = min(self.next_check, self.node_limit)
+
+    def search_root(self, game, root_moves, depth, multipv=1, store=True):
+        """Search every root move; returns (best score, best move, [(score, move)] for the top multipv).
+
+        store=False keeps the result out of the transposition table, for a
+        root restricted to some of its moves.
+        """
+        best_score = -INFINITY
+        best_move = root_moves[0]
+        alpha = -INFINITY
+        beta = INFINITY
+        ranked = []
+        self.partial_best = None
+        trace = self.trace
+
+        for piece, move in root_moves:
+            from_pos = piece.position
+            if trace is not None:
+                trace.begin(search_move_to_uci(piece, from_pos, move), 'root move', self.nodes)
+                self.trace_ply = trace.root_move_ply()
+            undo = self.make_move(game, piece, move)
+            score = -self.minimax(game, depth - 1, -beta, -alpha, 1)
+            self.unmake_move(game, undo)
+            if trace is not None:
+                trace.end(self.nodes, {'score': score})
+
+            if score > best_score:
+                best_score = score
+                best_move = (piece, move)
+                best_code = MOVE_CODES[from_pos[0] * BOARD_SIZE + from_pos[1]][move[0] * BOARD_SIZE + move[1]]
+                self.partial_best = best_move
+
+            if multipv > 1:
+                # Only moves beating the current multipv-th best need an exact score
+                ranked.append((score, (piece, move)))
+                ranked.sort(key=lambda line: line[0], reverse=True)
+                del ranked[multipv:]
+                if len(ranked) == multipv:
+                    alpha = ranked[-1][0]
+            else:
+                alpha = max(alpha, score)
+
+        if store:
+            self.store(game.position_key(), depth, best_score, EXACT, best_code, 0)
+        return best_score, best_move, ranked or [(best_score, best_move)]
+
+    def root_line(self, game, root_move, depth):
+        """Principal variation starting with a given root move"""
+        piece, move = root_move
+        from_pos = piece.position
+        undo = game.make_move(piece, move)
+        line = [(from_pos, move)] + self.principal_variation(game, depth - 1)
+        game.unmake_move(undo)
+        return line
+
+    def minimax(self, game, depth, alpha, beta, ply):
+        """Negamax alpha-beta; scores are from the point of view of the side to move"""
+        self.nodes += 1
+        if self.nodes >= self.next_check:
+            self.check_limits()
+
+        # Repeated positions and fifty-move draws score as draws without searching further
+        if game.halfmove_clock >= 100 or game.is_repetition():
+            return 0
+
+        # At the horizon, resolve pending captures before evaluating
+        if depth == 0:
+            if 'quiescence' in self.features:
+                return self.quiescence(game, alpha, beta, ply)
+            return self.evaluate(game)
+
+        key = game.position_key()
+        hash_move = 0
+        use_table = 'transposition' in self.features
+        entry = self.transposition_table.get(key) if use_table else None
+        if entry:
+            entry_depth, entry_score, entry_flag, hash_move = entry
+            if entry_depth >= depth:
+                entry_score = score_from_table(entry_score, ply)
+                if entry_flag == EXACT:
+                    return entry_score
+                if entry_flag == LOWER_BOUND and entry_score >= beta:
+                    return entry_score
+                if entry_flag == UPPER_BOUND and entry_score <= alpha:
+                    return entry_score
+
+        original_alpha = alpha
+        best_score = -INFINITY
+        best_move = 0
+        prune_losing = depth <= SEE_PRUNE_DEPTH and not game.is_in_check()
+        board = game.board
+        picker = self.pickers[ply]
+        picker.reset(game, hash_move, self.killers[ply], prune_losing)
+        while True:
+            code = picker.next_move()
+            if not code:
+                break
+            from_pos = SQUARE_COORDS[code & 63]
+            move = SQUARE_COORDS[code >> 6]
+            piece = board[from_pos[0]][from_pos[1]]
+            is_capture = board[move[0]][move[1]] is not None
+            traced = ply < self.trace_ply
+            if traced:
+                self.trace.begin(search_move_to_uci(piece, from_pos, move), 'move', self.nodes)
+            undo = self.make_move(game, piece, move)
+            score = -self.minimax(game, depth - 1, -beta, -alpha, ply + 1)
+            self.unmake_move(game, undo)
+            if traced:
+                self.trace.end(self.nodes, {'score': score})
+
+            if score > best_score:
+                best_score = score
+                best_move = code
+            alpha = max(alpha, score)
+            if alpha >= beta:
+                if not is_capture and 'killers' in self.features:
+                    killers = self.killers[ply]
+                    if killers[0] != code:
+                        killers[1] = killers[0]
+                        killers[0] = code
+                break
+
+        if not best_move:
+            # No legal moves: checkmate or stalemate
+            return -MATE_SCORE + ply if game.is_in_check() else 0
+
+        if best_score <= original_alpha:
+            flag = UPPER_BOUND
+        elif best_score >= beta:
+            flag = LOWER_BOUND
+        else:
+            flag = EXACT
+        if use_table:
+            self.store(key, depth, best_score, flag, best_move, ply)
+        return best_score
+
+    def make_move(self, game, piece, move):
+        """game.make_move that keeps the neural evaluation's accumulator in step"""
+        undo = game.make_move(piece, move)
+        if self.nnue is not None:
+            self.nnue.push(undo)
+        return undo
+
+    def unmake_move(self, game, undo):
+        game.unmake_move(undo)
+        if self.nnue is not None:
+            self.nnue.pop()
+
+    def quiescence(self, game, alpha, beta, ply):
+        """Search captures only until the position is quiet.
+
+        The side to move may stand pat on the static evaluation; captures
+        that lose material by static exchange are not searched.
+        """
+        self.nodes += 1
+        if self.nodes >= self.next_check:
+            self.check_limits()
+
+        stand_pat = self.evaluate(game)
+        if stand_pat >= beta:
+            return stand_pat
+        alpha = max(alpha, stand_pat)
+
+        board = game.board
+        picker = self.pickers[ply]
+        picker.reset(game, captures_only=True)
+        while True:
+            code = picker.next_move()
+            if not code:
+                break
+            from_row, from_col = SQUARE_COORDS[code & 63]
+            undo = self.make_move(game, board[from_row][from_col], SQUARE_COORDS[code >> 6])
+            score = -self.quiescence(game, -beta, -alpha, ply + 1)
+            self.unmake_move(game, undo)
+
+            if score >= beta:
+                return score
+            alpha = max(alpha, score)
+        return alpha
+
+    def static_exchange(self, board, piece, move):
+        """Material balance of the capture sequence on move's square, from the mover's side.
+
+        Both sides recapture with their least valuable attacker and may stop
+        whenever continuing would lose material. Pieces are lifted off the
+        board as they capture so sliders behind them join in; pins are
+        ignored. The board is restored before returning.
+        """
+        row, col = move
+        piece_values = self.piece_values
+        gains = self.exchange_gains
+        pieces = self.exchange_pieces
+        target = board[row][col]
+        # An empty target square is an en passant capture
+        gains[0] = piece_values[target.type if target else PieceType.PAWN]
+        pieces[0] = piece
+        count = 1
+        board[piece.position[0]][piece.position[1]] = None
+        on_square = piece
+        color = piece.color.opposite
+
+        while True:
+            attacker = least_valuable_attacker(board, row, col, color, self.attacker_order)
+            if attacker is None:
+                break
+            gains[count] = piece_values[on_square.type] - gains[count - 1]
+            board[attacker.position[0]][attacker.position[1]] = None
+            pieces[count] = attacker
+            count += 1
+            on_square = attacker
+            color = color.opposite
+
+        index = 0
+        while index < count:
+            lifted_piece = pieces[index]
+            board[lifted_piece.position[0]][lifted_piece.position[1]] = lifted_piece
+            pieces[index] = None
+            index += 1
+
+        # Each side picks the better of capturing and standing pat, from the end back
+        index = count - 1
+        while index > 0:
+            gains[index - 1] = -max(-gains[index - 1], gains[index])
+            index -= 1
+        return gains[0]
+
+    def store(self, key, depth, score, flag, best_move, ply):
+        if len(self.transposition_table) >= self.max_table_entries and key not in self.transposition_table:
+            self.transposition_table.clear()
+        self.transposition_table[key] = (depth, score_to_table(score, ply), flag, best_move)
+
+    def principal_variation(self, game, max_length):
+        """Follow best moves through the transposition table"""
+        pv = []
+        undo_stack = []
+        seen = set()
+        while len(pv) < max_length:
+            key = game.position_key()
+            entry = self.transposition_table.get(key)
+            if not entry or not entry[3] or key in seen:
+                break
+            seen.add(key)
+            from_pos = SQUARE_COORDS[entry[3] & 63]
+            move = SQUARE_COORDS[entry[3] >> 6]
+            piece = game.board[from_pos[0]][from_pos[1]]
+            if not piece or piece.color != game.turn or move not in piece.get_possible_moves(game.board, game.last_move):
+                break
+            pv.append((from_pos, move))
+            undo_stack.append(game.make_move(piece, move))
+        while undo_stack:
+            game.unmake_move(undo_stack.pop())
+        return pv
+
+    def evaluate(self, game):
+        """Static evaluation from the side to move, in tenths of a pawn"""
+        if self.nnue is not None:
+            score = self.nnue.evaluate(game.turn)
+        else:
+            score = self.evaluate_board(game)
+        if self.eval_noise:
+            score += self.evaluation_noise(game.zobrist_key)
+        return score
+
+    def evaluation_noise(self, key):
+        """Pseudo-random offset in [-eval_noise, eval_noise] for a position key"""
+        mixed = ((key ^ self.noise_seed) * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF
+        return (mixed >> 32) % (2 * self.eval_noise + 1) - self.eval_noise
+
+    def evaluate_board(self, game):
+        score = 0
+
+        # Count material
+        for row in range(BOARD_SIZE):
+            for col in range(BOARD_SIZE):
+                piece = game.board[row][col]
+                if piece:
+                    # Material value
+                    piece_value = self.piece_values[piece.type]
+
+                    # Position value (tables are seen from white's side, flipped for black)
+                    position_table = self.position_values[piece.type]
+                    position_row = row if piece.color == Color.WHITE else 7 - row
+                    position_value = position_table[position_row][col]
+
+                    # Add to score (positive for AI, negative for opponent)
+                    value = piece_value + position_value
+                    if piece.color == game.turn:
+                        score += value
+                    else:
+                        score -= value
+
+        return score
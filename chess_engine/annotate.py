@@ -0,0 +1,338 @@
+"""
+Bulk PGN annotation with engine evaluations and blunder flags.
+
+Games are streamed from a PGN file, every position is sent to a pool of
+ChessAI worker processes with a fixed depth or time budget, and annotated
+games are written back out (PGN with [%eval] comments and ?!/?/?? NAGs, or
+one JSON object per line) in input order.
+
+    python -m chess_engine.annotate games.pgn annotated.pgn --depth 3
+    python -m chess_engine.annotate games.pgn annotated.jsonl --format jsonl --movetime 0.5 --resume
+
+Only a bounded number of positions is in flight, and a bounded number of
+games waits to be written in order, so memory stays flat however large the
+archive is. Progress (games written and output byte
+offset) is checkpointed next to the output so an interrupted run can be
+resumed with --resume.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from .ai import DEFAULT_HASH_MB, MATE_SCORE, MAX_SEARCH_DEPTH, AIDifficulty, ChessAI
+from .game import GameState
+from .notation import move_to_uci, parse_uci_move, search_move_to_uci
+from .pgn import format_game, move_to_san, read_games, start_move_number
+from .pieces import PieceType
+
+DEFAULT_DEPTH = 3
+# Games read but not yet written, finished ones waiting behind a slow one included
+DEFAULT_MAX_PENDING_GAMES = 1000
+
+# Evaluation loss (centipawns, from the mover's point of view) for each flag
+CLASSIFICATIONS = (
+    (200, 'blunder', '$4'),
+    (100, 'mistake', '$2'),
+    (50, 'inaccuracy', '$6'),
+)
+
+# Worker-process search engine, created once per process by init_worker
+worker_ai = None
+
+def init_worker(hash_mb):
+    global worker_ai
+    worker_ai = ChessAI(AIDifficulty.EXPERT)
+    worker_ai.set_hash_size(hash_mb)
+
+def mover_score(score):
+    """(score_cp, mate) from the side to move for an engine score"""
+    if abs(score) >= MATE_SCORE - MAX_SEARCH_DEPTH:
+        plies = MATE_SCORE - abs(score)
+        moves = (plies + 1) // 2
+        return None, moves if score > 0 else -moves
+    # Evaluation units are tenths of a pawn
+    return int(score * 10), None
+
+def analyse_position(task):
+    """Search one position in a worker.
+
+    Returns (game_index, ply, score_cp, mate, best_uci, played_cp,
+    played_mate): the position's score and best move, and the score of the
+    move actually played searched as deep as the best one, all from the side
+    to move.
+    """
+    game_index, ply, fen, depth, movetime, played_uci = task
+    game = GameState()
+    game.load_fen(fen, update_state=False)
+    deadline = time.time() + movetime if movetime else None
+    best = worker_ai.search(game, max_depth=depth or MAX_SEARCH_DEPTH, deadline=deadline)
+    if best is None:
+        # No legal moves: checkmated (scored as mate in 0) or stalemate
+        mate = 0 if game.is_in_check() else None
+        return game_index, ply, 0, mate, None, 0, mate
+    piece, target = best
+    best_uci = search_move_to_uci(piece, piece.position, target)
+    score_cp, mate = mover_score(worker_ai.last_score)
+    played_cp, played_mate = score_cp, mate
+    if played_uci is not None and played_uci != best_uci:
+        # The same depth as the best move, so odd/even depth swings don't count as a loss
+        from_pos, to_pos, _ = parse_uci_move(played_uci)
+        worker_ai.search(game, max_depth=worker_ai.last_depth, search_moves=[(from_pos, to_pos)])
+        played_cp, played_mate = mover_score(worker_ai.last_score)
+    return game_index, ply, score_cp, mate, best_uci, played_cp, played_mate
+
+def score_for_mover(score_cp, mate):
+    """Comparable centipawn value (mates mapped far outside the normal range)"""
+    if mate is None:
+        return score_cp
+    if mate == 0:
+        return -100000
+    return 100000 - abs(mate) * 100 if mate > 0 else -100000 + abs(mate) * 100
+
+class PendingGame:
+    """A game whose positions are being analysed"""
+
+    def __init__(self, index, pgn_game, fens, san_moves, played_uci, error):
+        self.index = index
+        self.pgn_game = pgn_game
+        self.fens = fens
+        self.san_moves = san_moves
+        self.played_uci = played_uci
+        self.error = error
+        self.results = [None] * len(fens)
+        self.remaining = len(fens)
+
+    def annotated_moves(self):
+        """Per-move annotation dicts, white-relative evals and flags"""
+        annotated = []
+        scratch = GameState()
+        for ply, san in enumerate(self.san_moves):
+            before = self.results[ply]
+            after = self.results[ply + 1]
+            white_to_move = self.fens[ply].split()[1] == 'w'
+
+            best_value = score_for_mover(before[0], before[1])
+            played_value = score_for_mover(before[3], before[4])
+            loss = best_value - played_value
+
+            score_cp, mate = after[0], after[1]
+            if white_to_move:
+                # The position after white's move has black to move
+                score_cp = -score_cp if score_cp is not None else None
+                mate = -mate if mate else mate
+            if mate == 0:
+                mate = None
+                score_cp = None
+            entry = {
+                'ply': ply + 1,
+                'san': san,
+                'eval_cp': score_cp,
+                'mate': mate,
+                'best': before[2],
+                'classification': None,
+            }
+            if before[2] and before[2] != self.played_uci[ply] and loss > 0:
+                for threshold, name, nag in CLASSIFICATIONS:
+                    if loss >= threshold:
+                        entry['classification'] = name
+                        entry['nag'] = nag
+                        scratch.load_fen(self.fens[ply], update_state=False)
+                        from_pos, to_pos, promotion = parse_uci_move(before[2])
+                        piece = scratch.board[from_pos[0]][from_pos[1]]
+                        entry['best_san'] = move_to_san(scratch, piece, to_pos, promotion or PieceType.QUEEN)
+                        break
+            annotated.append(entry)
+        return annotated
+
+    def to_pgn(self):
+        tokens = []
+        for entry in self.annotated_moves():
+            token = entry['san']
+            if entry['classification']:
+                token += f" {entry['nag']}"
+            if entry['mate'] is not None:
+                comment = f"[%eval #{entry['mate']}]"
+            elif entry['eval_cp'] is not None:
+                comment = f"[%eval {entry['eval_cp'] / 100:.2f}]"
+            else:
+                comment = ''
+            if entry['classification']:
+                comment += f" {entry['classification'].capitalize()}. {entry['best_san']} was best."
+            if comment:
+                token += f" {{{comment.strip()}}}"
+            tokens.append(token)
+        if self.error:
+            tokens.append(f"{{Annotation stopped: {self.error}}}")
+        headers = dict(self.pgn_game.headers)
+        headers['Annotator'] = 'chess_engine.annotate'
+        first_move_number, black_to_move = start_move_number(self.pgn_game.start_fen)
+        return format_game(headers, tokens, self.pgn_game.result, first_move_number, black_to_move)
+
+    def to_json(self):
+        record = {
+            'index': self.index,
+            'headers': self.pgn_game.headers,
+            'result': self.pgn_game.result,
+            'moves': self.annotated_moves(),
+        }
+        if self.error:
+            record['error'] = self.error
+        return json.dumps(record) + '\n'
+
+def prepare_game(index, pgn_game, scratch):
+    """Replay a game and collect the FEN of every position (including the final one)"""
+    fens = []
+    san_moves = []
+    played_uci = []
+    error = None
+    try:
+        for game, san, piece, target, promotion in pgn_game.replay(scratch):
+            fens.append(game.to_fen())
+            san_moves.append(san)
+            played_uci.append(move_to_uci(piece.position, target, promotion))
+        fens.append(scratch.to_fen())
+    except ValueError as exc:
+        error = str(exc)
+        fens.append(scratch.to_fen())
+    return PendingGame(index, pgn_game, fens, san_moves, played_uci, error)
+
+class AnnotationPipeline:
+    def __init__(self, input_path, output_path, output_format='pgn', depth=None, movetime=None,
+                 workers=None, max_pending=None, hash_mb=DEFAULT_HASH_MB, resume=False,
+                 report_every=5.0, log=sys.stderr, max_pending_games=DEFAULT_MAX_PENDING_GAMES):
+        self.input_path = input_path
+        self.output_path = output_path
+        self.output_format = output_format
+        self.depth = depth if depth or movetime else DEFAULT_DEPTH
+        self.movetime = movetime
+        self.workers = workers or os.cpu_count()
+        # Positions in flight; enough to keep every worker busy while results drain
+        self.max_pending = max_pending or self.workers * 8
+        # Games held for in-order output; a slow game at the head holds up the rest
+        self.max_pending_games = max_pending_games
+        self.hash_mb = hash_mb
+        self.resume = resume
+        self.report_every = report_every
+        self.log = log
+        self.progress_path = output_path + '.progress'
+        self.positions_done = 0
+        self.games_written = 0
+
+    def load_checkpoint(self):
+        if not self.resume or not os.path.exists(self.progress_path):
+            return 0, 0
+        with open(self.progress_path) as progress_file:
+            checkpoint = json.load(progress_file)
+        return checkpoint['games'], checkpoint['offset']
+
+    def save_checkpoint(self, offset):
+        temporary_path = self.progress_path + '.tmp'
+        with open(temporary_path, 'w') as progress_file:
+            json.dump({'games': self.games_written, 'offset': offset}, progress_file)
+        os.replace(temporary_path, self.progress_path)
+
+    def run(self):
+        skip_games, offset = self.load_checkpoint()
+        self.games_written = skip_games
+        if skip_games:
+            # Drop anything written after the last checkpoint
+            with open(self.output_path, 'ab') as output:
+                output.truncate(offset)
+        mode = 'ab' if skip_games else 'wb'
+
+        start = time.time()
+        last_report = start
+        games = read_games(self.input_path)
+        scratch = GameState()
+        pending_games = {}
+        in_flight = {}
+        next_index = skip_games
+        read_index = 0
+        input_done = False
+        queued_positions = deque()
+
+        with open(self.output_path, mode) as output, \
+                ProcessPoolExecutor(self.workers, initializer=init_worker, initargs=(self.hash_mb,)) as pool:
+            while True:
+                # Back-pressure: only read more games while the window has room
+                while (not input_done and len(in_flight) + len(queued_positions) < self.max_pending and
+                       len(pending_games) < self.max_pending_games):
+                    pgn_game = next(games, None)
+                    if pgn_game is None:
+                        input_done = True
+                        break
+                    index = read_index
+                    read_index += 1
+                    if index < skip_games:
+                        continue
+                    pending = prepare_game(index, pgn_game, scratch)
+                    pending_games[index] = pending
+                    for ply, fen in enumerate(pending.fens):
+                        played = pending.played_uci[ply] if ply < len(pending.played_uci) else None
+                        queued_positions.append((index, ply, fen, self.depth, self.movetime, played))
+
+                while queued_positions and len(in_flight) < self.max_pending:
+                    task = queued_positions.popleft()
+                    in_flight[pool.submit(analyse_position, task)] = task
+
+                if not in_flight:
+                    break
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    del in_flight[future]
+                    game_index, ply, *result = future.result()
+                    pending = pending_games[game_index]
+                    pending.results[ply] = tuple(result)
+                    pending.remaining -= 1
+                    self.positions_done += 1
+
+                # Write finished games in input order
+                while next_index in pending_games and pending_games[next_index].remaining == 0:
+                    pending = pending_games.pop(next_index)
+                    text = pending.to_pgn() if self.output_format == 'pgn' else pending.to_json()
+                    output.write(text.encode('utf-8'))
+                    output.flush()
+                    self.games_written += 1
+                    self.save_checkpoint(output.tell())
+                    next_index += 1
+
+                now = time.time()
+                if self.log and now - last_report >= self.report_every:
+                    self.report(now - start)
+                    last_report = now
+
+        if self.log:
+            self.report(time.time() - start)
+        return self.games_written
+
+    def report(self, elapsed):
+        rate = self.positions_done / elapsed if elapsed > 0 else 0.0
+        print(f"games written: {self.games_written}  positions: {self.positions_done}  "
+              f"{rate:.1f} positions/s", file=self.log)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Annotate PGN games with engine evaluations")
+    parser.add_argument('input', help="PGN file to annotate")
+    parser.add_argument('output', help="annotated PGN or JSONL output file")
+    parser.add_argument('--format', choices=('pgn', 'jsonl'), default=None,
+                        help="output format (default: from the output file extension)")
+    parser.add_argument('--depth', type=int, default=None, help=f"search depth per position (default {DEFAULT_DEPTH})")
+    parser.add_argument('--movetime', type=float, default=None, help="seconds per position")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument('--hash', type=int, default=DEFAULT_HASH_MB, help="transposition table MB per worker")
+    parser.add_argument('--resume', action='store_true', help="continue an interrupted run")
+    args = parser.parse_args(argv)
+
+    output_format = args.format or ('jsonl' if args.output.endswith(('.jsonl', '.json')) else 'pgn')
+    pipeline = AnnotationPipeline(args.input, args.output, output_format, args.depth, args.movetime,
+                                  args.workers, hash_mb=args.hash, resume=args.resume)
+    pipeline.run()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""
+Persistent analysis cache shared across games and sessions.
+
+A fixed-size hash table in a memory-mapped file maps position keys to the
+depth, score, best move and node count of a finished search. ChessAI consults it before
+searching a root position and records the result afterwards, so positions
+seen in earlier games (the opening especially) are answered without a
+search.
+
+The file never grows: each key hashes to a bucket of BUCKET_SLOTS slots, and
+a new entry in a full bucket replaces the entry from the oldest session (the
+generation counter in the header goes up each time the cache is opened),
+the shallowest one among equally old entries. Entries read or written in the
+current session are brought up to date, so positions that keep coming up
+survive while ones nobody reaches any more age out.
+
+An existing file keeps the size it was created with. One process should
+write a cache file at a time.
+"""
+
+import mmap
+import os
+import struct
+
+from .notation import decode_move, encode_move
+
+CACHE_MAGIC = b'CHAC'
+CACHE_VERSION = 3
+# Magic, version, slots per bucket, slot count, current generation
+CACHE_HEADER = struct.Struct('<4sHHII')
+CACHE_HEADER_BYTES = 32
+# Key, score, encoded move, generation, depth, nodes searched (generation 0
+# marks an empty slot)
+CACHE_SLOT = struct.Struct('<QiHHBxI')
+# Node count recorded for a search nothing cut short, which any budget accepts
+MAX_NODE_BUDGET = 0xFFFFFFFF
+BUCKET_SLOTS = 4
+DEFAULT_CACHE_MB = 8
+MAX_GENERATION = 0xFFFF
+
+class AnalysisCache:
+    """Memory-mapped table of (position key -> depth, score, best move)"""
+
+    def __init__(self, path, size_mb=DEFAULT_CACHE_MB):
+        self.path = path
+        self.file = None
+        self.map = None
+        slots = max(BUCKET_SLOTS, size_mb * 1024 * 1024 // CACHE_SLOT.size // BUCKET_SLOTS * BUCKET_SLOTS)
+        size = CACHE_HEADER_BYTES + slots * CACHE_SLOT.size
+
+        if os.path.exists(path) and not self.open_existing():
+            os.remove(path)
+        if self.map is None:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self.file = open(path, 'w+b')
+            self.file.truncate(size)
+            self.map = mmap.mmap(self.file.fileno(), size)
+            self.slots = slots
+            self.generation = 0
+        self.buckets = self.slots // BUCKET_SLOTS
+        self.hits = 0
+        self.misses = 0
+
+        # Each session is one generation older than the next
+        self.generation = self.generation % MAX_GENERATION + 1
+        CACHE_HEADER.pack_into(self.map, 0, CACHE_MAGIC, CACHE_VERSION, BUCKET_SLOTS, self.slots, self.generation)
+
+    def open_existing(self):
+        """Map an existing cache file; False if it is not a usable cache"""
+        self.file = open(self.path, 'r+b')
+        size = os.fstat(self.file.fileno()).st_size
+        if size >= CACHE_HEADER_BYTES:
+            self.map = mmap.mmap(self.file.fileno(), size)
+            magic, version, bucket_slots, slots, generation = CACHE_HEADER.unpack_from(self.map, 0)
+            if (magic == CACHE_MAGIC and version == CACHE_VERSION and bucket_slots == BUCKET_SLOTS and
+                    slots % BUCKET_SLOTS == 0 and size == CACHE_HEADER_BYTES + slots * CACHE_SLOT.size):
+                self.slots = slots
+                self.generation = generation
+                return True
+            self.map.close()
+            self.map = None
+        self.file.close()
+        self.file = None
+        return False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if self.map is not None:
+            self.map.flush()
+            self.map.close()
+            self.map = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def bucket_offset(self, key):
+        return CACHE_HEADER_BYTES + (key % self.buckets) * BUCKET_SLOTS * CACHE_SLOT.size
+
+    def get(self, key):
+        """(depth, score, (from, to, promotion), nodes searched) stored for key, or None"""
+        offset = self.bucket_offset(key)
+        for slot in range(BUCKET_SLOTS):
+            slot_offset = offset + slot * CACHE_SLOT.size
+            slot_key, score, move, generation, depth, node_budget = CACHE_SLOT.unpack_from(self.map, slot_offset)
+            if generation and slot_key == key:
+                if generation != self.generation:
+                    self.touch(slot_offset)
+                self.hits += 1
+                return depth, score, decode_move(move), node_budget
+        self.misses += 1
+        return None
+
+    def put(self, key, depth, score, from_pos, to_pos, promotion=None, node_budget=MAX_NODE_BUDGET):
+        """Record a search result, keeping a deeper result already stored for the key"""
+        offset = self.bucket_offset(key)
+        victim_offset = None
+        victim_rank = None
+        for slot in range(BUCKET_SLOTS):
+            slot_offset = offset + slot * CACHE_SLOT.size
+            slot_key, _, _, generation, slot_depth, _ = CACHE_SLOT.unpack_from(self.map, slot_offset)
+            if generation and slot_key == key:
+                if slot_depth > depth:
+                    if generation != self.generation:
+                        self.touch(slot_offset)
+                    return
+                victim_offset = slot_offset
+                break
+            if not generation:
+                rank = (MAX_GENERATION, 0)
+            else:
+                # Oldest generation first (wrapping around), then shallowest
+                rank = ((self.generation - generation) % MAX_GENERATION, -slot_depth)
+            if victim_rank is None or rank > victim_rank:
+                victim_offset, victim_rank = slot_offset, rank
+        CACHE_SLOT.pack_into(self.map, victim_offset, key, int(score), encode_move(from_pos, to_pos, promotion),
+                             self.generation, min(depth, 255), min(node_budget, MAX_NODE_BUDGET))
+
+    def touch(self, slot_offset):
+        """Move an entry into the current generation"""
+        slot_key, score, move, _, depth, node_budget = CACHE_SLOT.unpack_from(self.map, slot_offset)
+        CACHE_SLOT.pack_into(self.map, slot_offset, slot_key, score, move, self.generation, depth, node_budget)
+
+    def clear(self):
+        self.map[CACHE_HEADER_BYTES:] = bytes(self.slots * CACHE_SLOT.size)
+
+    def entries(self):
+        """Number of occupied slots"""
+        count = 0
+        for slot in range(self.slots):
+            if CACHE_SLOT.unpack_from(self.map, CACHE_HEADER_BYTES + slot * CACHE_SLOT.size)[3]:
+                count += 1
+        return count
@@ -0,0 +1,698 @@
+"""
+Rules-level game state shared by the GUI, tools and servers
+"""
+
+import random
+import struct
+from copy import deepcopy
+from enum import Enum
+
+from .ai import AIDifficulty, ChessAI
+from .notation import decode_move, encode_move, parse_square, square_name
+from .pieces import BOARD_SIZE, Color, Piece, PieceType
+
+STARTING_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+# FEN letter <-> (color, piece type); uppercase is white
+FEN_PIECES = {piece_type.value.upper(): (Color.WHITE, piece_type) for piece_type in PieceType}
+FEN_PIECES.update({piece_type.value: (Color.BLACK, piece_type) for piece_type in PieceType})
+FEN_LETTERS = {piece: letter for letter, piece in FEN_PIECES.items()}
+FEN_EMPTY_RUNS = {str(count): count for count in range(1, BOARD_SIZE + 1)}
+
+# Zobrist keys: one random 64-bit number per (color, piece type, square) plus
+# side to move, castling rights and en passant file. Seeded so keys are stable
+# across processes (analysis workers must agree on them).
+_zobrist_random = random.Random(20240611)
+ZOBRIST_PIECES = {
+    (color, piece_type): [[_zobrist_random.getrandbits(64) for _ in range(BOARD_SIZE)]
+                          for _ in range(BOARD_SIZE)]
+    for color in Color for piece_type in PieceType
+}
+ZOBRIST_BLACK_TO_MOVE = _zobrist_random.getrandbits(64)
+ZOBRIST_CASTLING = {letter: _zobrist_random.getrandbits(64) for letter in 'KQkq'}
+ZOBRIST_EN_PASSANT = [_zobrist_random.getrandbits(64) for _ in range(BOARD_SIZE)]
+
+# Binary position: a 32-byte board with one nibble per square (a8 first, high
+# nibble first; 0 empty, 1-6 white, 9-14 black), a flags byte (bit 0 black to
+# move, bits 1-4 castling KQkq), en passant file + 1 (0 for none) and the
+# halfmove and fullmove clocks as little-endian uint16. A game adds a uint16
+# move count and one 16-bit move (notation.encode_move) per ply.
+BINARY_POSITION = struct.Struct('<32sBBHH')
+BINARY_MOVE_COUNT = struct.Struct('<H')
+BINARY_PIECE_TYPES = [PieceType.PAWN, PieceType.KNIGHT, PieceType.BISHOP,
+                      PieceType.ROOK, PieceType.QUEEN, PieceType.KING]
+BINARY_CODES = {(color, piece_type): (8 if color == Color.BLACK else 0) + index + 1
+                for color in Color for index, piece_type in enumerate(BINARY_PIECE_TYPES)}
+BINARY_FEN_LETTERS = {code: FEN_LETTERS[piece] for piece, code in BINARY_CODES.items()}
+FEN_BINARY_CODES = {letter: BINARY_CODES[piece] for letter, piece in FEN_PIECES.items()}
+BINARY_CASTLING = 'KQkq'
+
+def pack_position(codes, black_to_move, castling, en_passant_file, halfmove_clock, fullmove_number):
+    flags = int(black_to_move)
+    for bit, letter in enumerate(BINARY_CASTLING):
+        if letter in castling:
+            flags |= 2 << bit
+    board_bytes = bytes(codes[index] << 4 | codes[index + 1] for index in range(0, BOARD_SIZE * BOARD_SIZE, 2))
+    en_passant = en_passant_file + 1 if en_passant_file is not None else 0
+    return BINARY_POSITION.pack(board_bytes, flags, en_passant, min(halfmove_clock, 0xFFFF),
+                                min(fullmove_number, 0xFFFF))
+
+def pack_fen(fen):
+    """Binary form (BINARY_POSITION) of a FEN position"""
+    fields = fen.split()
+    if len(fields) < 4:
+        fields += ['-'] * (4 - len(fields))
+    codes = []
+    for char in fields[0]:
+        if char in FEN_EMPTY_RUNS:
+            codes.extend([0] * FEN_EMPTY_RUNS[char])
+        elif char in FEN_BINARY_CODES:
+            codes.append(FEN_BINARY_CODES[char])
+        elif char != '/':
+            raise ValueError(f"Invalid FEN: {fen!r}")
+    if len(codes) != BOARD_SIZE * BOARD_SIZE:
+        raise ValueError(f"Invalid FEN: {fen!r}")
+    en_passant_file = parse_square(fields[3])[1] if fields[3] != '-' else None
+    try:
+        halfmove_clock = int(fields[4]) if len(fields) > 4 else 0
+        fullmove_number = int(fields[5]) if len(fields) > 5 else 1
+    except ValueError:
+        raise ValueError(f"Invalid move counters in FEN: {fen!r}") from None
+    return pack_position(codes, fields[1] == 'b', fields[2], en_passant_file, halfmove_clock, fullmove_number)
+
+def unpack_fen(data):
+    """FEN for a binary position (the first BINARY_POSITION.size bytes of data)"""
+    try:
+        board_bytes, flags, en_passant, halfmove_clock, fullmove_number = BINARY_POSITION.unpack_from(data)
+    except struct.error:
+        raise ValueError("Truncated binary position") from None
+    ranks = []
+    for row in range(BOARD_SIZE):
+        rank = ''
+        empty = 0
+        for byte in board_bytes[row * 4:row * 4 + 4]:
+            for code in (byte >> 4, byte & 15):
+                if not code:
+                    empty += 1
+                    continue
+                if code not in BINARY_FEN_LETTERS:
+                    raise ValueError(f"Invalid piece code {code} in binary position")
+                if empty:
+                    rank += str(empty)
+                    empty = 0
+                rank += BINARY_FEN_LETTERS[code]
+        if empty:
+            rank += str(empty)
+        ranks.append(rank)
+    black_to_move = flags & 1
+    castling = ''.join(letter for bit, letter in enumerate(BINARY_CASTLING) if flags & 2 << bit) or '-'
+    if en_passant:
+        en_passant_text = square_name((2 if not black_to_move else 5, en_passant - 1))
+    else:
+        en_passant_text = '-'
+    return (f"{'/'.join(ranks)} {'b' if black_to_move else 'w'} {castling} {en_passant_text} "
+            f"{halfmove_clock} {fullmove_number}")
+
+BINARY_STARTING_POSITION = pack_fen(STARTING_FEN)
+
+class GameMode(Enum):
+    PLAYER_VS_PLAYER = 0
+    PLAYER_VS_AI = 1
+
+class GameState:
+    def __init__(self, mode=GameMode.PLAYER_VS_PLAYER, ai_difficulty=AIDifficulty.MEDIUM):
+        self.board = [[None for _ in range(BOARD_SIZE)] for _ in range(BOARD_SIZE)]
+        self.turn = Color.WHITE
+        self.game_over = False
+        self.winner = None
+        self.mode = mode
+        self.ai = ChessAI(ai_difficulty)
+        self.ai_thinking = False
+        self.move_history = []
+        self.last_move = None
+        # last_move dicts reused by make_move, one per position_keys length
+        self.last_move_records = []
+        self.halfmove_clock = 0
+        self.fullmove_number = 1
+        self.start_fen = STARTING_FEN
+        self.in_check = False
+        self.checkmate = False
+        self.stalemate = False
+        self.draw_reason = None
+        self.setup_board()
+
+    def copy(self):
+        """Return a detached copy of the rules state (no UI attributes)"""
+        game_copy = GameState.__new__(GameState)
+        game_copy.board, game_copy.last_move, game_copy.move_history = deepcopy(
+            (self.board, self.last_move, self.move_history))
+        game_copy.turn = self.turn
+        game_copy.halfmove_clock = self.halfmove_clock
+        game_copy.fullmove_number = self.fullmove_number
+        game_copy.start_fen = self.start_fen
+        game_copy.game_over = self.game_over
+        game_copy.winner = self.winner
+        game_copy.mode = self.mode
+        game_copy.ai = self.ai
+        game_copy.ai_thinking = False
+        game_copy.in_check = self.in_check
+        game_copy.checkmate = self.checkmate
+        game_copy.stalemate = self.stalemate
+        game_copy.draw_reason = self.draw_reason
+        game_copy.zobrist_key = self.zobrist_key
+        game_copy.position_keys = list(self.position_keys)
+        game_copy.last_move_records = []
+        game_copy.legal_moves_cache = None
+        game_copy.legal_moves_key = None
+        return game_copy
+
+    def set_game_mode(self, mode):
+        self.mode = mode
+        self.new_game()
+
+    def set_ai_difficulty(self, difficulty):
+        self.ai.set_difficulty(difficulty)
+        if self.mode == GameMode.PLAYER_VS_AI:
+            self.new_game()
+
+    def new_game(self):
+        self.board = [[None for _ in range(BOARD_SIZE)] for _ in range(BOARD_SIZE)]
+        self.turn = Color.WHITE
+        self.game_over = False
+        self.winner = None
+        self.move_history = []
+        self.last_move = None
+        self.halfmove_clock = 0
+        self.fullmove_number = 1
+        self.start_fen = STARTING_FEN
+        self.in_check = False
+        self.checkmate = False
+        self.stalemate = False
+        self.draw_reason = None
+        self.setup_board()
+
+    def setup_board(self):
+        # Set up pawns
+        for col in range(BOARD_SIZE):
+            self.board[1][col] = Piece(PieceType.PAWN, Color.BLACK, (1, col))
+            self.board[6][col] = Piece(PieceType.PAWN, Color.WHITE, (6, col))
+
+        # Set up other pieces
+        back_row = [
+            PieceType.ROOK, PieceType.KNIGHT, PieceType.BISHOP, PieceType.QUEEN,
+            PieceType.KING, PieceType.BISHOP, PieceType.KNIGHT, PieceType.ROOK
+        ]
+
+        for col, piece_type in enumerate(back_row):
+            self.board[0][col] = Piece(piece_type, Color.BLACK, (0, col))
+            self.board[7][col] = Piece(piece_type, Color.WHITE, (7, col))
+
+        self.reset_position_keys()
+
+    def load_fen(self, fen, update_state=True):
+        """Set up an arbitrary position from a FEN string.
+
+        Castling rights become the has_moved flags of the kings and rooks and
+        the en passant square becomes the matching last_move. Bulk jobs can
+        reuse one GameState for many positions and pass update_state=False to
+        skip the legal-move scan behind the check/checkmate/stalemate flags.
+        A malformed FEN, or one without exactly one king per side, raises
+        ValueError and leaves the game as it was.
+        """
+        fields = fen.split()
+        if len(fields) < 4:
+            fields += ['-'] * (4 - len(fields))
+        placement, active_color, castling, en_passant = fields[:4]
+
+        ranks = placement.split('/')
+        if len(ranks) != BOARD_SIZE or active_color not in ('w', 'b'):
+            raise ValueError(f"Invalid FEN: {fen!r}")
+
+        board = [[None] * BOARD_SIZE for _ in range(BOARD_SIZE)]
+        kings = {Color.WHITE: 0, Color.BLACK: 0}
+        for row, rank in enumerate(ranks):
+            board_row = board[row]
+            col = 0
+            for char in rank:
+                if char in FEN_EMPTY_RUNS:
+                    col += FEN_EMPTY_RUNS[char]
+                    continue
+                if char not in FEN_PIECES or col >= BOARD_SIZE:
+                    raise ValueError(f"Invalid FEN: {fen!r}")
+                color, piece_type = FEN_PIECES[char]
+                piece = Piece(piece_type, color, (row, col))
+                # Kings and rooks keep castling rights only if the FEN says so
+                if piece_type == PieceType.KING or piece_type == PieceType.ROOK:
+                    piece.has_moved = True
+                if piece_type == PieceType.KING:
+                    kings[color] += 1
+                board_row[col] = piece
+                col += 1
+            if col != BOARD_SIZE:
+                raise ValueError(f"Invalid FEN: {fen!r}")
+        if kings[Color.WHITE] != 1 or kings[Color.BLACK] != 1:
+            raise ValueError(f"FEN needs exactly one king per side: {fen!r}")
+
+        if castling != '-':
+            for letter in castling:
+                if letter not in 'KQkq':
+                    raise ValueError(f"Invalid castling rights in FEN: {fen!r}")
+                home_row = 7 if letter.isupper() else 0
+                rook_col = 7 if letter in 'Kk' else 0
+                king = board[home_row][4]
+                rook = board[home_row][rook_col]
+                if king and king.type == PieceType.KING and rook and rook.type == PieceType.ROOK:
+                    king.has_moved = False
+                    rook.has_moved = False
+
+        turn = Color.WHITE if active_color == 'w' else Color.BLACK
+
+        # Rebuild the double pawn push that made en passant possible
+        last_move = None
+        if en_passant != '-':
+            target_row, target_col = parse_square(en_passant)
+            direction = 1 if turn == Color.WHITE else -1
+            if 0 <= target_row + direction < BOARD_SIZE:
+                pawn = board[target_row + direction][target_col]
+                if pawn and pawn.type == PieceType.PAWN:
+                    last_move = {
+                        'piece': pawn,
+                        'from': (target_row - direction, target_col),
+                        'to': pawn.position,
+                        'captured': None,
+                        'promotion': None
+                    }
+
+        try:
+            halfmove_clock = int(fields[4]) if len(fields) > 4 else 0
+            fullmove_number = int(fields[5]) if len(fields) > 5 else 1
+        except ValueError:
+            raise ValueError(f"Invalid move counters in FEN: {fen!r}") from None
+
+        self.board = board
+        self.turn = turn
+        self.last_move = last_move
+        self.halfmove_clock = halfmove_clock
+        self.fullmove_number = fullmove_number
+
+        # Remember where move_history starts, for PGN export
+        self.start_fen = f"{' '.join(fields[:4])} {self.halfmove_clock} {self.fullmove_number}"
+        self.move_history = []
+        self.game_over = False
+        self.winner = None
+        self.in_check = False
+        self.checkmate = False
+        self.stalemate = False
+        self.draw_reason = None
+        self.reset_position_keys()
+        if update_state:
+            self.check_game_state()
+
+    def to_fen(self):
+        """Serialize the position as FEN"""
+        ranks = []
+        for board_row in self.board:
+            rank = ''
+            empty = 0
+            for piece in board_row:
+                if piece is None:
+                    empty += 1
+                    continue
+                if empty:
+                    rank += str(empty)
+                    empty = 0
+                rank += FEN_LETTERS[(piece.color, piece.type)]
+            if empty:
+                rank += str(empty)
+            ranks.append(rank)
+        en_passant = self.en_passant_square()
+        return (f"{'/'.join(ranks)} {self.turn.value} {self.castling_rights() or '-'} "
+                f"{square_name(en_passant) if en_passant else '-'} "
+                f"{self.halfmove_clock} {self.fullmove_number}")
+
+    def position_bytes(self):
+        """Current position in the compact binary format (no move history)"""
+        codes = [BINARY_CODES[(piece.color, piece.type)] if piece else 0
+                 for board_row in self.board for piece in board_row]
+        en_passant = self.en_passant_square()
+        return pack_position(codes, self.turn == Color.BLACK, self.castling_rights(),
+                             en_passant[1] if en_passant else None, self.halfmove_clock, self.fullmove_number)
+
+    def to_bytes(self):
+        """Start position plus every move played, in the compact binary format"""
+        start = BINARY_STARTING_POSITION if self.start_fen == STARTING_FEN else pack_fen(self.start_fen)
+        moves = [encode_move(record['from'], record['to'], record['promotion']) for record in self.move_history]
+        return start + BINARY_MOVE_COUNT.pack(len(moves)) + struct.pack(f'<{len(moves)}H', *moves)
+
+    def load_bytes(self, data, update_state=True):
+        """Load a game written by to_bytes (or a bare position from position_bytes)"""
+        self.load_fen(unpack_fen(data), update_state=False)
+        offset = BINARY_POSITION.size
+        if len(data) > offset:
+            try:
+                count, = BINARY_MOVE_COUNT.unpack_from(data, offset)
+                moves = struct.unpack_from(f'<{count}H', data, offset + BINARY_MOVE_COUNT.size)
+            except struct.error:
+                raise ValueError("Truncated binary move list") from None
+            for value in moves:
+                from_pos, to_pos, promotion = decode_move(value)
+                piece = self.board[from_pos[0]][from_pos[1]]
+                if piece is None or piece.color != self.turn:
+                    raise ValueError(f"Invalid move {value:#06x} in binary game")
+                self.move_piece(piece, to_pos, promotion or PieceType.QUEEN, update_state=False)
+        if update_state:
+            self.check_game_state()
+
+    @classmethod
+    def from_bytes(cls, data):
+        game = cls()
+        game.load_bytes(data)
+        return game
+
+    def castling_rights(self):
+        """Castling rights in FEN order, e.g. 'KQkq' ('' if none)"""
+        rights = ''
+        for color, home_row, letters in ((Color.WHITE, 7, 'KQ'), (Color.BLACK, 0, 'kq')):
+            king = self.board[home_row][4]
+            if not king or king.type != PieceType.KING or king.color != color or king.has_moved:
+                continue
+            for rook_col, letter in ((7, letters[0]), (0, letters[1])):
+                rook = self.board[home_row][rook_col]
+                if rook and rook.type == PieceType.ROOK and rook.color == color and not rook.has_moved:
+                    rights += letter
+        return rights
+
+    def en_passant_square(self):
+        """Square skipped by the last double pawn push, or None"""
+        if self.last_move and self.last_move['piece'].type == PieceType.PAWN:
+            from_row, from_col = self.last_move['from']
+            to_row, _ = self.last_move['to']
+            if abs(from_row - to_row) == 2:
+                return (from_row + to_row) // 2, from_col
+        return None
+
+    def en_passant_capture_possible(self):
+        """Whether the side to move has a legal en passant capture"""
+        target = self.en_passant_square()
+        if target is None:
+            return False
+        pawn_row = self.last_move['to'][0]
+        for col in (target[1] - 1, target[1] + 1):
+            if 0 <= col < BOARD_SIZE:
+                piece = self.board[pawn_row][col]
+                if (piece and piece.type == PieceType.PAWN and piece.color == self.turn and
+                        not piece.move_would_cause_check(self.board, target)):
+                    return True
+        return False
+
+    def position_key(self):
+        """Zobrist hash of the current position, kept up to date by make_move"""
+        return self.zobrist_key
+
+    def reset_position_keys(self):
+        """Start a new repetition history at the current position"""
+        self.zobrist_key = self.compute_position_key()
+        self.position_keys = [self.zobrist_key]
+        # New Piece objects: anything cached for the old board is stale
+        self.legal_moves_cache = None
+        self.legal_moves_key = None
+
+    def compute_position_key(self):
+        """Zobrist hash of the position (pieces, side to move, castling, en passant) from scratch"""
+        key = 0
+        for row in range(BOARD_SIZE):
+            for col in range(BOARD_SIZE):
+                piece = self.board[row][col]
+                if piece:
+                    key ^= ZOBRIST_PIECES[(piece.color, piece.type)][row][col]
+        if self.turn == Color.BLACK:
+            key ^= ZOBRIST_BLACK_TO_MOVE
+        for letter in self.castling_rights():
+            key ^= ZOBRIST_CASTLING[letter]
+        en_passant = self.en_passant_square()
+        if en_passant:
+            key ^= ZOBRIST_EN_PASSANT[en_passant[1]]
+        return key
+
+    def is_repetition(self):
+        """Whether the current position already occurred since the last pawn move or capture"""
+        keys = self.position_keys
+        key = keys[-1]
+        # The same side must be to move, so only every other earlier position can match
+        for back in range(4, min(self.halfmove_clock, len(keys) - 1) + 1, 2):
+            if keys[-1 - back] == key:
+                return True
+        return False
+
+    def is_threefold_repetition(self):
+        keys = self.position_keys
+        key = keys[-1]
+        occurrences = 1
+        for back in range(4, min(self.halfmove_clock, len(keys) - 1) + 1, 2):
+            if keys[-1 - back] == key:
+                occurrences += 1
+                if occurrences >= 3:
+                    return True
+        return False
+
+    def is_fifty_move_draw(self):
+        return self.halfmove_clock >= 100
+
+    def find_king(self, color):
+        for row in range(BOARD_SIZE):
+            for col in range(BOARD_SIZE):
+                piece = self.board[row][col]
+                if piece and piece.type == PieceType.KING and piece.color == color:
+                    return piece
+        return None
+
+    def is_in_check(self):
+        """Whether the side to move is in check"""
+        king = self.find_king(self.turn)
+        return king is not None and king.is_in_check(self.board)
+
+    def legal_moves(self):
+        """All legal (piece, target) pairs for the side to move.
+
+        Computed once per position and cached by position key, so the game
+        state check, the GUI and the AI root share one generation. Treat the
+        returned list as read-only.
+        """
+        if self.legal_moves_key != self.zobrist_key:
+            self.legal_moves_cache = self.generate_legal_moves()
+            self.legal_moves_key = self.zobrist_key
+        return self.legal_moves_cache
+
+    def legal_moves_for(self, piece):
+        """Legal targets for one piece, served from the legal move cache"""
+        return [move for moving_piece, move in self.legal_moves() if moving_piece is piece]
+
+    def generate_legal_moves(self):
+        """All legal (piece, target) pairs for the side to move, without caching"""
+        all_moves = []
+        for row in range(BOARD_SIZE):
+            for col in range(BOARD_SIZE):
+                piece = self.board[row][col]
+                if piece and piece.color == self.turn:
+                    for move in piece.get_possible_moves(self.board, self.last_move):
+                        all_moves.append((piece, move))
+        return all_moves
+
+    def make_move(self, piece, new_pos, promotion=PieceType.QUEEN):
+        """Play a move on the board and return what unmake_move needs to take it back.
+
+        Handles en passant, castling and promotion but does not touch
+        move_history or the check/checkmate flags, so the search can use it.
+        """
+        old_pos = piece.position
+        old_row, old_col = old_pos
+        new_row, new_col = new_pos
+        old_key = self.zobrist_key
+        old_en_passant = self.en_passant_square()
+
+        captured = self.board[new_row][new_col]
+        captured_pos = new_pos
+
+        # Castling rights only change when an unmoved king or rook moves or an unmoved rook is taken
+        old_castling = None
+        if (not piece.has_moved and (piece.type == PieceType.KING or piece.type == PieceType.ROOK)) or \
+           (captured and captured.type == PieceType.ROOK and not captured.has_moved):
+            old_castling = self.castling_rights()
+
+        # Handle en passant capture
+        if piece.type == PieceType.PAWN and old_col != new_col and not captured:
+            captured = self.board[old_row][new_col]
+            captured_pos = (old_row, new_col)
+            self.board[old_row][new_col] = None
+
+        # Move the rook when castling
+        rook_move = None
+        if piece.type == PieceType.KING and abs(old_col - new_col) > 1:
+            rook_from_col, rook_to_col = (7, 5) if new_col > old_col else (0, 3)
+            rook = self.board[old_row][rook_from_col]
+            rook_move = (rook, rook_from_col, rook_to_col, rook.has_moved)
+            self.board[old_row][rook_to_col] = rook
+            self.board[old_row][rook_from_col] = None
+            rook.position = (old_row, rook_to_col)
+            rook.has_moved = True
+
+        undo = (piece, old_pos, piece.type, piece.has_moved,
+                captured, captured_pos, rook_move, self.last_move,
+                self.halfmove_clock, self.fullmove_number, old_key)
+
+        # Fifty-move counter resets on pawn moves and captures
+        if piece.type == PieceType.PAWN or captured:
+            self.halfmove_clock = 0
+        else:
+            self.halfmove_clock += 1
+        if self.turn == Color.BLACK:
+            self.fullmove_number += 1
+
+        # Pawn promotion
+        promoted_to = None
+        if piece.type == PieceType.PAWN and (new_row == 0 or new_row == BOARD_SIZE - 1):
+            promoted_to = promotion
+            piece.type = promotion
+            piece.image_key = f"{piece.color.value}{promotion.value}"
+
+        # Move the piece
+        self.board[new_row][new_col] = piece
+        self.board[old_row][old_col] = None
+        piece.position = new_pos
+        piece.has_moved = True
+
+        # Fill this ply's reusable record rather than allocating a dict per move;
+        # move_piece keeps a copy of it in move_history
+        records = self.last_move_records
+        ply = len(self.position_keys)
+        while len(records) <= ply:
+            records.append({})
+        record = records[ply]
+        record['piece'] = piece
+        record['from'] = old_pos
+        record['to'] = new_pos
+        record['captured'] = captured
+        record['promotion'] = promoted_to
+        self.last_move = record
+
+        # Switch turns
+        self.turn = self.turn.opposite
+
+        # Update the Zobrist key incrementally and push it on the repetition history
+        key = old_key ^ ZOBRIST_BLACK_TO_MOVE
+        key ^= ZOBRIST_PIECES[(piece.color, undo[2])][old_row][old_col]
+        key ^= ZOBRIST_PIECES[(piece.color, piece.type)][new_row][new_col]
+        if captured:
+            key ^= ZOBRIST_PIECES[(captured.color, captured.type)][captured_pos[0]][captured_pos[1]]
+        if rook_move:
+            rook_keys = ZOBRIST_PIECES[(piece.color, PieceType.ROOK)][old_row]
+            key ^= rook_keys[rook_move[1]] ^ rook_keys[rook_move[2]]
+        new_castling = self.castling_rights() if old_castling is not None else None
+        if new_castling != old_castling:
+            for letter in old_castling:
+                key ^= ZOBRIST_CASTLING[letter]
+            for letter in new_castling:
+                key ^= ZOBRIST_CASTLING[letter]
+        if old_en_passant:
+            key ^= ZOBRIST_EN_PASSANT[old_en_passant[1]]
+        new_en_passant = self.en_passant_square()
+        if new_en_passant:
+            key ^= ZOBRIST_EN_PASSANT[new_en_passant[1]]
+        self.zobrist_key = key
+        self.position_keys.append(key)
+        return undo
+
+    def unmake_move(self, undo):
+        """Take back a move played with make_move"""
+        (piece, old_pos, old_type, old_has_moved, captured, captured_pos, rook_move, last_move,
+         self.halfmove_clock, self.fullmove_number, self.zobrist_key) = undo
+        self.position_keys.pop()
+        new_row, new_col = piece.position
+        old_row, old_col = old_pos
+
+        self.board[new_row][new_col] = None
+        self.board[old_row][old_col] = piece
+        piece.position = old_pos
+        piece.has_moved = old_has_moved
+        if piece.type != old_type:
+            piece.type = old_type
+            piece.image_key = f"{piece.color.value}{old_type.value}"
+
+        if captured:
+            self.board[captured_pos[0]][captured_pos[1]] = captured
+
+        if rook_move:
+            rook, rook_from_col, rook_to_col, rook_has_moved = rook_move
+            self.board[old_row][rook_from_col] = rook
+            self.board[old_row][rook_to_col] = None
+            rook.position = (old_row, rook_from_col)
+            rook.has_moved = rook_has_moved
+
+        self.last_move = last_move
+        self.turn = self.turn.opposite
+
+    def move_piece(self, piece, new_pos, promotion=PieceType.QUEEN, update_state=True):
+        self.make_move(piece, new_pos, promotion)
+
+        # Record the move (make_move's record is reused by later moves)
+        self.last_move = dict(self.last_move)
+        self.move_history.append(self.last_move)
+
+        # Check for check, checkmate, or stalemate (bulk replays can skip this)
+        if update_state:
+            self.check_game_state()
+
+    def make_ai_move(self):
+        # Get the AI's move
+        ai_move = self.ai.get_move(self)
+
+        if ai_move:
+            piece, move = ai_move
+            self.move_piece(piece, move)
+        else:
+            # If AI can't move, it's either checkmate or stalemate
+            self.game_over = True
+
+        self.ai_thinking = False
+
+    def is_game_over(self):
+        return self.game_over
+
+    def check_game_state(self):
+        """Check if the current player is in check, checkmate, or stalemate"""
+        # Find the king
+        king = None
+        for row in range(BOARD_SIZE):
+            for col in range(BOARD_SIZE):
+                piece = self.board[row][col]
+                if piece and piece.type == PieceType.KING and piece.color == self.turn:
+                    king = piece
+                    break
+            if king:
+                break
+
+        # Check if the king is in check
+        self.in_check = king.is_in_check(self.board)
+
+        # Check if the player has any legal moves (the list is cached for the GUI and AI)
+        has_legal_moves = bool(self.legal_moves())
+
+        # If no legal moves, it's either checkmate or stalemate
+        if not has_legal_moves:
+            self.game_over = True
+            if self.in_check:
+                self.checkmate = True
+                self.winner = self.turn.opposite
+            else:
+                self.stalemate = True
+                self.winner = None
+            return
+
+        # Draws by rule
+        if self.is_threefold_repetition():
+            self.draw_reason = 'threefold repetition'
+        elif self.is_fifty_move_draw():
+            self.draw_reason = 'fifty-move rule'
+        if self.draw_reason:
+            self.game_over = True
+            self.winner = None
@@ -0,0 +1,343 @@
+"""
+Position index over PGN archives.
+
+Every game is replayed and each position's key (its Zobrist key, counting
+the en passant square only when the capture is legal, as FEN does) is
+recorded with the game id and ply, plus per-move statistics (how often each move was played
+from the position and how those games ended). Both tables are sorted by key
+and memory-mapped, so a lookup is a binary search that touches a handful of
+pages however large the archive is.
+
+    python -m chess_engine.index build games.idx archive.pgn
+    python -m chess_engine.index build games.idx more_games.pgn --append
+    python -m chess_engine.index query games.idx --fen "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq - 0 1"
+
+Building is an external sort: records are sorted in bounded runs, spilled
+to disk and merged, so memory stays flat for archives of any size. --append
+indexes new games and merges them into the existing tables.
+"""
+
+import argparse
+import heapq
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+
+from .game import ZOBRIST_EN_PASSANT, GameState
+from .notation import decode_move, encode_move, move_to_uci
+from .pgn import read_games
+from .pieces import PieceType
+
+INDEX_VERSION = 2
+
+# Big-endian so that byte order is key order: runs sort and merge as plain bytes
+# Position record: key, game id, ply
+POSITION_RECORD = struct.Struct('>QIH')
+# Move record: key, 16-bit move, games, white wins, draws, black wins
+MOVE_RECORD = struct.Struct('>QHIIII')
+KEY_BYTES = 8
+
+POSITIONS_FILE = 'positions.bin'
+MOVES_FILE = 'moves.bin'
+META_FILE = 'meta.json'
+
+# Records held in memory before a sorted run is spilled to disk
+DEFAULT_RUN_RECORDS = 1000000
+READ_CHUNK_RECORDS = 65536
+
+RESULT_COLUMNS = {'1-0': 0, '1/2-1/2': 1, '0-1': 2}
+
+def index_key(game):
+    """The game's Zobrist key without the en passant term unless the capture is legal.
+
+    The search hashes the en passant file after every double pawn push, but
+    FENs from other tools only name the square when a capture is possible;
+    the index uses the FEN notion so both find the same positions.
+    """
+    target = game.en_passant_square()
+    if target is not None and not game.en_passant_capture_possible():
+        return game.zobrist_key ^ ZOBRIST_EN_PASSANT[target[1]]
+    return game.zobrist_key
+
+def read_records(path, record_size):
+    """Yield fixed-size records from a sorted run file"""
+    with open(path, 'rb') as run_file:
+        while True:
+            chunk = run_file.read(record_size * READ_CHUNK_RECORDS)
+            if not chunk:
+                return
+            for offset in range(0, len(chunk), record_size):
+                yield chunk[offset:offset + record_size]
+
+def merge_moves(records):
+    """Sum the counters of adjacent move records with the same key and move"""
+    current = None
+    for record in records:
+        fields = MOVE_RECORD.unpack(record)
+        if current is not None and fields[:2] == tuple(current[:2]):
+            for column in range(2, 6):
+                current[column] += fields[column]
+            continue
+        if current is not None:
+            yield MOVE_RECORD.pack(*current)
+        current = list(fields)
+    if current is not None:
+        yield MOVE_RECORD.pack(*current)
+
+def write_records(path, records):
+    """Write records to path atomically; returns how many were written"""
+    temporary_path = path + '.tmp'
+    count = 0
+    with open(temporary_path, 'wb') as output:
+        batch = []
+        for record in records:
+            batch.append(record)
+            if len(batch) >= READ_CHUNK_RECORDS:
+                output.write(b''.join(batch))
+                count += len(batch)
+                batch = []
+        output.write(b''.join(batch))
+        count += len(batch)
+    os.replace(temporary_path, path)
+    return count
+
+class IndexBuilder:
+    """Replays games into sorted runs, then merges them into the index files"""
+
+    def __init__(self, index_dir, append=False, run_records=DEFAULT_RUN_RECORDS, log=None):
+        self.index_dir = index_dir
+        self.append = append
+        self.run_records = run_records
+        self.log = log
+        self.meta = {'version': INDEX_VERSION, 'games': 0, 'positions': 0, 'moves': 0, 'sources': []}
+        self.positions = []
+        self.moves = {}
+        self.runs = []
+        self.games_added = 0
+
+    def load_meta(self):
+        meta_path = os.path.join(self.index_dir, META_FILE)
+        if self.append and os.path.exists(meta_path):
+            with open(meta_path) as meta_file:
+                self.meta = json.load(meta_file)
+            if self.meta.get('version') != INDEX_VERSION:
+                raise ValueError(f"Index {self.index_dir!r} has version {self.meta.get('version')}, "
+                                 f"expected {INDEX_VERSION}; rebuild it")
+
+    def add_archive(self, pgn_path):
+        first_game = self.meta['games'] + self.games_added
+        scratch = GameState()
+        start = time.time()
+        games = 0
+        for pgn_game in read_games(pgn_path):
+            self.add_game(first_game + games, pgn_game, scratch)
+            games += 1
+            if self.log and games % 1000 == 0:
+                print(f"{pgn_path}: {games} games ({games / (time.time() - start):.0f} games/s)", file=self.log)
+        self.games_added += games
+        self.meta['sources'].append({'path': os.path.abspath(pgn_path), 'first_game': first_game, 'games': games})
+
+    def add_game(self, game_id, pgn_game, scratch):
+        column = RESULT_COLUMNS.get(pgn_game.result)
+        ply = 0
+        try:
+            for game, san, piece, target, promotion in pgn_game.replay(scratch):
+                key = index_key(game)
+                self.positions.append(POSITION_RECORD.pack(key, game_id, ply))
+                if piece.type != PieceType.PAWN or target[0] not in (0, 7):
+                    promotion = None
+                move = encode_move(piece.position, target, promotion)
+                counts = self.moves.get((key, move))
+                if counts is None:
+                    counts = self.moves[(key, move)] = [0, 0, 0, 0]
+                counts[0] += 1
+                if column is not None:
+                    counts[1 + column] += 1
+                ply += 1
+        except ValueError:
+            # Index the game up to its first unreadable move
+            pass
+        self.positions.append(POSITION_RECORD.pack(index_key(scratch), game_id, ply))
+        if len(self.positions) >= self.run_records:
+            self.spill()
+
+    def spill(self):
+        """Write the buffered records as one sorted run"""
+        if not self.positions and not self.moves:
+            return
+        run_number = len(self.runs)
+        positions_path = os.path.join(self.index_dir, f"run{run_number}.positions")
+        moves_path = os.path.join(self.index_dir, f"run{run_number}.moves")
+        self.positions.sort()
+        write_records(positions_path, self.positions)
+        write_records(moves_path, sorted(MOVE_RECORD.pack(key, move, *counts)
+                                         for (key, move), counts in self.moves.items()))
+        self.runs.append((positions_path, moves_path))
+        self.positions = []
+        self.moves = {}
+
+    def finish(self):
+        """Merge all runs (and the existing index when appending) into the final files"""
+        self.spill()
+        positions_path = os.path.join(self.index_dir, POSITIONS_FILE)
+        moves_path = os.path.join(self.index_dir, MOVES_FILE)
+        position_runs = [positions for positions, moves in self.runs]
+        move_runs = [moves for positions, moves in self.runs]
+        if self.append and os.path.exists(positions_path):
+            position_runs.append(positions_path)
+            move_runs.append(moves_path)
+
+        self.meta['positions'] = write_records(positions_path, heapq.merge(
+            *(read_records(path, POSITION_RECORD.size) for path in position_runs)))
+        self.meta['moves'] = write_records(moves_path, merge_moves(heapq.merge(
+            *(read_records(path, MOVE_RECORD.size) for path in move_runs))))
+        self.meta['games'] += self.games_added
+
+        for positions, moves in self.runs:
+            os.remove(positions)
+            os.remove(moves)
+        self.runs = []
+        meta_path = os.path.join(self.index_dir, META_FILE)
+        with open(meta_path + '.tmp', 'w') as meta_file:
+            json.dump(self.meta, meta_file, indent=1)
+        os.replace(meta_path + '.tmp', meta_path)
+        return self.meta
+
+def build_index(index_dir, pgn_paths, append=False, run_records=DEFAULT_RUN_RECORDS, log=None):
+    """Index PGN archives into index_dir (created if needed); returns the index metadata"""
+    os.makedirs(index_dir, exist_ok=True)
+    builder = IndexBuilder(index_dir, append, run_records, log)
+    builder.load_meta()
+    for pgn_path in pgn_paths:
+        builder.add_archive(pgn_path)
+    return builder.finish()
+
+class SortedTable:
+    """Memory-mapped file of fixed-size records sorted by a leading 64-bit key"""
+
+    def __init__(self, path, record):
+        self.record = record
+        self.file = open(path, 'rb')
+        size = os.fstat(self.file.fileno()).st_size
+        self.count = size // record.size
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+
+    def lower_bound(self, key_bytes):
+        low, high = 0, self.count
+        size = self.record.size
+        while low < high:
+            middle = (low + high) // 2
+            offset = middle * size
+            if self.map[offset:offset + KEY_BYTES] < key_bytes:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def find(self, key, limit=None):
+        """Unpacked records whose key equals key"""
+        if not self.count:
+            return []
+        key_bytes = key.to_bytes(KEY_BYTES, 'big')
+        size = self.record.size
+        index = self.lower_bound(key_bytes)
+        found = []
+        while index < self.count and (limit is None or len(found) < limit):
+            offset = index * size
+            if self.map[offset:offset + KEY_BYTES] != key_bytes:
+                break
+            found.append(self.record.unpack_from(self.map, offset))
+            index += 1
+        return found
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+        self.file.close()
+
+class PositionIndex:
+    """Read-only query API over an index directory"""
+
+    def __init__(self, index_dir):
+        with open(os.path.join(index_dir, META_FILE)) as meta_file:
+            self.meta = json.load(meta_file)
+        self.positions = SortedTable(os.path.join(index_dir, POSITIONS_FILE), POSITION_RECORD)
+        self.moves = SortedTable(os.path.join(index_dir, MOVES_FILE), MOVE_RECORD)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.positions.close()
+        self.moves.close()
+
+    @staticmethod
+    def key_for(position):
+        """Accept an index key (index_key), a GameState or a FEN string"""
+        if isinstance(position, int):
+            return position
+        if isinstance(position, str):
+            game = GameState()
+            game.load_fen(position, update_state=False)
+            return index_key(game)
+        return index_key(position)
+
+    def games(self, position, limit=None):
+        """(game id, ply) pairs where the position occurred"""
+        return [(game_id, ply) for key, game_id, ply in self.positions.find(self.key_for(position), limit)]
+
+    def move_stats(self, position):
+        """Moves played from the position, most popular first.
+
+        Each entry has the move (UCI), the number of games and the white
+        wins, draws and black wins among games with a known result.
+        """
+        stats = []
+        for key, move, games, white_wins, draws, black_wins in self.moves.find(self.key_for(position)):
+            from_pos, to_pos, promotion = decode_move(move)
+            stats.append({
+                'move': move_to_uci(from_pos, to_pos, promotion),
+                'games': games,
+                'white_wins': white_wins,
+                'draws': draws,
+                'black_wins': black_wins,
+            })
+        stats.sort(key=lambda entry: entry['games'], reverse=True)
+        return stats
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build and query a position index over PGN archives")
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('build', help="index PGN files")
+    build.add_argument('index', help="index directory")
+    build.add_argument('pgn', nargs='+', help="PGN archives")
+    build.add_argument('--append', action='store_true', help="add games to an existing index")
+    build.add_argument('--run-records', type=int, default=DEFAULT_RUN_RECORDS,
+                       help="positions sorted in memory before spilling a run to disk")
+    query = commands.add_parser('query', help="look up a position")
+    query.add_argument('index', help="index directory")
+    query.add_argument('--fen', required=True)
+    query.add_argument('--limit', type=int, default=20, help="game occurrences to list")
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        start = time.time()
+        meta = build_index(args.index, args.pgn, args.append, args.run_records, log=sys.stderr)
+        print(f"{meta['games']} games, {meta['positions']} positions, {meta['moves']} distinct moves "
+              f"({time.time() - start:.1f}s)")
+    else:
+        with PositionIndex(args.index) as index:
+            for entry in index.move_stats(args.fen):
+                print(f"{entry['move']:6} games {entry['games']:7}  +{entry['white_wins']} "
+                      f"={entry['draws']} -{entry['black_wins']}")
+            for game_id, ply in index.games(args.fen, args.limit):
+                print(f"game {game_id} ply {ply}")
+
+if __name__ == "__main__":
+    main()
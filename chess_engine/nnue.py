@@ -0,0 +1,324 @@
+"""
+Small NNUE-style evaluation network.
+
+Each side's view of the board is a 768-input one-hot vector: own and enemy
+pieces, by type, on 64 squares (flipped vertically for black). Both views go
+through the same 768x128 layer; the two 128-value sums (accumulators) are
+clipped to [0, 1], concatenated with the side to move first and reduced to
+one output by a final linear layer:
+
+    768 -> 128 (x2 perspectives) -> 1
+
+A move only changes the inputs of the few pieces it touches, so the search
+keeps the accumulators up to date by adding and subtracting weight rows
+instead of recomputing the first layer. Everything runs on the CPU with
+NumPy; the engine only imports this module when a network is in use.
+
+The output is in log10 win odds (1.0 means 10:1) and is scaled to tenths of
+a pawn, the unit of ChessAI.evaluate_board, so 4 pawns is 10:1 odds.
+
+    python -m chess_engine.tournament HARD EXPERT --games 2000 --pgn selfplay.pgn
+    python -m chess_engine.nnue train nnue.npz selfplay.pgn --epochs 20
+
+Training data are the same labeled positions chess_engine.tune reads
+(self-play PGNs or EPD lines ending in a result).
+"""
+
+import argparse
+import math
+import sys
+import time
+
+import numpy as np
+
+from .pieces import BOARD_SIZE, Color, PieceType
+from .tune import DEFAULT_SKIP_PLIES, ChunkedArray, labeled_positions
+
+NNUE_VERSION = 1
+NNUE_PIECE_TYPES = (PieceType.PAWN, PieceType.KNIGHT, PieceType.BISHOP,
+                    PieceType.ROOK, PieceType.QUEEN, PieceType.KING)
+SQUARES = BOARD_SIZE * BOARD_SIZE
+# Own pieces first, then the opponent's
+INPUTS = 2 * len(NNUE_PIECE_TYPES) * SQUARES
+DEFAULT_HIDDEN = 128
+MAX_PIECES = 32
+# Padding input for positions with fewer than 32 pieces; dropped before the first layer
+PADDING_INPUT = INPUTS
+
+# Tenths of a pawn per unit of network output (log10 odds)
+OUTPUT_SCALE = 40
+
+DEFAULT_EPOCHS = 20
+DEFAULT_BATCH_SIZE = 1024
+DEFAULT_LEARNING_RATE = 0.001
+VALIDATION_FRACTION = 0.05
+# Training positions scored for the per-epoch report when nothing is held out
+REPORT_SAMPLE = 10000
+
+def feature_index(perspective, color, piece_type, row, col):
+    """Input index of a piece seen from one side"""
+    if perspective == Color.BLACK:
+        row = BOARD_SIZE - 1 - row
+    enemy = 0 if color == perspective else 1
+    return (enemy * len(NNUE_PIECE_TYPES) + NNUE_PIECE_TYPES.index(piece_type)) * SQUARES + row * BOARD_SIZE + col
+
+def board_features(board, perspective):
+    """Active inputs of a board from one side"""
+    return [feature_index(perspective, piece.color, piece.type, row, col)
+            for row, board_row in enumerate(board) for col, piece in enumerate(board_row) if piece]
+
+def padded_features(board, perspective):
+    features = board_features(board, perspective)
+    return features + [PADDING_INPUT] * (MAX_PIECES - len(features))
+
+class Network:
+    """Weights of the 768 -> hidden (x2) -> 1 network"""
+
+    def __init__(self, input_weights, input_biases, output_weights, output_bias):
+        self.input_weights = np.ascontiguousarray(input_weights, dtype=np.float32)
+        self.input_biases = np.ascontiguousarray(input_biases, dtype=np.float32)
+        self.output_weights = np.ascontiguousarray(output_weights, dtype=np.float32)
+        self.output_bias = float(output_bias)
+        self.hidden = self.input_biases.shape[0]
+        # Output weights for the side to move and for the opponent
+        self.own_output_weights = self.output_weights[:self.hidden]
+        self.enemy_output_weights = self.output_weights[self.hidden:]
+
+    @classmethod
+    def random(cls, hidden=DEFAULT_HIDDEN, seed=0):
+        """Untrained network whose hidden units start inside the clipping range"""
+        generator = np.random.default_rng(seed)
+        return cls(generator.normal(0.0, 0.05, (INPUTS, hidden)),
+                   np.full(hidden, 0.5),
+                   generator.normal(0.0, 1.0 / math.sqrt(2 * hidden), 2 * hidden),
+                   0.0)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            version = int(data['version'])
+            if version != NNUE_VERSION:
+                raise ValueError(f"Network {path!r} has version {version}, expected {NNUE_VERSION}")
+            return cls(data['input_weights'], data['input_biases'], data['output_weights'], data['output_bias'])
+
+    def save(self, path):
+        # np.savez adds .npz to names without it; write to exactly the path given
+        with open(path, 'wb') as weights_file:
+            np.savez(weights_file, version=NNUE_VERSION, input_weights=self.input_weights,
+                     input_biases=self.input_biases, output_weights=self.output_weights,
+                     output_bias=self.output_bias)
+
+    def evaluate_board(self, board, turn):
+        """Full (non-incremental) evaluation in tenths of a pawn, from turn's side"""
+        own = self.input_biases + self.input_weights[board_features(board, turn)].sum(axis=0)
+        enemy = self.input_biases + self.input_weights[board_features(board, turn.opposite)].sum(axis=0)
+        return self.output(own, enemy)
+
+    def output(self, own, enemy):
+        value = (np.dot(np.clip(own, 0.0, 1.0), self.own_output_weights) +
+                 np.dot(np.clip(enemy, 0.0, 1.0), self.enemy_output_weights) + self.output_bias)
+        return int(round(float(value) * OUTPUT_SCALE))
+
+# Networks are read-only, so every ChessAI using the same file shares one
+loaded_networks = {}
+
+def load_network(path):
+    network = loaded_networks.get(path)
+    if network is None:
+        network = loaded_networks[path] = Network.load(path)
+    return network
+
+class Accumulator:
+    """First-layer sums for both sides, kept in step with make_move/unmake_move.
+
+    refresh() computes them from a board; push() applies the undo record
+    GameState.make_move just returned and pop() goes back one move.
+    """
+
+    def __init__(self, network):
+        self.network = network
+        self.stack = []
+        self.white = None
+        self.black = None
+
+    def refresh(self, board):
+        weights = self.network.input_weights
+        self.stack = []
+        self.white = self.network.input_biases.copy()
+        self.black = self.network.input_biases.copy()
+        for row, board_row in enumerate(board):
+            for col, piece in enumerate(board_row):
+                if piece:
+                    self.white += weights[feature_index(Color.WHITE, piece.color, piece.type, row, col)]
+                    self.black += weights[feature_index(Color.BLACK, piece.color, piece.type, row, col)]
+
+    def push(self, undo):
+        piece, old_pos, old_type, _, captured, captured_pos, rook_move = undo[:7]
+        self.stack.append((self.white, self.black))
+        white = self.white.copy()
+        black = self.black.copy()
+        weights = self.network.input_weights
+        color = piece.color
+        row, col = piece.position
+
+        white -= weights[feature_index(Color.WHITE, color, old_type, old_pos[0], old_pos[1])]
+        black -= weights[feature_index(Color.BLACK, color, old_type, old_pos[0], old_pos[1])]
+        white += weights[feature_index(Color.WHITE, color, piece.type, row, col)]
+        black += weights[feature_index(Color.BLACK, color, piece.type, row, col)]
+        if captured:
+            white -= weights[feature_index(Color.WHITE, captured.color, captured.type, *captured_pos)]
+            black -= weights[feature_index(Color.BLACK, captured.color, captured.type, *captured_pos)]
+        if rook_move:
+            _, rook_from_col, rook_to_col, _ = rook_move
+            rook_row = old_pos[0]
+            white -= weights[feature_index(Color.WHITE, color, PieceType.ROOK, rook_row, rook_from_col)]
+            black -= weights[feature_index(Color.BLACK, color, PieceType.ROOK, rook_row, rook_from_col)]
+            white += weights[feature_index(Color.WHITE, color, PieceType.ROOK, rook_row, rook_to_col)]
+            black += weights[feature_index(Color.BLACK, color, PieceType.ROOK, rook_row, rook_to_col)]
+        self.white = white
+        self.black = black
+
+    def pop(self):
+        self.white, self.black = self.stack.pop()
+
+    def evaluate(self, turn):
+        """Evaluation in tenths of a pawn from turn's side"""
+        if turn == Color.WHITE:
+            return self.network.output(self.white, self.black)
+        return self.network.output(self.black, self.white)
+
+def extract_training_data(paths, skip_plies=DEFAULT_SKIP_PLIES, log=None):
+    """(own inputs, enemy inputs, results) for every labeled position, from the side to move"""
+    own_rows = ChunkedArray((MAX_PIECES,))
+    enemy_rows = ChunkedArray((MAX_PIECES,))
+    results = ChunkedArray(dtype=np.float32)
+    start = time.time()
+    for path in paths:
+        for game, result in labeled_positions(path, skip_plies):
+            own_rows.append(padded_features(game.board, game.turn))
+            enemy_rows.append(padded_features(game.board, game.turn.opposite))
+            results.append(result if game.turn == Color.WHITE else 1.0 - result)
+            if log and len(results) % 100000 == 0:
+                print(f"{len(results)} positions ({len(results) / (time.time() - start):.0f}/s)", file=log)
+    return own_rows.array(), enemy_rows.array(), results.array()
+
+def dense_inputs(features):
+    """One-hot (batch, INPUTS) matrix for a batch of padded input lists"""
+    inputs = np.zeros((features.shape[0], INPUTS + 1), dtype=np.float32)
+    inputs[np.arange(features.shape[0])[:, None], features] = 1.0
+    return inputs[:, :INPUTS]
+
+class Trainer:
+    """Mini-batch Adam on the squared error between predicted win odds and results"""
+
+    def __init__(self, network, learning_rate=DEFAULT_LEARNING_RATE):
+        self.network = network
+        self.learning_rate = learning_rate
+        # The weight arrays are the network's own and are updated in place
+        self.parameters = [network.input_weights, network.input_biases, network.output_weights,
+                           np.array([network.output_bias], dtype=np.float32)]
+        self.first_moments = [np.zeros_like(parameter) for parameter in self.parameters]
+        self.second_moments = [np.zeros_like(parameter) for parameter in self.parameters]
+        self.steps = 0
+
+    def forward(self, own_features, enemy_features):
+        input_weights, input_biases, output_weights, output_bias = self.parameters
+        own_inputs = dense_inputs(own_features)
+        enemy_inputs = dense_inputs(enemy_features)
+        hidden = np.concatenate([own_inputs @ input_weights, enemy_inputs @ input_weights], axis=1)
+        hidden += np.concatenate([input_biases, input_biases])
+        activations = np.clip(hidden, 0.0, 1.0)
+        outputs = activations @ output_weights + output_bias[0]
+        probabilities = 1.0 / (1.0 + np.power(10.0, -outputs))
+        return own_inputs, enemy_inputs, hidden, activations, probabilities
+
+    def loss(self, own_features, enemy_features, results):
+        probabilities = self.forward(own_features, enemy_features)[-1]
+        return float(np.mean((probabilities - results) ** 2))
+
+    def step(self, own_features, enemy_features, results):
+        own_inputs, enemy_inputs, hidden, activations, probabilities = self.forward(own_features, enemy_features)
+        output_weights = self.parameters[2]
+        hidden_size = self.network.hidden
+
+        output_gradients = 2.0 * (probabilities - results) * probabilities * (1.0 - probabilities) \
+            * math.log(10) / len(results)
+        hidden_gradients = np.outer(output_gradients, output_weights) * ((hidden > 0.0) & (hidden < 1.0))
+        own_gradients = hidden_gradients[:, :hidden_size]
+        enemy_gradients = hidden_gradients[:, hidden_size:]
+        gradients = [
+            own_inputs.T @ own_gradients + enemy_inputs.T @ enemy_gradients,
+            own_gradients.sum(axis=0) + enemy_gradients.sum(axis=0),
+            activations.T @ output_gradients,
+            np.array([output_gradients.sum()], dtype=np.float32),
+        ]
+
+        self.steps += 1
+        beta1, beta2, epsilon = 0.9, 0.999, 1e-8
+        for parameter, gradient, first, second in zip(self.parameters, gradients,
+                                                      self.first_moments, self.second_moments):
+            first *= beta1
+            first += (1 - beta1) * gradient
+            second *= beta2
+            second += (1 - beta2) * gradient * gradient
+            corrected_first = first / (1 - beta1 ** self.steps)
+            corrected_second = second / (1 - beta2 ** self.steps)
+            parameter -= (self.learning_rate * corrected_first / (np.sqrt(corrected_second) + epsilon)).astype(np.float32)
+
+    def finish(self):
+        self.network.output_bias = float(self.parameters[3][0])
+        return self.network
+
+def train(own_features, enemy_features, results, network=None, epochs=DEFAULT_EPOCHS,
+          batch_size=DEFAULT_BATCH_SIZE, learning_rate=DEFAULT_LEARNING_RATE, seed=0, log=None):
+    """Train a network on extracted positions; a slice is held out to report validation error"""
+    network = network or Network.random(seed=seed)
+    trainer = Trainer(network, learning_rate)
+    generator = np.random.default_rng(seed)
+    order = generator.permutation(len(results))
+    held_out = order[:int(len(results) * VALIDATION_FRACTION)]
+    training = order[len(held_out):]
+
+    for epoch in range(1, epochs + 1):
+        start = time.time()
+        generator.shuffle(training)
+        for batch_start in range(0, len(training), batch_size):
+            batch = training[batch_start:batch_start + batch_size]
+            trainer.step(own_features[batch], enemy_features[batch], results[batch])
+        if log:
+            sample = training[:len(held_out) or REPORT_SAMPLE]
+            training_error = trainer.loss(own_features[sample], enemy_features[sample], results[sample])
+            report = f"epoch {epoch}: training error {training_error:.6f}"
+            if len(held_out):
+                validation_error = trainer.loss(own_features[held_out], enemy_features[held_out], results[held_out])
+                report += f", validation error {validation_error:.6f}"
+            print(f"{report} ({time.time() - start:.1f}s)", file=log)
+    return trainer.finish()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train the NNUE evaluation network on labeled positions")
+    commands = parser.add_subparsers(dest='command', required=True)
+    train_command = commands.add_parser('train', help="train a network")
+    train_command.add_argument('weights', help="output .npz weights file")
+    train_command.add_argument('positions', nargs='+', help="PGN or EPD files")
+    train_command.add_argument('--epochs', type=int, default=DEFAULT_EPOCHS)
+    train_command.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    train_command.add_argument('--learning-rate', type=float, default=DEFAULT_LEARNING_RATE)
+    train_command.add_argument('--hidden', type=int, default=DEFAULT_HIDDEN, help="accumulator size")
+    train_command.add_argument('--skip-plies', type=int, default=DEFAULT_SKIP_PLIES,
+                               help="opening plies of each PGN game to leave out")
+    train_command.add_argument('--resume', action='store_true', help="continue training the existing weights file")
+    train_command.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    start = time.time()
+    own_features, enemy_features, results = extract_training_data(args.positions, args.skip_plies, log=sys.stderr)
+    print(f"{len(results)} positions ({time.time() - start:.1f}s)", file=sys.stderr)
+    network = Network.load(args.weights) if args.resume else Network.random(args.hidden, args.seed)
+    network = train(own_features, enemy_features, results, network, args.epochs, args.batch_size,
+                    args.learning_rate, args.seed, log=sys.stderr)
+    network.save(args.weights)
+    print(f"{len(results)} positions, {args.epochs} epochs ({time.time() - start:.1f}s)")
+
+if __name__ == "__main__":
+    main()
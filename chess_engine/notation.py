@@ -0,0 +1,69 @@
+"""
+Square and move notation helpers (board coordinates <-> algebraic text)
+"""
+
+from .pieces import BOARD_SIZE, PieceType, pack_move
+
+PROMOTION_LETTERS = {
+    'q': PieceType.QUEEN,
+    'r': PieceType.ROOK,
+    'b': PieceType.BISHOP,
+    'n': PieceType.KNIGHT,
+}
+
+def square_name(position):
+    """Convert a (row, col) board position to algebraic notation, e.g. (6, 4) -> 'e2'"""
+    row, col = position
+    return f"{chr(ord('a') + col)}{BOARD_SIZE - row}"
+
+def parse_square(name):
+    """Convert algebraic notation to a (row, col) board position, e.g. 'e2' -> (6, 4)"""
+    if len(name) != 2 or not 'a' <= name[0] <= 'h' or not '1' <= name[1] <= '8':
+        raise ValueError(f"Invalid square: {name!r}")
+    return BOARD_SIZE - int(name[1]), ord(name[0]) - ord('a')
+
+def move_to_uci(from_pos, to_pos, promotion=None):
+    """Long algebraic (UCI) text for a move, e.g. 'e7e8q'"""
+    text = square_name(from_pos) + square_name(to_pos)
+    if promotion is not None:
+        text += promotion.value
+    return text
+
+def search_move_to_uci(piece, from_pos, to_pos):
+    """UCI text of a move as the search plays it (pawns reaching the last rank become queens)"""
+    promotion = None
+    if piece.type == PieceType.PAWN and to_pos[0] in (0, BOARD_SIZE - 1):
+        promotion = PieceType.QUEEN
+    return move_to_uci(from_pos, to_pos, promotion)
+
+def parse_uci_move(text):
+    """Parse UCI move text into (from_pos, to_pos, promotion_type_or_None)"""
+    if len(text) not in (4, 5):
+        raise ValueError(f"Invalid UCI move: {text!r}")
+    promotion = None
+    if len(text) == 5:
+        if text[4] not in PROMOTION_LETTERS:
+            raise ValueError(f"Invalid promotion piece in move: {text!r}")
+        promotion = PROMOTION_LETTERS[text[4]]
+    return parse_square(text[0:2]), parse_square(text[2:4]), promotion
+
+# 16-bit move encoding: the search's move code (pieces.pack_move, from square
+# in bits 0-5, to square in bits 6-11), promotion piece (bits 12-13) and a
+# promotion flag (bit 14); squares are row * 8 + col, a8 = 0
+MOVE_PROMOTIONS = [PieceType.QUEEN, PieceType.ROOK, PieceType.BISHOP, PieceType.KNIGHT]
+MOVE_PROMOTION_CODES = {piece_type: code for code, piece_type in enumerate(MOVE_PROMOTIONS)}
+MOVE_PROMOTION_FLAG = 1 << 14
+
+def encode_move(from_pos, to_pos, promotion=None):
+    """Pack a move into 16 bits"""
+    value = pack_move(from_pos[0] * BOARD_SIZE + from_pos[1], to_pos[0] * BOARD_SIZE + to_pos[1])
+    if promotion is not None:
+        value |= MOVE_PROMOTION_FLAG | MOVE_PROMOTION_CODES[promotion] << 12
+    return value
+
+def decode_move(value):
+    """Unpack a 16-bit move into (from_pos, to_pos, promotion_type_or_None)"""
+    from_square = value & 63
+    to_square = value >> 6 & 63
+    promotion = MOVE_PROMOTIONS[value >> 12 & 3] if value & MOVE_PROMOTION_FLAG else None
+    return divmod(from_square, BOARD_SIZE), divmod(to_square, BOARD_SIZE), promotion
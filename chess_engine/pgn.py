@@ -0,0 +1,298 @@
+"""
+PGN support: Standard Algebraic Notation (SAN), game export and a streaming reader.
+
+read_games() is a generator that holds one game in memory at a time, so
+multi-gigabyte archives can be imported with constant memory:
+
+    for pgn_game in read_games('archive.pgn'):
+        for game, san, piece, target, promotion in pgn_game.replay():
+            ...
+"""
+
+import os
+import re
+
+from .game import STARTING_FEN, GameState
+from .notation import PROMOTION_LETTERS, parse_square, square_name
+from .pieces import Color, PieceType
+
+SAN_PIECE_LETTERS = {
+    PieceType.KING: 'K',
+    PieceType.QUEEN: 'Q',
+    PieceType.ROOK: 'R',
+    PieceType.BISHOP: 'B',
+    PieceType.KNIGHT: 'N',
+}
+
+SAN_LETTER_TYPES = {letter: piece_type for piece_type, letter in SAN_PIECE_LETTERS.items()}
+
+CASTLING_SAN = {'O-O': 6, '0-0': 6, 'O-O-O': 2, '0-0-0': 2}
+
+RESULTS = ('1-0', '0-1', '1/2-1/2', '*')
+
+TAG_PAIR_RE = re.compile(r'\[\s*(\w+)\s+"((?:[^"\\]|\\.)*)"\s*\]')
+MOVETEXT_TOKEN_RE = re.compile(r'[{}();]|[^\s{}();]+')
+MOVE_NUMBER_RE = re.compile(r'^\d+\.+')
+
+# Seven tag roster first, in the order the PGN standard requires
+STANDARD_TAGS = ('Event', 'Site', 'Date', 'Round', 'White', 'Black', 'Result')
+
+def move_to_san(game, piece, target, promotion=PieceType.QUEEN):
+    """SAN for a legal move in the game's current position, e.g. 'Nbd7', 'exd6+', 'O-O'"""
+    from_row, from_col = piece.position
+    to_row, to_col = target
+
+    if piece.type == PieceType.KING and abs(to_col - from_col) > 1:
+        san = 'O-O' if to_col > from_col else 'O-O-O'
+    else:
+        is_capture = game.board[to_row][to_col] is not None or (
+            piece.type == PieceType.PAWN and from_col != to_col)
+        if piece.type == PieceType.PAWN:
+            san = square_name(piece.position)[0] + 'x' if is_capture else ''
+            san += square_name(target)
+            if to_row in (0, 7):
+                san += '=' + SAN_PIECE_LETTERS[promotion]
+        else:
+            san = SAN_PIECE_LETTERS[piece.type] + disambiguation(game, piece, target)
+            if is_capture:
+                san += 'x'
+            san += square_name(target)
+
+    # Check and checkmate suffix
+    undo = game.make_move(piece, target, promotion)
+    if game.is_in_check():
+        san += '#' if not game.legal_moves() else '+'
+    game.unmake_move(undo)
+    return san
+
+def disambiguation(game, piece, target):
+    """File, rank or square needed to tell piece apart from same-type pieces reaching target"""
+    rivals = [other for other, move in game.legal_moves()
+              if move == target and other is not piece and other.type == piece.type]
+    if not rivals:
+        return ''
+    origin = square_name(piece.position)
+    if all(other.position[1] != piece.position[1] for other in rivals):
+        return origin[0]
+    if all(other.position[0] != piece.position[0] for other in rivals):
+        return origin[1]
+    return origin
+
+def format_movetext(san_moves, result, first_move_number=1, black_to_move=False, line_width=80):
+    """Numbered movetext wrapped to line_width, ending with the result"""
+    tokens = []
+    move_number = first_move_number
+    white_turn = not black_to_move
+    if black_to_move and san_moves:
+        tokens.append(f"{move_number}...")
+    for san in san_moves:
+        if white_turn:
+            tokens.append(f"{move_number}.")
+        tokens.append(san)
+        if not white_turn:
+            move_number += 1
+        white_turn = not white_turn
+    tokens.append(result)
+
+    lines = []
+    current = ''
+    for token in tokens:
+        joined = f"{current} {token}" if current else token
+        if len(joined) > line_width and current:
+            lines.append(current)
+            current = token
+        else:
+            current = joined
+    lines.append(current)
+    return '\n'.join(lines)
+
+def format_game(headers, san_moves, result, first_move_number=1, black_to_move=False):
+    """Full PGN text for one game (tag pairs, blank line, movetext, blank line)"""
+    tag_lines = []
+    for name in STANDARD_TAGS:
+        value = result if name == 'Result' else headers.get(name, '?')
+        tag_lines.append(f'[{name} "{escape_tag(value)}"]')
+    for name, value in headers.items():
+        if name not in STANDARD_TAGS:
+            tag_lines.append(f'[{name} "{escape_tag(value)}"]')
+    movetext = format_movetext(san_moves, result, first_move_number, black_to_move)
+    return '\n'.join(tag_lines) + '\n\n' + movetext + '\n\n'
+
+def escape_tag(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"')
+
+def unescape_tag(value):
+    return re.sub(r'\\(.)', r'\1', value)
+
+def parse_san(game, san):
+    """Find the legal move for SAN text in the game's current position.
+
+    Returns (piece, target, promotion); raises ValueError if the move is
+    illegal or ambiguous.
+    """
+    text = san.rstrip('+#!?')
+    promotion = PieceType.QUEEN
+
+    if text in CASTLING_SAN:
+        king = game.find_king(game.turn)
+        target = (king.position[0], CASTLING_SAN[text])
+        if king.position[1] == 4 and target in king.get_possible_moves(game.board, game.last_move):
+            return king, target, promotion
+        raise ValueError(f"Illegal castling move {san!r}")
+
+    if '=' in text:
+        text, promotion_letter = text.split('=', 1)
+        promotion = PROMOTION_LETTERS.get(promotion_letter.lower())
+    elif text and text[-1] in 'QRBN' and text[0].islower():
+        # Promotion written without '=', e.g. e8Q
+        text, promotion = text[:-1], PROMOTION_LETTERS[text[-1].lower()]
+    if promotion is None or len(text) < 2:
+        raise ValueError(f"Invalid SAN move {san!r}")
+
+    piece_type = SAN_LETTER_TYPES.get(text[0], PieceType.PAWN)
+    if piece_type != PieceType.PAWN:
+        text = text[1:]
+    try:
+        target = parse_square(text[-2:])
+    except (ValueError, IndexError):
+        raise ValueError(f"Invalid SAN move {san!r}") from None
+    qualifier = text[:-2].replace('x', '')
+
+    matches = []
+    for board_row in game.board:
+        for piece in board_row:
+            if piece is None or piece.color != game.turn or piece.type != piece_type:
+                continue
+            origin = square_name(piece.position)
+            if any(char not in origin for char in qualifier):
+                continue
+            if target in piece.get_possible_moves(game.board, game.last_move):
+                matches.append(piece)
+    if len(matches) != 1:
+        raise ValueError(f"{'Ambiguous' if matches else 'Illegal'} SAN move {san!r}")
+    return matches[0], target, promotion
+
+def game_result(game):
+    """PGN result string for a GameState"""
+    if game.checkmate:
+        return '1-0' if game.winner == Color.WHITE else '0-1'
+    if game.game_over:
+        return '1/2-1/2'
+    return '*'
+
+def start_move_number(fen):
+    """(first move number, black to move) for movetext starting at fen"""
+    fields = fen.split()
+    first_move_number = int(fields[5]) if len(fields) > 5 else 1
+    return first_move_number, len(fields) > 1 and fields[1] == 'b'
+
+def game_to_pgn(game, headers=None, result=None):
+    """Export a GameState's move_history as PGN text"""
+    replay = GameState()
+    replay.load_fen(game.start_fen, update_state=False)
+    san_moves = []
+    for record in game.move_history:
+        from_row, from_col = record['from']
+        piece = replay.board[from_row][from_col]
+        promotion = record.get('promotion') or PieceType.QUEEN
+        san_moves.append(move_to_san(replay, piece, record['to'], promotion))
+        replay.move_piece(piece, record['to'], promotion, update_state=False)
+
+    headers = dict(headers or {})
+    if game.start_fen != STARTING_FEN:
+        headers['SetUp'] = '1'
+        headers['FEN'] = game.start_fen
+    first_move_number, black_to_move = start_move_number(game.start_fen)
+    return format_game(headers, san_moves, result or game_result(game), first_move_number, black_to_move)
+
+def write_game(stream, game, headers=None, result=None):
+    stream.write(game_to_pgn(game, headers, result))
+
+class PGNGame:
+    """One game read from PGN: tag pairs, mainline SAN moves and result"""
+
+    def __init__(self, headers, moves, result):
+        self.headers = headers
+        self.moves = moves
+        self.result = result
+
+    @property
+    def start_fen(self):
+        return self.headers.get('FEN', STARTING_FEN)
+
+    def replay(self, game=None, update_state=False):
+        """Replay the moves on a GameState.
+
+        Yields (game, san, piece, target, promotion) with the game still in
+        the position before each move; the move is played when the consumer
+        asks for the next one. Pass a GameState to reuse it across games.
+        """
+        game = game or GameState()
+        game.load_fen(self.start_fen, update_state=False)
+        for san in self.moves:
+            piece, target, promotion = parse_san(game, san)
+            yield game, san, piece, target, promotion
+            game.move_piece(piece, target, promotion, update_state=update_state)
+
+    def to_pgn(self):
+        first_move_number, black_to_move = start_move_number(self.start_fen)
+        return format_game(self.headers, self.moves, self.result, first_move_number, black_to_move)
+
+def read_games(source):
+    """Lazily yield PGNGame objects from a path or text stream.
+
+    Only the game being parsed is held in memory. Comments, variations,
+    NAGs and move numbers are skipped; only the mainline is kept.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, encoding='utf-8', errors='replace') as stream:
+            yield from read_games(stream)
+        return
+
+    headers = {}
+    moves = []
+    in_comment = False
+    variation_depth = 0
+
+    for line in source:
+        if not in_comment and variation_depth == 0:
+            stripped = line.strip()
+            if stripped.startswith('['):
+                # A tag pair after movetext means the previous game had no result token
+                if moves:
+                    yield PGNGame(headers, moves, '*')
+                    headers, moves = {}, []
+                match = TAG_PAIR_RE.match(stripped)
+                if match:
+                    headers[match.group(1)] = unescape_tag(match.group(2))
+                continue
+            if stripped.startswith('%'):
+                continue
+
+        for token in MOVETEXT_TOKEN_RE.findall(line):
+            if in_comment:
+                if token == '}':
+                    in_comment = False
+                continue
+            if token == '{':
+                in_comment = True
+            elif token == ';':
+                break
+            elif token == '(':
+                variation_depth += 1
+            elif token == ')':
+                variation_depth = max(0, variation_depth - 1)
+            elif variation_depth:
+                continue
+            elif token in RESULTS:
+                yield PGNGame(headers, moves, token)
+                headers, moves = {}, []
+            elif token[0] == '$':
+                continue
+            else:
+                token = MOVE_NUMBER_RE.sub('', token)
+                if token.strip('.'):
+                    moves.append(token)
+
+    if headers or moves:
+        yield PGNGame(headers, moves, headers.get('Result', '*'))
@@ -0,0 +1,381 @@
+"""
+Piece definitions and move generation for the chess engine
+"""
+
+from enum import Enum
+
+BOARD_SIZE = 8
+
+# Piece colors
+class Color(Enum):
+    WHITE = 'w'
+    BLACK = 'b'
+
+    @property
+    def opposite(self):
+        return Color.BLACK if self == Color.WHITE else Color.WHITE
+
+class PieceType(Enum):
+    KING = 'k'
+    QUEEN = 'q'
+    ROOK = 'r'
+    BISHOP = 'b'
+    KNIGHT = 'n'
+    PAWN = 'p'
+
+KNIGHT_OFFSETS = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
+KING_OFFSETS = ((0, -1), (0, 1), (-1, 0), (1, 0), (-1, -1), (-1, 1), (1, -1), (1, 1))
+STRAIGHT_DIRECTIONS = ((0, -1), (0, 1), (-1, 0), (1, 0))
+DIAGONAL_DIRECTIONS = ((-1, -1), (-1, 1), (1, -1), (1, 1))
+SLIDER_DIRECTIONS = {
+    PieceType.BISHOP: DIAGONAL_DIRECTIONS,
+    PieceType.ROOK: STRAIGHT_DIRECTIONS,
+    PieceType.QUEEN: STRAIGHT_DIRECTIONS + DIAGONAL_DIRECTIONS,
+}
+
+# Shared (row, col) tuples, indexed [row][col], and the same tuples by square index row * 8 + col
+SQUARES = tuple(tuple((row, col) for col in range(BOARD_SIZE)) for row in range(BOARD_SIZE))
+SQUARE_COORDS = tuple(square for squares in SQUARES for square in squares)
+
+def pack_move(from_index, to_index):
+    """Move code for two square indices: from square in bits 0-5, to square in bits 6-11"""
+    return from_index | to_index << 6
+
+# Integer move codes by [from_index][to_index] (pack_move, the low 12 bits of
+# notation.encode_move), so code & 63 is the from square and code >> 6 the
+# to square. Looking codes up here rather than computing them reuses the same
+# int objects, so generating moves into a buffer allocates nothing. No move
+# encodes as 0
+MOVE_CODES = tuple(tuple(pack_move(from_index, to_index) for to_index in range(BOARD_SIZE * BOARD_SIZE))
+                   for from_index in range(BOARD_SIZE * BOARD_SIZE))
+
+# Most pseudo-legal moves one piece can have (a queen in the middle of an empty board)
+MAX_PIECE_MOVES = 28
+
+def square_attackers(board, square, color, first_only=False):
+    """Pieces of the given color attacking square.
+
+    Sliders are only counted when nothing stands between them and the
+    square. With first_only the scan stops at the first attacker found,
+    which is all a check test needs.
+    """
+    row, col = square
+    attackers = []
+
+    # Knight attacks
+    for dr, dc in KNIGHT_OFFSETS:
+        r, c = row + dr, col + dc
+        if 0 <= r < BOARD_SIZE and 0 <= c < BOARD_SIZE:
+            piece = board[r][c]
+            if piece and piece.color == color and piece.type == PieceType.KNIGHT:
+                attackers.append(piece)
+                if first_only:
+                    return attackers
+
+    # Pawn attacks (white pawns capture towards row 0, so they attack from the row below)
+    r = row + 1 if color == Color.WHITE else row - 1
+    if 0 <= r < BOARD_SIZE:
+        for c in (col - 1, col + 1):
+            if 0 <= c < BOARD_SIZE:
+                piece = board[r][c]
+                if piece and piece.color == color and piece.type == PieceType.PAWN:
+                    attackers.append(piece)
+                    if first_only:
+                        return attackers
+
+    # Rook/Queen attacks (horizontal and vertical), then Bishop/Queen attacks (diagonal)
+    for directions, slider in ((STRAIGHT_DIRECTIONS, PieceType.ROOK), (DIAGONAL_DIRECTIONS, PieceType.BISHOP)):
+        for dr, dc in directions:
+            r, c = row + dr, col + dc
+            while 0 <= r < BOARD_SIZE and 0 <= c < BOARD_SIZE:
+                piece = board[r][c]
+                if piece:
+                    if piece.color == color and (piece.type == slider or piece.type == PieceType.QUEEN):
+                        attackers.append(piece)
+                        if first_only:
+                            return attackers
+                    break
+                r += dr
+                c += dc
+
+    # King attacks (for adjacent kings)
+    for dr, dc in KING_OFFSETS:
+        r, c = row + dr, col + dc
+        if 0 <= r < BOARD_SIZE and 0 <= c < BOARD_SIZE:
+            piece = board[r][c]
+            if piece and piece.color == color and piece.type == PieceType.KING:
+                attackers.append(piece)
+                if first_only:
+                    return attackers
+
+    return attackers
+
+def is_square_attacked(board, row, col, color):
+    """Whether a piece of the given color attacks (row, col); square_attackers without the list"""
+    for dr, dc in KNIGHT_OFFSETS:
+        r = row + dr
+        c = col + dc
+        if 0 <= r < BOARD_SIZE and 0 <= c < BOARD_SIZE:
+            piece = board[r][c]
+            if piece and piece.color == color and piece.type == PieceType.KNIGHT:
+                return True
+
+    r = row + 1 if color == Color.WHITE else row - 1
+    if 0 <= r < BOARD_SIZE:
+        if col > 0:
+            piece = board[r][col - 1]
+            if piece and piece.color == color and piece.type == PieceType.PAWN:
+                return True
+        if col < BOARD_SIZE - 1:
+            piece = board[r][col + 1]
+            if piece and piece.color == color and piece.type == PieceType.PAWN:
+                return True
+
+    for dr, dc in STRAIGHT_DIRECTIONS:
+        r = row + dr
+        c = col + dc
+        while 0 <= r < BOARD_SIZE and 0 <= c < BOARD_SIZE:
+            piece = board[r][c]
+            if piece:
+                if piece.color == color and (piece.type == PieceType.ROOK or piece.type == PieceType.QUEEN):
+                    return True
+                break
+            r += dr
+            c += dc
+
+    for dr, dc in DIAGONAL_DIRECTIONS:
+        r = row + dr
+        c = col + dc
+        while 0 <= r < BOARD_SIZE and 0 <= c < BOARD_SIZE:
+            piece = board[r][c]
+            if piece:
+                if piece.color == color and (piece.type == PieceType.BISHOP or piece.type == PieceType.QUEEN):
+                    return True
+                break
+            r += dr
+            c += dc
+
+    for dr, dc in KING_OFFSETS:
+        r = row + dr
+        c = col + dc
+        if 0 <= r < BOARD_SIZE and 0 <= c < BOARD_SIZE:
+            piece = board[r][c]
+            if piece and piece.color == color and piece.type == PieceType.KING:
+                return True
+
+    return False
+
+def least_valuable_attacker(board, row, col, color, order):
+    """The first attacker of (row, col) of the given color, trying piece types in order.
+
+    Pass the piece types cheapest first to get the least valuable attacker.
+    Like square_attackers it ignores pins; unlike it, nothing is allocated.
+    """
+    for piece_type in order:
+        if piece_type == PieceType.PAWN:
+            r = row + 1 if color == Color.WHITE else row - 1
+            if 0 <= r < BOARD_SIZE:
+                if col > 0:
+                    piece = board[r][col - 1]
+                    if piece and piece.color == color and piece.type == PieceType.PAWN:
+                        return piece
+                if col < BOARD_SIZE - 1:
+                    piece = board[r][col + 1]
+                    if piece and piece.color == color and piece.type == PieceType.PAWN:
+                        return piece
+        elif piece_type == PieceType.KNIGHT or piece_type == PieceType.KING:
+            for dr, dc in (KNIGHT_OFFSETS if piece_type == PieceType.KNIGHT else KING_OFFSETS):
+                r = row + dr
+                c = col + dc
+                if 0 <= r < BOARD_SIZE and 0 <= c < BOARD_SIZE:
+                    piece = board[r][c]
+                    if piece and piece.color == color and piece.type == piece_type:
+                        return piece
+        else:
+            for dr, dc in SLIDER_DIRECTIONS[piece_type]:
+                r = row + dr
+                c = col + dc
+                while 0 <= r < BOARD_SIZE and 0 <= c < BOARD_SIZE:
+                    piece = board[r][c]
+                    if piece:
+                        if piece.color == color and piece.type == piece_type:
+                            return piece
+                        break
+                    r += dr
+                    c += dc
+    return None
+
+class Piece:
+    def __init__(self, chess_piece_type, piece_color, board_position):
+        self.type = chess_piece_type
+        self.color = piece_color
+        self.position = board_position
+        self.has_moved = False
+        self.image_key = f"{piece_color.value}{chess_piece_type.value}"
+
+    def get_possible_moves(self, chess_board, previous_move=None, validate_check=True, captures_only=False):
+        buffer = [0] * MAX_PIECE_MOVES
+        count = self.generate_moves(chess_board, previous_move, buffer, 0, quiets=not captures_only)
+        available_moves = []
+        for index in range(count):
+            move = SQUARE_COORDS[buffer[index] >> 6]
+            if not validate_check or not self.move_would_cause_check(chess_board, move):
+                available_moves.append(move)
+        return available_moves
+
+    def generate_moves(self, board, previous_move, buffer, count, captures=True, quiets=True):
+        """Write the codes (MOVE_CODES) of this piece's pseudo-legal moves into buffer.
+
+        Moves go in from buffer[count] on and the new count is returned.
+        En passant counts as a capture and castling as a quiet move. Nothing
+        is allocated, so the search can call this at every node.
+        """
+        row, col = self.position
+        codes = MOVE_CODES[row * BOARD_SIZE + col]
+        color = self.color
+        piece_type = self.type
+
+        if piece_type == PieceType.PAWN:
+            step = -1 if color == Color.WHITE else 1
+            r = row + step
+            if not 0 <= r < BOARD_SIZE:
+                return count
+            if quiets and board[r][col] is None:
+                buffer[count] = codes[r * BOARD_SIZE + col]
+                count += 1
+                if row == (6 if color == Color.WHITE else 1) and board[r + step][col] is None:
+                    buffer[count] = codes[(r + step) * BOARD_SIZE + col]
+                    count += 1
+            if captures:
+                if col > 0:
+                    target = board[r][col - 1]
+                    if target and target.color != color:
+                        buffer[count] = codes[r * BOARD_SIZE + col - 1]
+                        count += 1
+                if col < BOARD_SIZE - 1:
+                    target = board[r][col + 1]
+                    if target and target.color != color:
+                        buffer[count] = codes[r * BOARD_SIZE + col + 1]
+                        count += 1
+                if previous_move and previous_move['piece'].type == PieceType.PAWN:
+                    last_from_row, _ = previous_move['from']
+                    last_to_row, last_to_col = previous_move['to']
+                    if abs(last_from_row - last_to_row) == 2 and row == last_to_row and abs(col - last_to_col) == 1:
+                        buffer[count] = codes[r * BOARD_SIZE + last_to_col]
+                        count += 1
+            return count
+
+        if piece_type == PieceType.KNIGHT or piece_type == PieceType.KING:
+            for dr, dc in (KNIGHT_OFFSETS if piece_type == PieceType.KNIGHT else KING_OFFSETS):
+                r = row + dr
+                c = col + dc
+                if 0 <= r < BOARD_SIZE and 0 <= c < BOARD_SIZE:
+                    target = board[r][c]
+                    if target is None:
+                        if quiets:
+                            buffer[count] = codes[r * BOARD_SIZE + c]
+                            count += 1
+                    elif captures and target.color != color:
+                        buffer[count] = codes[r * BOARD_SIZE + c]
+                        count += 1
+            if piece_type == PieceType.KING and quiets and not self.has_moved and not self.is_in_check(board):
+                count = self.generate_castling(board, buffer, count)
+            return count
+
+        for dr, dc in SLIDER_DIRECTIONS[piece_type]:
+            r = row + dr
+            c = col + dc
+            while 0 <= r < BOARD_SIZE and 0 <= c < BOARD_SIZE:
+                target = board[r][c]
+                if target is None:
+                    if quiets:
+                        buffer[count] = codes[r * BOARD_SIZE + c]
+                        count += 1
+                else:
+                    if captures and target.color != color:
+                        buffer[count] = codes[r * BOARD_SIZE + c]
+                        count += 1
+                    break
+                r += dr
+                c += dc
+        return count
+
+    def generate_castling(self, board, buffer, count):
+        """Add the castling moves of an unmoved king that is not in check"""
+        row, col = self.position
+        codes = MOVE_CODES[row * BOARD_SIZE + col]
+        back_rank = board[row]
+
+        rook = back_rank[col + 3] if col + 3 < BOARD_SIZE else None
+        if rook is not None and rook.type == PieceType.ROOK and not rook.has_moved and \
+           back_rank[col + 1] is None and back_rank[col + 2] is None:
+            if not self.would_be_in_check(board, SQUARES[row][col + 1]) and \
+               not self.would_be_in_check(board, SQUARES[row][col + 2]):
+                buffer[count] = codes[row * BOARD_SIZE + col + 2]
+                count += 1
+
+        rook = back_rank[col - 4] if col - 4 >= 0 else None
+        if rook is not None and rook.type == PieceType.ROOK and not rook.has_moved and \
+           back_rank[col - 1] is None and back_rank[col - 2] is None and back_rank[col - 3] is None:
+            if not self.would_be_in_check(board, SQUARES[row][col - 1]) and \
+               not self.would_be_in_check(board, SQUARES[row][col - 2]):
+                buffer[count] = codes[row * BOARD_SIZE + col - 2]
+                count += 1
+        return count
+
+    def move_would_cause_check(self, board, move, king=None):
+        """Whether making move would leave this side's king attacked.
+
+        The move is tried on the board itself and taken back before
+        returning. Pass the king when the caller already knows it to save
+        the board scan.
+        """
+        old_row, old_col = self.position
+        new_row, new_col = move
+
+        if self.type == PieceType.KING:
+            king_row, king_col = new_row, new_col
+        else:
+            if king is None:
+                for board_row in board:
+                    for piece in board_row:
+                        if piece and piece.type == PieceType.KING and piece.color == self.color:
+                            king = piece
+                            break
+                    if king:
+                        break
+                else:
+                    return False
+            king_row, king_col = king.position
+
+        # Make the move, remembering an en passant capture's pawn
+        captured = board[new_row][new_col]
+        passed_pawn = None
+        if self.type == PieceType.PAWN and old_col != new_col and captured is None:
+            passed_pawn = board[old_row][new_col]
+            board[old_row][new_col] = None
+        board[new_row][new_col] = self
+        board[old_row][old_col] = None
+
+        in_check = is_square_attacked(board, king_row, king_col, self.color.opposite)
+
+        board[old_row][old_col] = self
+        board[new_row][new_col] = captured
+        if passed_pawn is not None:
+            board[old_row][new_col] = passed_pawn
+        return in_check
+
+    def is_in_check(self, board):
+        # Only kings can be in check
+        if self.type != PieceType.KING:
+            return False
+        row, col = self.position
+        return is_square_attacked(board, row, col, self.color.opposite)
+
+    def would_be_in_check(self, board, position):
+        """Whether this king would be attacked on position (lifted off its own square meanwhile)"""
+        old_row, old_col = self.position
+        board[old_row][old_col] = None
+        in_check = is_square_attacked(board, position[0], position[1], self.color.opposite)
+        board[old_row][old_col] = self
+        return in_check
@@ -0,0 +1,477 @@
+"""
+Asyncio game server: many concurrent games over a local TCP socket.
+
+Clients speak newline-delimited JSON. Every request may carry an "id" that
+is echoed in the reply; state changes are pushed to every client watching
+a game as {"type": "state", ...} messages.
+
+    {"op": "new", "mode": "ai", "difficulty": "HARD", "ai_color": "b"}
+    {"op": "join", "game": 3}
+    {"op": "move", "game": 3, "move": "e2e4"}
+    {"op": "state", "game": 3}
+    {"op": "leave", "game": 3}
+    {"op": "resume", "game": 3}
+    {"op": "stats"}
+
+AI moves run on a bounded process pool so searches never block the event
+loop, and idle connections cost one coroutine each. A search that keeps
+failing is reported to the game's watchers as {"type": "error", "game": ...}
+and the AI's turn can be restarted with "resume".
+
+    python -m chess_engine.server --port 8765 --workers 4
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from .ai import MAX_SEARCH_DEPTH, AIDifficulty, ChessAI
+from .game import STARTING_FEN, GameState
+from .notation import parse_uci_move, search_move_to_uci
+from .pgn import game_result
+from .pieces import Color, PieceType
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+
+# Longest request line accepted from a client
+MAX_LINE_BYTES = 64 * 1024
+# Clients that stop reading are dropped once this much output is queued for them
+MAX_CLIENT_BUFFER = 1024 * 1024
+# Games nobody is watching are removed after this many idle seconds
+GAME_IDLE_SECONDS = 600
+# Tries at an AI move before giving up and telling the game's watchers
+AI_MOVE_ATTEMPTS = 3
+LATENCY_SAMPLES = 1000
+
+# Worker-process engines, one per difficulty, created on first use
+worker_ais = {}
+
+def choose_ai_move(task):
+    """Search one position in a worker; returns the UCI move or None"""
+    start_fen, moves, difficulty_name, movetime = task
+    game = GameState()
+    game.load_fen(start_fen, update_state=False)
+    for text in moves:
+        from_pos, to_pos, promotion = parse_uci_move(text)
+        game.move_piece(game.board[from_pos[0]][from_pos[1]], to_pos, promotion or PieceType.QUEEN,
+                        update_state=False)
+
+    ai = worker_ais.get(difficulty_name)
+    if ai is None:
+        ai = worker_ais[difficulty_name] = ChessAI(AIDifficulty[difficulty_name])
+    if movetime:
+        best = ai.search(game, max_depth=MAX_SEARCH_DEPTH, deadline=time.time() + movetime)
+    else:
+        best = ai.get_move(game)
+    if best is None:
+        return None
+    piece, target = best
+    return search_move_to_uci(piece, piece.position, target)
+
+class LatencyStats:
+    """Count, mean, max and percentiles over the most recent samples (seconds)"""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+        self.samples = deque(maxlen=LATENCY_SAMPLES)
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.maximum = max(self.maximum, seconds)
+        self.samples.append(seconds)
+
+    def percentile(self, fraction):
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    def summary(self):
+        """Milliseconds, rounded for display"""
+        mean = self.total / self.count if self.count else 0.0
+        return {
+            'count': self.count,
+            'mean_ms': round(mean * 1000, 2),
+            'p50_ms': round(self.percentile(0.5) * 1000, 2),
+            'p95_ms': round(self.percentile(0.95) * 1000, 2),
+            'max_ms': round(self.maximum * 1000, 2),
+        }
+
+class ServerGame:
+    """One game owned by the server and the clients watching it"""
+
+    def __init__(self, game_id, start_fen=STARTING_FEN, ai_color=None, difficulty=AIDifficulty.MEDIUM,
+                 movetime=None):
+        self.id = game_id
+        self.state = GameState()
+        self.state.load_fen(start_fen)
+        self.start_fen = self.state.start_fen
+        self.moves = []
+        self.ai_color = ai_color
+        self.difficulty = difficulty
+        self.movetime = movetime
+        self.ai_pending = False
+        self.watchers = set()
+        self.last_activity = time.monotonic()
+        self.move_latency = LatencyStats()
+        self.ai_latency = LatencyStats()
+
+    def ai_to_move(self):
+        return self.ai_color == self.state.turn and not self.state.game_over
+
+    def apply_move(self, text):
+        """Play a UCI move if it is legal; returns False otherwise"""
+        try:
+            from_pos, to_pos, promotion = parse_uci_move(text)
+        except ValueError:
+            return False
+        piece = self.state.board[from_pos[0]][from_pos[1]]
+        if not piece or piece.color != self.state.turn:
+            return False
+        if to_pos not in self.state.legal_moves_for(piece):
+            return False
+        self.state.move_piece(piece, to_pos, promotion or PieceType.QUEEN)
+        self.moves.append(text)
+        self.last_activity = time.monotonic()
+        return True
+
+    def status(self):
+        if self.state.checkmate:
+            return 'checkmate'
+        if self.state.stalemate:
+            return 'stalemate'
+        if self.state.draw_reason:
+            return 'draw'
+        return 'active'
+
+    def to_message(self):
+        return {
+            'type': 'state',
+            'game': self.id,
+            'fen': self.state.to_fen(),
+            'moves': self.moves,
+            'turn': self.state.turn.value,
+            'check': self.state.in_check,
+            'status': self.status(),
+            'result': game_result(self.state),
+            'ai_thinking': self.ai_pending,
+        }
+
+    def metrics(self):
+        return {
+            'moves': len(self.moves),
+            'watchers': len(self.watchers),
+            'move_latency': self.move_latency.summary(),
+            'ai_latency': self.ai_latency.summary(),
+        }
+
+class GameServer:
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, workers=None, max_pending_ai=None,
+                 game_idle_seconds=GAME_IDLE_SECONDS):
+        self.host = host
+        self.port = port
+        self.workers = workers or os.cpu_count()
+        # AI searches waiting for or running on the pool; more requests queue on the semaphore
+        self.max_pending_ai = max_pending_ai or self.workers * 4
+        self.game_idle_seconds = game_idle_seconds
+        self.games = {}
+        self.game_ids = itertools.count(1)
+        self.clients = {}
+        self.pool = None
+        self.ai_slots = None
+        self.server = None
+        self.sweeper = None
+        self.ai_tasks = set()
+        self.move_latency = LatencyStats()
+        self.ai_latency = LatencyStats()
+        self.started = time.monotonic()
+
+    async def start(self):
+        self.pool = ProcessPoolExecutor(self.workers)
+        self.ai_slots = asyncio.Semaphore(self.max_pending_ai)
+        self.server = await asyncio.start_server(self.handle_client, self.host, self.port,
+                                                 limit=MAX_LINE_BYTES)
+        # Port 0 asks the OS for a free port; report the real one
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.sweeper = asyncio.ensure_future(self.sweep_idle_games())
+        return self
+
+    async def serve_forever(self):
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def close(self):
+        self.sweeper.cancel()
+        self.server.close()
+        # Closing a transport ends its handler at the next read
+        connections = list(self.clients.values())
+        for writer in list(self.clients):
+            writer.close()
+        for task in self.ai_tasks:
+            task.cancel()
+        await asyncio.gather(*connections, *self.ai_tasks, return_exceptions=True)
+        await self.server.wait_closed()
+        self.pool.shutdown(cancel_futures=True)
+
+    async def handle_client(self, reader, writer):
+        self.clients[writer] = asyncio.current_task()
+        watching = set()
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (ValueError, asyncio.LimitOverrunError):
+                    self.send(writer, {'type': 'error', 'error': 'request too long'})
+                    break
+                if not line:
+                    break
+                received = time.monotonic()
+                request = None
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError("request must be a JSON object")
+                    reply = self.handle_request(request, writer, watching, received)
+                except (ValueError, KeyError, TypeError) as exc:
+                    reply = {'type': 'error', 'error': str(exc)}
+                    if isinstance(request, dict) and 'id' in request:
+                        reply['id'] = request['id']
+                if reply is not None:
+                    self.send(writer, reply)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.clients.pop(writer, None)
+            for game_id in watching:
+                game = self.games.get(game_id)
+                if game:
+                    game.watchers.discard(writer)
+            writer.close()
+
+    def handle_request(self, request, writer, watching, received):
+        op = request.get('op')
+        if op == 'new':
+            game = self.new_game(request)
+            game.watchers.add(writer)
+            watching.add(game.id)
+            reply = game.to_message()
+            reply['type'] = 'created'
+            self.schedule_ai(game)
+        elif op == 'join':
+            game = self.get_game(request)
+            game.watchers.add(writer)
+            watching.add(game.id)
+            reply = game.to_message()
+        elif op == 'leave':
+            game = self.get_game(request)
+            game.watchers.discard(writer)
+            watching.discard(game.id)
+            reply = {'type': 'left', 'game': game.id}
+        elif op == 'resume':
+            # Restart the AI's turn after its search failed
+            game = self.get_game(request)
+            self.schedule_ai(game)
+            reply = game.to_message()
+        elif op == 'state':
+            reply = self.get_game(request).to_message()
+        elif op == 'move':
+            game = self.get_game(request)
+            if game.ai_to_move() or game.ai_pending:
+                raise ValueError("not your turn")
+            if game.state.game_over:
+                raise ValueError("game is over")
+            if not game.apply_move(str(request['move'])):
+                raise ValueError(f"illegal move {request['move']!r}")
+            self.broadcast(game)
+            latency = time.monotonic() - received
+            game.move_latency.add(latency)
+            self.move_latency.add(latency)
+            self.schedule_ai(game)
+            reply = {'type': 'ok', 'game': game.id}
+        elif op == 'stats':
+            reply = {'type': 'stats', **self.metrics()}
+            if 'game' in request:
+                reply['game_metrics'] = self.get_game(request).metrics()
+        else:
+            raise ValueError(f"unknown op {op!r}")
+        if 'id' in request:
+            reply['id'] = request['id']
+        return reply
+
+    def new_game(self, request):
+        mode = request.get('mode', 'pvp')
+        if mode not in ('pvp', 'ai'):
+            raise ValueError(f"unknown mode {mode!r}")
+        ai_color = Color(request.get('ai_color', 'b')) if mode == 'ai' else None
+        difficulty = AIDifficulty[str(request.get('difficulty', 'MEDIUM')).upper()]
+        movetime = request.get('movetime')
+        game = ServerGame(next(self.game_ids), request.get('fen', STARTING_FEN), ai_color, difficulty,
+                          float(movetime) if movetime else None)
+        self.games[game.id] = game
+        return game
+
+    def get_game(self, request):
+        game = self.games.get(request['game'])
+        if game is None:
+            raise ValueError(f"no game {request['game']!r}")
+        return game
+
+    def schedule_ai(self, game):
+        if game.ai_to_move() and not game.ai_pending:
+            game.ai_pending = True
+            task = asyncio.ensure_future(self.play_ai_move(game))
+            self.ai_tasks.add(task)
+            task.add_done_callback(self.ai_tasks.discard)
+
+    async def play_ai_move(self, game):
+        queued = time.monotonic()
+        job = (game.start_fen, list(game.moves), game.difficulty.name, game.movetime)
+        error = None
+        try:
+            for _ in range(AI_MOVE_ATTEMPTS):
+                pool = self.pool
+                try:
+                    async with self.ai_slots:
+                        move = await asyncio.get_running_loop().run_in_executor(pool, choose_ai_move, job)
+                    error = None
+                    break
+                except Exception as exc:
+                    error = exc
+                    # A worker died; every later search would fail on this pool too
+                    if isinstance(exc, BrokenProcessPool) and self.pool is pool:
+                        self.pool = ProcessPoolExecutor(self.workers)
+                        pool.shutdown(wait=False)
+        finally:
+            game.ai_pending = False
+        if error is not None:
+            # The AI is still on move; 'resume' tries again
+            message = {'type': 'error', 'game': game.id,
+                       'error': f"AI move failed: {error!r}; send resume to retry"}
+            for writer in list(game.watchers):
+                self.send(writer, message)
+            self.broadcast(game)
+            return
+        latency = time.monotonic() - queued
+        game.ai_latency.add(latency)
+        self.ai_latency.add(latency)
+        if move is not None and game.id in self.games:
+            game.apply_move(move)
+        self.broadcast(game)
+
+    def broadcast(self, game):
+        data = (json.dumps(game.to_message()) + '\n').encode('utf-8')
+        for writer in list(game.watchers):
+            self.write(writer, data)
+
+    def send(self, writer, message):
+        self.write(writer, (json.dumps(message) + '\n').encode('utf-8'))
+
+    def write(self, writer, data):
+        if writer.is_closing():
+            return
+        if writer.transport.get_write_buffer_size() > MAX_CLIENT_BUFFER:
+            # The client is not reading its updates
+            writer.close()
+            return
+        writer.write(data)
+
+    async def sweep_idle_games(self):
+        while True:
+            await asyncio.sleep(min(60, self.game_idle_seconds))
+            cutoff = time.monotonic() - self.game_idle_seconds
+            for game_id, game in list(self.games.items()):
+                if not game.watchers and not game.ai_pending and game.last_activity < cutoff:
+                    del self.games[game_id]
+
+    def metrics(self):
+        return {
+            'uptime': round(time.monotonic() - self.started, 1),
+            'connections': len(self.clients),
+            'games': len(self.games),
+            'ai_in_flight': len(self.ai_tasks),
+            'move_latency': self.move_latency.summary(),
+            'ai_latency': self.ai_latency.summary(),
+        }
+
+class GameClient:
+    """Minimal asyncio client; replies resolve request() calls, pushed states go to .updates"""
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.request_ids = itertools.count(1)
+        self.waiting = {}
+        self.updates = asyncio.Queue()
+        self.receiver = asyncio.ensure_future(self.receive())
+
+    @classmethod
+    async def connect(cls, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        reader, writer = await asyncio.open_connection(host, port, limit=MAX_LINE_BYTES)
+        return cls(reader, writer)
+
+    async def receive(self):
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                break
+            message = json.loads(line)
+            future = self.waiting.pop(message.get('id'), None)
+            if future is not None:
+                future.set_result(message)
+            else:
+                await self.updates.put(message)
+        for future in self.waiting.values():
+            future.set_exception(ConnectionError("server closed the connection"))
+
+    async def request(self, op, **fields):
+        request_id = next(self.request_ids)
+        future = asyncio.get_running_loop().create_future()
+        self.waiting[request_id] = future
+        self.writer.write((json.dumps({'op': op, 'id': request_id, **fields}) + '\n').encode('utf-8'))
+        await self.writer.drain()
+        return await future
+
+    async def wait_for_state(self, game_id, predicate=lambda message: True):
+        """Next pushed state of a game that satisfies predicate"""
+        while True:
+            message = await self.updates.get()
+            if message.get('type') == 'state' and message['game'] == game_id and predicate(message):
+                return message
+
+    async def close(self):
+        self.receiver.cancel()
+        self.writer.close()
+        await self.writer.wait_closed()
+
+async def run_server(host, port, workers):
+    server = await GameServer(host, port, workers).start()
+    print(f"chess server listening on {server.host}:{server.port}", flush=True)
+    try:
+        await server.serve_forever()
+    finally:
+        await server.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve many chess games over local TCP (JSON lines)")
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--workers', type=int, default=None, help="AI worker processes (default: all cores)")
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(run_server(args.host, args.port, args.workers))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
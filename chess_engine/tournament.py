@@ -0,0 +1,292 @@
+"""
+Headless engine-vs-engine tournament runner.
+
+Plays two ChessAI configurations against each other from a set of opening
+positions, each opening twice with colors reversed, on a process pool with
+one worker per core. Writes every game to a PGN file and prints the
+win/draw/loss record with an Elo difference and 95% error bars.
+
+    python -m chess_engine.tournament MEDIUM HARD --games 200 --pgn medium_vs_hard.pgn
+    python -m chess_engine.tournament fast:difficulty=HARD:movetime=0.1 HARD --openings book.epd
+    python -m chess_engine.tournament small:difficulty=EXPERT:nodes=5000 EXPERT
+"""
+
+import argparse
+import datetime
+import math
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+from .ai import MAX_SEARCH_DEPTH, AIDifficulty, ChessAI
+from .game import STARTING_FEN, GameState
+from .notation import parse_uci_move
+from .pgn import format_game, move_to_san
+from .pieces import Color, PieceType
+
+# Games still running after this many plies are adjudicated as draws
+DEFAULT_MAX_PLIES = 300
+# Error bounds are clamped this far inside (0, 1), where the Elo difference is finite
+SCORE_BOUND_MARGIN = 1e-6
+
+# Short, balanced opening lines (UCI moves from the starting position)
+OPENING_LINES = [
+    "e2e4 e7e5 g1f3 b8c6 f1b5",
+    "e2e4 e7e5 g1f3 b8c6 f1c4",
+    "e2e4 c7c5 g1f3 d7d6",
+    "e2e4 c7c5 b1c3 b8c6",
+    "e2e4 e7e6 d2d4 d7d5",
+    "e2e4 c7c6 d2d4 d7d5",
+    "e2e4 d7d5 e4d5 d8d5",
+    "d2d4 d7d5 c2c4 e7e6",
+    "d2d4 d7d5 c2c4 c7c6",
+    "d2d4 g8f6 c2c4 g7g6",
+    "d2d4 g8f6 c2c4 e7e6 g1f3",
+    "d2d4 f7f5 g2g3 g8f6",
+    "c2c4 e7e5 b1c3 g8f6",
+    "c2c4 c7c5 g1f3 b8c6",
+    "g1f3 d7d5 g2g3 g8f6",
+    "e2e4 g7g6 d2d4 f8g7",
+]
+
+class EngineConfig:
+    """One tournament participant: a named ChessAI setup"""
+
+    def __init__(self, name, difficulty=AIDifficulty.MEDIUM, depth=None, movetime=None, nodes=None):
+        self.name = name
+        self.difficulty = difficulty
+        self.depth = depth
+        self.movetime = movetime
+        self.nodes = nodes
+
+    @classmethod
+    def parse(cls, spec):
+        """Parse 'NAME[:key=value...]', e.g. 'HARD' or 'quick:difficulty=EXPERT:movetime=0.2:nodes=20000'"""
+        name, *options = spec.split(':')
+        config = cls(name)
+        if name.upper() in AIDifficulty.__members__:
+            config.difficulty = AIDifficulty[name.upper()]
+        for option in options:
+            key, _, value = option.partition('=')
+            if key == 'difficulty':
+                config.difficulty = AIDifficulty[value.upper()]
+            elif key == 'depth':
+                config.depth = int(value)
+            elif key == 'movetime':
+                config.movetime = float(value)
+            elif key == 'nodes':
+                config.nodes = int(value)
+            else:
+                raise ValueError(f"Unknown engine option {key!r} in {spec!r}")
+        return config
+
+    def create_ai(self):
+        return ChessAI(self.difficulty)
+
+    def choose_move(self, ai, game):
+        if self.depth is None and self.movetime is None and self.nodes is None:
+            return ai.get_move(game)
+        deadline = time.time() + self.movetime if self.movetime else None
+        return ai.search(game, max_depth=self.depth or MAX_SEARCH_DEPTH, deadline=deadline, node_limit=self.nodes)
+
+def load_openings(path=None):
+    """Opening tasks as (fen, [uci moves]); from a FEN/EPD file (one per line) or the built-in lines"""
+    if path is None:
+        return [(STARTING_FEN, line.split()) for line in OPENING_LINES]
+    openings = []
+    with open(path) as opening_file:
+        for line in opening_file:
+            fields = line.split(';')[0].split()
+            if len(fields) < 4:
+                continue
+            # EPD lines carry no move counters
+            if len(fields) < 6 or not fields[4].isdigit():
+                fields = fields[:4] + ['0', '1']
+            openings.append((' '.join(fields[:6]), []))
+    return openings
+
+def play_game(task):
+    """Play one game in a worker process; returns a result dict"""
+    game_index, fen, opening_moves, white, black, max_plies, seed = task
+    random.seed(seed)
+
+    game = GameState()
+    game.load_fen(fen)
+    engines = {Color.WHITE: (white, white.create_ai()), Color.BLACK: (black, black.create_ai())}
+    first_move_number = game.fullmove_number
+    black_to_move = game.turn == Color.BLACK
+    san_moves = []
+
+    for text in opening_moves:
+        from_pos, to_pos, promotion = parse_uci_move(text)
+        piece = game.board[from_pos[0]][from_pos[1]]
+        san_moves.append(move_to_san(game, piece, to_pos, promotion or PieceType.QUEEN))
+        game.move_piece(piece, to_pos, promotion or PieceType.QUEEN)
+
+    termination = 'normal'
+    while not game.game_over:
+        if len(san_moves) >= max_plies:
+            termination = 'adjudication'
+            break
+        config, ai = engines[game.turn]
+        choice = config.choose_move(ai, game)
+        if choice is None:
+            break
+        piece, target = choice
+        san_moves.append(move_to_san(game, piece, target))
+        game.move_piece(piece, target)
+
+    if game.checkmate:
+        result = '1-0' if game.winner == Color.WHITE else '0-1'
+    else:
+        result = '1/2-1/2'
+
+    return {
+        'index': game_index,
+        'fen': fen,
+        'white': white.name,
+        'black': black.name,
+        'result': result,
+        'termination': termination,
+        'san_moves': san_moves,
+        'first_move_number': first_move_number,
+        'black_to_move': black_to_move,
+    }
+
+def game_pgn(record, event):
+    headers = {
+        'Event': event,
+        'Site': 'chess_engine.tournament',
+        'Date': datetime.date.today().strftime('%Y.%m.%d'),
+        'Round': str(record['index'] + 1),
+        'White': record['white'],
+        'Black': record['black'],
+        'Termination': record['termination'],
+        'PlyCount': str(len(record['san_moves'])),
+    }
+    if record['fen'] != STARTING_FEN:
+        headers['SetUp'] = '1'
+        headers['FEN'] = record['fen']
+    return format_game(headers, record['san_moves'], record['result'],
+                       record['first_move_number'], record['black_to_move'])
+
+class MatchStats:
+    """Win/draw/loss record from the first engine's point of view"""
+
+    def __init__(self, first_name):
+        self.first_name = first_name
+        self.wins = 0
+        self.draws = 0
+        self.losses = 0
+
+    def add(self, record):
+        if record['result'] == '1/2-1/2':
+            self.draws += 1
+        elif (record['result'] == '1-0') == (record['white'] == self.first_name):
+            self.wins += 1
+        else:
+            self.losses += 1
+
+    @property
+    def games(self):
+        return self.wins + self.draws + self.losses
+
+    @property
+    def score(self):
+        return (self.wins + 0.5 * self.draws) / self.games if self.games else 0.5
+
+    def elo(self):
+        """(Elo difference, 95% error margin); (+/-inf, inf) when one side scored 100%"""
+        if not self.games:
+            return 0.0, 0.0
+        score = self.score
+        if score <= 0 or score >= 1:
+            return elo_difference(score), math.inf
+        variance = (self.wins * (1 - score) ** 2 + self.draws * (0.5 - score) ** 2 +
+                    self.losses * score ** 2) / self.games
+        margin = 1.96 * math.sqrt(variance / self.games)
+        upper = min(score + margin, 1 - SCORE_BOUND_MARGIN)
+        lower = max(score - margin, SCORE_BOUND_MARGIN)
+        return elo_difference(score), (elo_difference(upper) - elo_difference(lower)) / 2
+
+    def likelihood_of_superiority(self):
+        decisive = self.wins + self.losses
+        if not decisive:
+            return 0.5
+        return 0.5 * (1 + math.erf((self.wins - self.losses) / math.sqrt(2 * decisive)))
+
+    def summary(self):
+        elo, margin = self.elo()
+        return (f"Games: {self.games}  +{self.wins} ={self.draws} -{self.losses}  "
+                f"Score: {self.score:.1%}  Elo: {elo:+.1f} +/- {margin:.1f}  "
+                f"LOS: {self.likelihood_of_superiority():.1%}")
+
+def elo_difference(score):
+    if score <= 0:
+        return -math.inf
+    if score >= 1:
+        return math.inf
+    return -400 * math.log10(1 / score - 1)
+
+def build_tasks(first, second, openings, games, max_plies, seed):
+    """Each opening is played twice with colors reversed; openings repeat to reach games"""
+    tasks = []
+    for game_index in range(games):
+        fen, moves = openings[(game_index // 2) % len(openings)]
+        white, black = (first, second) if game_index % 2 == 0 else (second, first)
+        tasks.append((game_index, fen, moves, white, black, max_plies, seed + game_index))
+    return tasks
+
+def run_tournament(first, second, games=100, openings=None, pgn_path=None, workers=None,
+                   max_plies=DEFAULT_MAX_PLIES, seed=0, progress=None):
+    """Play the match on a process pool and return its MatchStats"""
+    openings = openings or load_openings()
+    tasks = build_tasks(first, second, openings, games, max_plies, seed)
+    stats = MatchStats(first.name)
+    event = f"{first.name} vs {second.name}"
+    pgn_file = open(pgn_path, 'w') if pgn_path else None
+    try:
+        with multiprocessing.Pool(processes=workers or os.cpu_count()) as pool:
+            # Games finish out of order; unordered results keep every core busy
+            for record in pool.imap_unordered(play_game, tasks, chunksize=1):
+                stats.add(record)
+                if pgn_file:
+                    pgn_file.write(game_pgn(record, event))
+                    pgn_file.flush()
+                if progress:
+                    progress(record, stats)
+    finally:
+        if pgn_file:
+            pgn_file.close()
+    return stats
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Play ChessAI configurations against each other")
+    parser.add_argument('first', help="engine spec, e.g. MEDIUM or new:difficulty=HARD:movetime=0.2")
+    parser.add_argument('second', help="engine spec for the opponent")
+    parser.add_argument('--games', type=int, default=100)
+    parser.add_argument('--openings', help="FEN/EPD file, one position per line (default: built-in lines)")
+    parser.add_argument('--pgn', help="write all games to this PGN file")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument('--max-plies', type=int, default=DEFAULT_MAX_PLIES)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    first = EngineConfig.parse(args.first)
+    second = EngineConfig.parse(args.second)
+    if first.name == second.name:
+        second.name += '-2'
+
+    def progress(record, stats):
+        print(f"Game {stats.games}/{args.games}: {record['white']} - {record['black']} "
+              f"{record['result']} ({record['termination']})  {stats.summary()}", file=sys.stderr)
+
+    start = time.time()
+    stats = run_tournament(first, second, args.games, load_openings(args.openings), args.pgn,
+                           args.workers, args.max_plies, args.seed, progress)
+    print(f"{first.name} vs {second.name}: {stats.summary()}  ({time.time() - start:.1f}s)")
+
+if __name__ == "__main__":
+    main()
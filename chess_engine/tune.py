@@ -0,0 +1,337 @@
+"""
+Texel-style tuning of the evaluation weights.
+
+The static evaluation is linear: every piece adds its material value plus
+a piece-square table entry (negated for the side not to move). Labeled
+positions are turned into piece-square indices once and stored as a NumPy
+array; fitting then minimises the squared error between each game's result
+and a logistic function of the evaluation with full-batch gradient descent
+(Adam), entirely in vectorized NumPy. One pass over two million positions
+takes well under a second.
+
+    python -m chess_engine.tune extract features.npz selfplay.pgn more_games.pgn
+    python -m chess_engine.tune fit features.npz weights.json --epochs 400
+
+Positions come from PGN files (every position labeled with its game's
+result) or from EPD-style lines of "<fen> <result>" where the result is
+1-0, 0-1, 1/2-1/2 or a number between 0 and 1, optionally written as
+c9 "1-0"; or [0.5]. Self-play games from chess_engine.tournament work well.
+The weights file loads with ChessAI.load_evaluation.
+
+Requires NumPy (pip install numpy); the engine itself does not.
+"""
+
+import argparse
+import json
+import math
+import os
+import re
+import sys
+import time
+
+import numpy as np
+
+from .ai import EVALUATION_WEIGHTS_VERSION, AIDifficulty, ChessAI
+from .game import GameState
+from .pgn import read_games
+from .pieces import BOARD_SIZE, Color, PieceType
+
+# Feature layout: one table of 64 squares per piece type, in this order, for
+# white pieces, then the same for black pieces (whose weights are negated)
+TUNED_PIECE_TYPES = (PieceType.PAWN, PieceType.KNIGHT, PieceType.BISHOP,
+                     PieceType.ROOK, PieceType.QUEEN, PieceType.KING)
+SQUARES = BOARD_SIZE * BOARD_SIZE
+FEATURES = len(TUNED_PIECE_TYPES) * SQUARES
+# Padding slot for positions with fewer than 32 pieces; its weight is always 0
+PADDING_FEATURE = 2 * FEATURES
+MAX_PIECES = 32
+
+RESULT_SCORES = {'1-0': 1.0, '0-1': 0.0, '1/2-1/2': 0.5}
+EPD_RESULT_RE = re.compile(r'(?:c9\s+"?|\[)\s*(1-0|0-1|1/2-1/2|[01]?\.?\d+)\s*"?\]?;?\s*$')
+
+DEFAULT_SKIP_PLIES = 8
+# Positions per preallocated block while extracting features
+CHUNK_POSITIONS = 65536
+DEFAULT_EPOCHS = 300
+DEFAULT_LEARNING_RATE = 1.0
+REPORT_EVERY = 25
+
+def position_features(board):
+    """Feature index of every piece on the board, padded to MAX_PIECES"""
+    features = []
+    for row in range(BOARD_SIZE):
+        for col in range(BOARD_SIZE):
+            piece = board[row][col]
+            if piece is None:
+                continue
+            type_index = TUNED_PIECE_TYPES.index(piece.type)
+            if piece.color == Color.WHITE:
+                features.append(type_index * SQUARES + row * BOARD_SIZE + col)
+            else:
+                features.append(FEATURES + type_index * SQUARES + (BOARD_SIZE - 1 - row) * BOARD_SIZE + col)
+    return features + [PADDING_FEATURE] * (MAX_PIECES - len(features))
+
+def result_score(text):
+    if text in RESULT_SCORES:
+        return RESULT_SCORES[text]
+    value = float(text)
+    if not 0.0 <= value <= 1.0:
+        raise ValueError(f"Result {text!r} is not between 0 and 1")
+    return value
+
+def labeled_positions(path, skip_plies=DEFAULT_SKIP_PLIES):
+    """Yield (game, result for white) from a PGN or EPD file.
+
+    The same GameState is reused for every position, so consumers must
+    copy anything they keep.
+    """
+    if path.lower().endswith('.pgn'):
+        scratch = GameState()
+        for pgn_game in read_games(path):
+            if pgn_game.result not in RESULT_SCORES:
+                continue
+            result = RESULT_SCORES[pgn_game.result]
+            ply = 0
+            try:
+                for game, san, piece, target, promotion in pgn_game.replay(scratch):
+                    if ply >= skip_plies:
+                        yield game, result
+                    ply += 1
+            except ValueError:
+                # Keep the positions before the first unreadable move
+                continue
+            yield scratch, result
+        return
+
+    game = GameState()
+    with open(path) as positions_file:
+        for line in positions_file:
+            line = line.strip()
+            match = EPD_RESULT_RE.search(line)
+            if not match:
+                continue
+            fen = line[:match.start()].strip().rstrip(';')
+            fields = fen.split()
+            # EPD lines may leave out the move counters
+            if len(fields) == 4:
+                fen += ' 0 1'
+            try:
+                game.load_fen(fen, update_state=False)
+                result = result_score(match.group(1))
+            except ValueError:
+                continue
+            yield game, result
+
+class ChunkedArray:
+    """Rows appended one at a time into preallocated NumPy blocks.
+
+    A row kept as a Python list of ints costs several hundred bytes; in an
+    int16 block the 32 feature indices of a position take 64.
+    """
+
+    def __init__(self, row_shape=(), dtype=np.int16, chunk_rows=CHUNK_POSITIONS):
+        self.chunks = []
+        self.chunk = np.empty((chunk_rows,) + row_shape, dtype=dtype)
+        self.used = 0
+
+    def __len__(self):
+        return len(self.chunks) * len(self.chunk) + self.used
+
+    def append(self, row):
+        if self.used == len(self.chunk):
+            self.chunks.append(self.chunk)
+            self.chunk = np.empty_like(self.chunk)
+            self.used = 0
+        self.chunk[self.used] = row
+        self.used += 1
+
+    def array(self, transpose=False):
+        """All rows as one array, or as its contiguous transpose; the builder is emptied"""
+        shape = (len(self),) + self.chunk.shape[1:]
+        result = np.empty(shape[::-1] if transpose else shape, dtype=self.chunk.dtype)
+        rows = result.T if transpose else result
+        offset = 0
+        for chunk in self.chunks + [self.chunk[:self.used]]:
+            rows[offset:offset + len(chunk)] = chunk
+            offset += len(chunk)
+        self.chunks = []
+        self.used = 0
+        return result
+
+def extract_features(paths, skip_plies=DEFAULT_SKIP_PLIES, log=None):
+    """Feature arrays for every labeled position in paths.
+
+    Returns (features, results): an int16 (32, N) array whose column n
+    holds the feature indices of position n, and float32 results from
+    white's point of view. Storing one row per piece slot keeps every
+    gather and scatter in tune() on a contiguous array.
+    """
+    rows = ChunkedArray((MAX_PIECES,))
+    results = ChunkedArray(dtype=np.float32)
+    start = time.time()
+    for path in paths:
+        for game, result in labeled_positions(path, skip_plies):
+            rows.append(position_features(game.board))
+            results.append(result)
+            if log and len(results) % 100000 == 0:
+                print(f"{len(results)} positions ({len(results) / (time.time() - start):.0f}/s)", file=log)
+    return rows.array(transpose=True), results.array()
+
+def save_features(path, features, results):
+    np.savez(path, features=features, results=results)
+
+def load_features(path):
+    with np.load(path) as data:
+        return data['features'], data['results']
+
+def initial_weights(ai=None):
+    """(material, tables) as float arrays from a ChessAI's current evaluation"""
+    ai = ai or ChessAI(AIDifficulty.MEDIUM)
+    material = np.array([ai.piece_values[piece_type] for piece_type in TUNED_PIECE_TYPES], dtype=np.float64)
+    tables = np.array([ai.position_values[piece_type] for piece_type in TUNED_PIECE_TYPES],
+                      dtype=np.float64).reshape(len(TUNED_PIECE_TYPES), SQUARES)
+    return material, tables
+
+def evaluate(material, tables, features):
+    """White-relative evaluations of every position"""
+    white = (material[:, None] + tables).ravel()
+    weights = np.concatenate([white, -white, [0.0]])
+    evaluations = np.zeros(features.shape[1])
+    for slot in features:
+        evaluations += weights[slot]
+    return evaluations
+
+def win_probability(evaluations, scale):
+    # Evaluations are in tenths of a pawn; scale 1 means 4 pawns is 10:1 odds
+    return 1.0 / (1.0 + np.power(10.0, -scale * evaluations / 40.0))
+
+def mean_squared_error(evaluations, results, scale):
+    return float(np.mean((results - win_probability(evaluations, scale)) ** 2))
+
+def fit_scale(evaluations, results):
+    """Logistic scale that best maps the starting evaluation to results (golden section search)"""
+    low, high = 0.01, 10.0
+    ratio = (math.sqrt(5) - 1) / 2
+    for _ in range(40):
+        left = high - ratio * (high - low)
+        right = low + ratio * (high - low)
+        if mean_squared_error(evaluations, results, left) < mean_squared_error(evaluations, results, right):
+            high = right
+        else:
+            low = left
+    return (low + high) / 2
+
+def tune(features, results, material, tables, epochs=DEFAULT_EPOCHS,
+         learning_rate=DEFAULT_LEARNING_RATE, scale=None, log=None):
+    """Fit material values and piece-square tables to game results.
+
+    Returns (material, tables, scale, error). The king's material value
+    is fixed (both sides always have one, so results say nothing about it)
+    and table entries no position uses keep their starting value.
+    """
+    material = material.astype(np.float64)
+    tables = tables.astype(np.float64)
+    results = results.astype(np.float64)
+    if scale is None:
+        scale = fit_scale(evaluate(material, tables, features), results)
+    if log:
+        starting_error = mean_squared_error(evaluate(material, tables, features), results, scale)
+        print(f"scale {scale:.3f}, starting error {starting_error:.6f}", file=log)
+
+    king = TUNED_PIECE_TYPES.index(PieceType.KING)
+    parameters = np.concatenate([material, tables.ravel()])
+    first_moment = np.zeros_like(parameters)
+    second_moment = np.zeros_like(parameters)
+    beta1, beta2, epsilon = 0.9, 0.999, 1e-8
+    slope = scale * math.log(10) / 40.0
+
+    error = None
+    for epoch in range(1, epochs + 1):
+        material = parameters[:len(TUNED_PIECE_TYPES)]
+        tables = parameters[len(TUNED_PIECE_TYPES):].reshape(len(TUNED_PIECE_TYPES), SQUARES)
+        probabilities = win_probability(evaluate(material, tables, features), scale)
+        residuals = probabilities - results
+        error = float(np.mean(residuals ** 2))
+
+        # d error / d evaluation for each position, spread over its features
+        position_gradients = 2.0 * residuals * probabilities * (1.0 - probabilities) * slope / len(results)
+        signed_gradients = np.zeros(PADDING_FEATURE + 1)
+        for slot in features:
+            signed_gradients += np.bincount(slot, weights=position_gradients, minlength=PADDING_FEATURE + 1)
+        feature_gradients = signed_gradients[:FEATURES] - signed_gradients[FEATURES:PADDING_FEATURE]
+        table_gradients = feature_gradients.reshape(len(TUNED_PIECE_TYPES), SQUARES)
+        material_gradients = table_gradients.sum(axis=1)
+        material_gradients[king] = 0.0
+        gradients = np.concatenate([material_gradients, feature_gradients])
+
+        first_moment = beta1 * first_moment + (1 - beta1) * gradients
+        second_moment = beta2 * second_moment + (1 - beta2) * gradients ** 2
+        corrected_first = first_moment / (1 - beta1 ** epoch)
+        corrected_second = second_moment / (1 - beta2 ** epoch)
+        parameters = parameters - learning_rate * corrected_first / (np.sqrt(corrected_second) + epsilon)
+
+        if log and (epoch % REPORT_EVERY == 0 or epoch == 1):
+            print(f"epoch {epoch}: error {error:.6f}", file=log)
+
+    material = parameters[:len(TUNED_PIECE_TYPES)]
+    tables = parameters[len(TUNED_PIECE_TYPES):].reshape(len(TUNED_PIECE_TYPES), SQUARES)
+    error = mean_squared_error(evaluate(material, tables, features), results, scale)
+    return material, tables, scale, error
+
+def save_weights(path, material, tables, scale=None, error=None, positions=None):
+    """Write rounded weights in the format ChessAI.load_evaluation reads"""
+    weights = {
+        'version': EVALUATION_WEIGHTS_VERSION,
+        'piece_values': {},
+        'position_values': {},
+        'scale': scale,
+        'error': error,
+        'positions': positions,
+    }
+    for type_index, piece_type in enumerate(TUNED_PIECE_TYPES):
+        weights['piece_values'][piece_type.value] = int(round(material[type_index]))
+        table = tables[type_index].reshape(BOARD_SIZE, BOARD_SIZE)
+        weights['position_values'][piece_type.value] = [[int(round(value)) for value in row] for row in table]
+    # Keep the tables readable: one rank per line
+    text = re.sub(r'\[\s+(-?\d+(?:,\s+-?\d+)*)\s+\]',
+                  lambda match: '[' + re.sub(r'\s+', ' ', match.group(1)) + ']', json.dumps(weights, indent=1))
+    with open(path + '.tmp', 'w') as weights_file:
+        weights_file.write(text + '\n')
+    os.replace(path + '.tmp', path)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tune the evaluation weights on labeled positions")
+    commands = parser.add_subparsers(dest='command', required=True)
+    extract = commands.add_parser('extract', help="turn labeled positions into a feature file")
+    extract.add_argument('features', help="output .npz file")
+    extract.add_argument('positions', nargs='+', help="PGN or EPD files")
+    extract.add_argument('--skip-plies', type=int, default=DEFAULT_SKIP_PLIES,
+                         help="opening plies of each PGN game to leave out")
+    fit = commands.add_parser('fit', help="optimise the weights on a feature file")
+    fit.add_argument('features', help=".npz file from extract")
+    fit.add_argument('weights', help="output JSON weights file")
+    fit.add_argument('--epochs', type=int, default=DEFAULT_EPOCHS)
+    fit.add_argument('--learning-rate', type=float, default=DEFAULT_LEARNING_RATE)
+    fit.add_argument('--scale', type=float, default=None, help="logistic scale (default: fitted)")
+    fit.add_argument('--start', default=None, help="weights file to start from (default: built-in tables)")
+    args = parser.parse_args(argv)
+
+    start = time.time()
+    if args.command == 'extract':
+        features, results = extract_features(args.positions, args.skip_plies, log=sys.stderr)
+        save_features(args.features, features, results)
+        print(f"{len(results)} positions ({time.time() - start:.1f}s)")
+        return
+
+    features, results = load_features(args.features)
+    ai = ChessAI(AIDifficulty.MEDIUM)
+    if args.start:
+        ai.load_evaluation(args.start)
+    material, tables = initial_weights(ai)
+    material, tables, scale, error = tune(features, results, material, tables, args.epochs,
+                                          args.learning_rate, args.scale, log=sys.stderr)
+    save_weights(args.weights, material, tables, scale, error, len(results))
+    print(f"{len(results)} positions, scale {scale:.3f}, error {error:.6f} ({time.time() - start:.1f}s)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+"""
+UCI (Universal Chess Interface) front end for ChessAI.
+
+Run with ``python -m chess_engine.uci`` and point a tournament manager or
+chess GUI at it. The search runs on a background thread so ``stop`` and
+``ponderhit`` are handled while it is thinking.
+"""
+
+import sys
+import threading
+import time
+
+from .ai import DEFAULT_HASH_MB, MATE_SCORE, MAX_SEARCH_DEPTH, AIDifficulty, ChessAI
+from .game import STARTING_FEN, GameState
+from .notation import parse_uci_move, search_move_to_uci
+from .pieces import Color, PieceType
+
+ENGINE_NAME = "Chess Master"
+ENGINE_AUTHOR = "jihad"
+
+# Time kept in reserve for move transmission and GUI overhead
+MOVE_OVERHEAD_SECONDS = 0.05
+DEFAULT_MOVES_TO_GO = 30
+
+GO_INTEGER_ARGS = ('wtime', 'btime', 'winc', 'binc', 'movestogo', 'depth', 'movetime', 'nodes', 'mate')
+
+class UCIEngine:
+    def __init__(self, output=None):
+        self.output = output or sys.stdout
+        self.output_lock = threading.Lock()
+        self.ai = ChessAI(AIDifficulty.EXPERT)
+        self.game = GameState()
+        self.position_fen = STARTING_FEN
+        self.position_moves = []
+        self.search_thread = None
+        self.stop_event = threading.Event()
+        self.waiting_for_stop = False
+        self.ponder_budget = None
+
+    def send(self, line):
+        with self.output_lock:
+            self.output.write(line + "\n")
+            self.output.flush()
+
+    def run(self, input_stream=None):
+        input_stream = input_stream or sys.stdin
+        for line in input_stream:
+            if not self.handle_command(line):
+                break
+        self.stop_search()
+
+    def handle_command(self, line):
+        """Handle one line of UCI input; returns False when the engine should quit"""
+        tokens = line.split()
+        if not tokens:
+            return True
+        command, args = tokens[0], tokens[1:]
+
+        if command == 'uci':
+            self.send(f"id name {ENGINE_NAME}")
+            self.send(f"id author {ENGINE_AUTHOR}")
+            self.send(f"option name Hash type spin default {DEFAULT_HASH_MB} min 1 max 1024")
+            # The search is single threaded (Python threads would only contend for the GIL)
+            self.send("option name Threads type spin default 1 min 1 max 1")
+            self.send("option name Ponder type check default false")
+            self.send("uciok")
+        elif command == 'isready':
+            self.send("readyok")
+        elif command == 'setoption':
+            self.set_option(args)
+        elif command == 'ucinewgame':
+            self.stop_search()
+            self.ai.clear_hash()
+            self.game = GameState()
+            self.position_fen = STARTING_FEN
+            self.position_moves = []
+        elif command == 'position':
+            self.stop_search()
+            self.set_position(args)
+        elif command == 'go':
+            self.stop_search()
+            self.go(args)
+        elif command == 'stop':
+            self.stop_search()
+        elif command == 'ponderhit':
+            self.ponderhit()
+        elif command == 'quit':
+            return False
+        return True
+
+    def set_option(self, args):
+        # setoption name <name> [value <value>]
+        if 'name' not in args:
+            return
+        name_start = args.index('name') + 1
+        value_index = args.index('value') if 'value' in args else len(args)
+        name = ' '.join(args[name_start:value_index]).lower()
+        value = ' '.join(args[value_index + 1:])
+
+        if name == 'hash':
+            try:
+                self.ai.set_hash_size(max(1, int(value)))
+            except ValueError:
+                self.send(f"info string invalid Hash value {value!r}")
+        elif name == 'threads':
+            if value.strip() != '1':
+                self.send("info string Threads is fixed at 1")
+
+    def set_position(self, args):
+        """position [startpos | fen <fen>] [moves <m1> <m2> ...]"""
+        if not args:
+            return
+        moves_index = args.index('moves') if 'moves' in args else len(args)
+        if args[0] == 'startpos':
+            fen = STARTING_FEN
+        elif args[0] == 'fen':
+            fen = ' '.join(args[1:moves_index])
+        else:
+            return
+        moves = args[moves_index + 1:]
+
+        # Reuse the current game when the new position only extends it, so
+        # long games do not replay every move on each 'position' command
+        if fen == self.position_fen and moves[:len(self.position_moves)] == self.position_moves:
+            new_moves = moves[len(self.position_moves):]
+        else:
+            try:
+                self.game.load_fen(fen)
+            except ValueError:
+                self.send(f"info string invalid fen {fen!r}")
+                return
+            self.position_fen = fen
+            self.position_moves = []
+            new_moves = moves
+
+        for text in new_moves:
+            if not self.apply_move(text):
+                self.send(f"info string illegal move {text}")
+                break
+            self.position_moves.append(text)
+
+    def apply_move(self, text):
+        try:
+            from_pos, to_pos, promotion = parse_uci_move(text)
+        except ValueError:
+            return False
+        piece = self.game.board[from_pos[0]][from_pos[1]]
+        if not piece or piece.color != self.game.turn:
+            return False
+        if to_pos not in self.game.legal_moves_for(piece):
+            return False
+        self.game.move_piece(piece, to_pos, promotion or PieceType.QUEEN)
+        return True
+
+    def go(self, args):
+        limits = {}
+        index = 0
+        while index < len(args):
+            token = args[index]
+            if token in GO_INTEGER_ARGS and index + 1 < len(args):
+                try:
+                    limits[token] = int(args[index + 1])
+                except ValueError:
+                    pass
+                index += 2
+                continue
+            limits[token] = True
+            index += 1
+
+        max_depth = limits.get('depth', MAX_SEARCH_DEPTH)
+        if 'mate' in limits:
+            max_depth = min(MAX_SEARCH_DEPTH, limits['mate'] * 2)
+        budget = self.time_budget(limits)
+
+        pondering = 'ponder' in limits
+        self.waiting_for_stop = pondering or 'infinite' in limits
+        self.ponder_budget = budget if pondering else None
+        deadline = None if self.waiting_for_stop or budget is None else time.time() + budget
+
+        self.stop_event = threading.Event()
+        self.search_thread = threading.Thread(
+            target=self.search_worker, args=(max_depth, deadline, limits.get('nodes')), daemon=True)
+        self.search_thread.start()
+
+    def time_budget(self, limits):
+        """Seconds to spend on this move, or None for no time limit"""
+        if 'movetime' in limits:
+            return max(0.001, limits['movetime'] / 1000 - MOVE_OVERHEAD_SECONDS)
+        white_to_move = self.game.turn == Color.WHITE
+        remaining = limits.get('wtime' if white_to_move else 'btime')
+        if remaining is None:
+            return None
+        increment = limits.get('winc' if white_to_move else 'binc', 0)
+        moves_to_go = limits.get('movestogo', DEFAULT_MOVES_TO_GO) or DEFAULT_MOVES_TO_GO
+        budget = remaining / moves_to_go + increment * 0.8
+        # Never plan to use more than half of what is left on the clock
+        budget = min(budget, remaining / 2)
+        return max(0.001, budget / 1000 - MOVE_OVERHEAD_SECONDS)
+
+    def search_worker(self, max_depth, deadline, node_limit=None):
+        best = self.ai.search(self.game, max_depth=max_depth, deadline=deadline,
+                              stop_event=self.stop_event, info_callback=self.send_info, node_limit=node_limit)
+
+        # In infinite and ponder mode bestmove may only be sent after stop/ponderhit
+        while self.waiting_for_stop and not self.stop_event.is_set():
+            self.stop_event.wait(0.01)
+
+        if best is None:
+            self.send("bestmove 0000")
+            return
+        piece, move = best
+        line = f"bestmove {search_move_to_uci(piece, piece.position, move)}"
+        pv = self.ai.last_pv
+        if len(pv) >= 2 and pv[0] == (piece.position, move):
+            line += f" ponder {self.format_pv(pv[:2])[1]}"
+        self.send(line)
+
+    def send_info(self, depth, score, nodes, elapsed, pv):
+        if abs(score) >= MATE_SCORE - MAX_SEARCH_DEPTH:
+            plies = MATE_SCORE - abs(score)
+            moves = (plies + 1) // 2
+            score_text = f"mate {moves if score > 0 else -moves}"
+        else:
+            # Evaluation units are tenths of a pawn
+            score_text = f"cp {int(score * 10)}"
+        nps = int(nodes / elapsed) if elapsed > 0 else 0
+        pv_text = ' '.join(self.format_pv(pv))
+        self.send(f"info depth {depth} score {score_text} nodes {nodes} nps {nps} "
+                  f"time {int(elapsed * 1000)} pv {pv_text}")
+
+    def format_pv(self, pv):
+        # Replay the variation to know which moves are pawn promotions
+        game = self.game.copy()
+        moves = []
+        for from_pos, to_pos in pv:
+            piece = game.board[from_pos[0]][from_pos[1]]
+            moves.append(search_move_to_uci(piece, from_pos, to_pos))
+            game.make_move(piece, to_pos)
+        return moves
+
+    def ponderhit(self):
+        # The opponent played the expected move: keep searching, now on our clock
+        if self.ponder_budget is not None:
+            self.ai.deadline = time.time() + self.ponder_budget
+        self.ponder_budget = None
+        self.waiting_for_stop = False
+
+    def stop_search(self):
+        if self.search_thread is not None:
+            self.waiting_for_stop = False
+            self.stop_event.set()
+            self.search_thread.join()
+            self.search_thread = None
+
+def main():
+    UCIEngine().run()
+
+if __name__ == "__main__":
+    main()
@@ -3,22 +3,43 @@ Made by jihad - Chess Game
 """
 
 import pygame
+import os
 import sys
-import random
-from enum import Enum
-from copy import deepcopy
 import time
 import math
+import threading
+from collections import OrderedDict
+
+from chess_engine import BOARD_SIZE, Color, PieceType, AIDifficulty, ChessAI, GameMode, GameState
+from chess_engine.ai import MATE_SCORE, MAX_SEARCH_DEPTH
+from chess_engine.cache import AnalysisCache
+from chess_engine.pgn import move_to_san
 
 pygame.init()
 
-BOARD_SIZE = 8
 SQUARE_SIZE = 80
 WINDOW_SIZE = BOARD_SIZE * SQUARE_SIZE + 20  
 SIDEBAR_WIDTH = 220  
 WINDOW_WIDTH = WINDOW_SIZE + SIDEBAR_WIDTH
 IMAGES = {}
 
+# Piece art is drawn once per square size and kept on disk as a single atlas.
+# Bump the version whenever create_piece_images changes so old atlases are redrawn.
+PIECE_ATLAS_VERSION = 1
+PIECE_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.piece_cache')
+# AI results kept across games and sessions
+ANALYSIS_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.analysis_cache')
+ATLAS_PIECE_TYPES = [PieceType.PAWN, PieceType.KNIGHT, PieceType.BISHOP, PieceType.ROOK, PieceType.QUEEN, PieceType.KING]
+ATLAS_COLORS = [Color.WHITE, Color.BLACK]
+
+# Render resources: fonts are loaded once, rendered text is memoized in a
+# bounded LRU and translucent overlays are allocated once and reused
+FONT_NAME = 'Times New Roman'
+TEXT_CACHE_SIZE = 256
+FONTS = {}
+TEXT_CACHE = OrderedDict()
+OVERLAYS = {}
+
 pure_white = (255, 255, 255)
 pure_black = (0, 0, 0)
 DARK_SQUARE = (181, 136, 99)
@@ -35,32 +56,61 @@ BORDER_COLOR = (101, 67, 33)
 GOLD = (255, 215, 0)
 SILVER = (192, 192, 192)
 
-# Piece colors
-class Color(Enum):
-    WHITE = 'w'
-    BLACK = 'b'
-    
-    @property
-    def opposite(self):
-        return Color.BLACK if self == Color.WHITE else Color.WHITE
+# Frame cap while something is moving on screen. When nothing is, the main loop
+# sleeps in pygame.event.wait() and wakes for input or every IDLE_WAIT_MS
+MAX_FPS = 60
+IDLE_WAIT_MS = 1000
+
+# Sidebar area holding the turn, mode, AI and move information
+INFO_PANEL_RECT = pygame.Rect(WINDOW_SIZE + 3, 340, SIDEBAR_WIDTH - 3, 190)
+# Sidebar area below it showing the background analysis (toggled with the A key)
+ANALYSIS_PANEL_RECT = pygame.Rect(WINDOW_SIZE + 3, 530, SIDEBAR_WIDTH - 3, WINDOW_SIZE - 530)
+ANALYSIS_LINES = 3
+# Posted by the analysis thread so the idle main loop wakes up to show new lines
+ANALYSIS_EVENT = pygame.USEREVENT + 1
+
+def get_font(size, bold=False):
+    """Load a font the first time it is asked for"""
+    key = (size, bold)
+    font = FONTS.get(key)
+    if font is None:
+        font = FONTS[key] = pygame.font.SysFont(FONT_NAME, size, bold=bold)
+    return font
 
-class PieceType(Enum):
-    KING = 'k'
-    QUEEN = 'q'
-    ROOK = 'r'
-    BISHOP = 'b'
-    KNIGHT = 'n'
-    PAWN = 'p'
+def render_text(text, size, color, bold=False):
+    """Rendered text surface, reused while it stays in the LRU cache"""
+    key = (text, size, color, bold)
+    surface = TEXT_CACHE.get(key)
+    if surface is not None:
+        TEXT_CACHE.move_to_end(key)
+        return surface
+    surface = get_font(size, bold).render(text, True, color)
+    TEXT_CACHE[key] = surface
+    if len(TEXT_CACHE) > TEXT_CACHE_SIZE:
+        TEXT_CACHE.popitem(last=False)
+    return surface
 
-class GameMode(Enum):
-    PLAYER_VS_PLAYER = 0
-    PLAYER_VS_AI = 1
+def get_overlay(name, size, fill_color):
+    """Translucent surface of the given size and color, allocated once"""
+    key = (name, size)
+    overlay = OVERLAYS.get(key)
+    if overlay is None:
+        overlay = OVERLAYS[key] = pygame.Surface(size, pygame.SRCALPHA)
+        overlay.fill(fill_color)
+    return overlay
 
-class AIDifficulty(Enum):
-    EASY = 1
-    MEDIUM = 2
-    HARD = 3
-    EXPERT = 4
+def clear_render_caches():
+    FONTS.clear()
+    TEXT_CACHE.clear()
+    OVERLAYS.clear()
+
+def button_theme():
+    """Colors a button is painted with; cached button surfaces are redrawn when they change"""
+    return (BUTTON_COLOR, BUTTON_HOVER, BORDER_COLOR, GOLD, TEXT_COLOR)
+
+def draw_buttons(surface, buttons):
+    """Blit several buttons in one batched call"""
+    surface.blits([(button.get_surface(), button.rect.topleft) for button in buttons], doreturn=False)
 
 class Button:
     def __init__(self, x_position, y_position, button_width, button_height, display_text, click_action=None):
@@ -68,41 +118,62 @@ class Button:
         self.text = display_text
         self.action = click_action
         self.hovered = False
+        self.surfaces = None
+        self.surfaces_key = None
+        
+    def cache_key(self):
+        return (self.text, self.rect.size, button_theme())
+        
+    def get_surface(self, hovered=None):
+        """Pre-rendered surface for the normal or hover state"""
+        if hovered is None:
+            hovered = self.hovered
+        key = self.cache_key()
+        if self.surfaces_key != key:
+            self.surfaces = (self.render_state(False), self.render_state(True))
+            self.surfaces_key = key
+        return self.surfaces[hovered]
         
     def draw(self, game_screen):
-        if self.hovered:
+        game_screen.blit(self.get_surface(), self.rect.topleft)
+        
+    def render_state(self, hovered):
+        # The gradient lines include their end pixel, so the button is one pixel wider than its rect
+        button_surface = pygame.Surface((self.rect.width + 1, self.rect.height))
+        button_rect = pygame.Rect(0, 0, self.rect.width, self.rect.height)
+        
+        if hovered:
             light_color = tuple(min(255, color_value + 30) for color_value in BUTTON_HOVER)
             dark_color = BUTTON_HOVER
         else:
             light_color = tuple(min(255, color_value + 20) for color_value in BUTTON_COLOR)
             dark_color = BUTTON_COLOR
         
-        for pixel_row in range(self.rect.height):
-            blend_ratio = pixel_row / self.rect.height
+        for pixel_row in range(button_rect.height):
+            blend_ratio = pixel_row / button_rect.height
             current_color = tuple(int(light_color[index] * (1 - blend_ratio) + dark_color[index] * blend_ratio) for index in range(3))
-            pygame.draw.line(game_screen, current_color, 
-                           (self.rect.left, self.rect.top + pixel_row), 
-                           (self.rect.right, self.rect.top + pixel_row))
+            pygame.draw.line(button_surface, current_color, 
+                           (button_rect.left, button_rect.top + pixel_row), 
+                           (button_rect.right, button_rect.top + pixel_row))
         
-        border_highlight = GOLD if self.hovered else BORDER_COLOR
-        pygame.draw.rect(game_screen, border_highlight, self.rect, 2)
+        border_highlight = GOLD if hovered else BORDER_COLOR
+        pygame.draw.rect(button_surface, border_highlight, button_rect, 2)
         
-        inner_highlight_rect = pygame.Rect(self.rect.left + 1, self.rect.top + 1, 
-                                self.rect.width - 2, self.rect.height - 2)
+        inner_highlight_rect = pygame.Rect(button_rect.left + 1, button_rect.top + 1, 
+                                button_rect.width - 2, button_rect.height - 2)
         bright_highlight_color = tuple(min(255, color_value + 40) for color_value in light_color)
-        pygame.draw.line(game_screen, bright_highlight_color, inner_highlight_rect.topleft, inner_highlight_rect.topright)
-        pygame.draw.line(game_screen, bright_highlight_color, inner_highlight_rect.topleft, inner_highlight_rect.bottomleft)
-        
-        button_font = pygame.font.SysFont('Times New Roman', 14, bold=True)
+        pygame.draw.line(button_surface, bright_highlight_color, inner_highlight_rect.topleft, inner_highlight_rect.topright)
+        pygame.draw.line(button_surface, bright_highlight_color, inner_highlight_rect.topleft, inner_highlight_rect.bottomleft)
         
-        text_shadow = button_font.render(self.text, True, (0, 0, 0, 100))
-        shadow_position = text_shadow.get_rect(center=(self.rect.centerx + 1, self.rect.centery + 1))
-        game_screen.blit(text_shadow, shadow_position)
+        text_shadow = render_text(self.text, 14, (0, 0, 0, 100), bold=True)
+        shadow_position = text_shadow.get_rect(center=(button_rect.centerx + 1, button_rect.centery + 1))
+        button_surface.blit(text_shadow, shadow_position)
         
-        text_highlight_color = GOLD if self.hovered else TEXT_COLOR
-        main_text_surface = button_font.render(self.text, True, text_highlight_color)
-        text_center_position = main_text_surface.get_rect(center=self.rect.center)
-        game_screen.blit(main_text_surface, text_center_position)
+        text_highlight_color = GOLD if hovered else TEXT_COLOR
+        main_text_surface = render_text(self.text, 14, text_highlight_color, bold=True)
+        text_center_position = main_text_surface.get_rect(center=button_rect.center)
+        button_surface.blit(main_text_surface, text_center_position)
+        return button_surface
         
     def check_hover(self, mouse_position):
         self.hovered = self.rect.collidepoint(mouse_position)
@@ -114,579 +185,66 @@ class Button:
                 return True
         return False
 
-class Piece:
-    def __init__(self, chess_piece_type, piece_color, board_position):
-        self.type = chess_piece_type
-        self.color = piece_color
-        self.position = board_position
-        self.has_moved = False
-        self.image_key = f"{piece_color.value}{chess_piece_type.value}"
-    
-    def get_possible_moves(self, chess_board, previous_move=None, validate_check=True):
-        current_row, current_col = self.position
-        available_moves = []
-        
-        if self.type == PieceType.PAWN:
-            move_direction = -1 if self.color == Color.WHITE else 1
-            
-            if 0 <= current_row + move_direction < BOARD_SIZE and chess_board[current_row + move_direction][current_col] is None:
-                available_moves.append((current_row + move_direction, current_col))
-                
-                if ((self.color == Color.WHITE and current_row == 6) or 
-                    (self.color == Color.BLACK and current_row == 1)) and \
-                   0 <= current_row + 2*move_direction < BOARD_SIZE and \
-                   chess_board[current_row + 2*move_direction][current_col] is None:
-                    available_moves.append((current_row + 2*move_direction, current_col))
-            
-            for column_offset in [-1, 1]:
-                if 0 <= current_row + move_direction < BOARD_SIZE and 0 <= current_col + column_offset < BOARD_SIZE:
-                    target_piece = chess_board[current_row + move_direction][current_col + column_offset]
-                    if target_piece and target_piece.color != self.color:
-                        available_moves.append((current_row + move_direction, current_col + column_offset))
-            
-            if previous_move and previous_move['piece'].type == PieceType.PAWN:
-                last_from_row, last_from_col = previous_move['from']
-                last_to_row, last_to_col = previous_move['to']
-                
-                if abs(last_from_row - last_to_row) == 2:
-                    if current_row == last_to_row and abs(current_col - last_to_col) == 1:
-                        available_moves.append((current_row + move_direction, last_to_col))
-        
-        elif self.type == PieceType.KNIGHT:
-            knight_moves = [
-                (current_row-2, current_col-1), (current_row-2, current_col+1),
-                (current_row-1, current_col-2), (current_row-1, current_col+2),
-                (current_row+1, current_col-2), (current_row+1, current_col+2),
-                (current_row+2, current_col-1), (current_row+2, current_col+1)
-            ]
-            
-            for move in knight_moves:
-                r, c = move
-                if 0 <= r < BOARD_SIZE and 0 <= c < BOARD_SIZE:
-                    if chess_board[r][c] is None or chess_board[r][c].color != self.color:
-                        available_moves.append(move)
-        
-        elif self.type == PieceType.BISHOP:
-            directions = [(-1, -1), (-1, 1), (1, -1), (1, 1)]
-            for dr, dc in directions:
-                for i in range(1, BOARD_SIZE):
-                    r, c = current_row + i*dr, current_col + i*dc
-                    if not (0 <= r < BOARD_SIZE and 0 <= c < BOARD_SIZE):
-                        break
-                    if chess_board[r][c] is None:
-                        available_moves.append((r, c))
-                    elif chess_board[r][c].color != self.color:
-                        available_moves.append((r, c))
-                        break
-                    else:
-                        break
-        
-        elif self.type == PieceType.ROOK:
-            directions = [(0, -1), (0, 1), (-1, 0), (1, 0)]
-            for dr, dc in directions:
-                for i in range(1, BOARD_SIZE):
-                    r, c = current_row + i*dr, current_col + i*dc
-                    if not (0 <= r < BOARD_SIZE and 0 <= c < BOARD_SIZE):
-                        break
-                    if chess_board[r][c] is None:
-                        available_moves.append((r, c))
-                    elif chess_board[r][c].color != self.color:
-                        available_moves.append((r, c))
-                        break
-                    else:
-                        break
-        
-        elif self.type == PieceType.QUEEN:
-            directions = [(0, -1), (0, 1), (-1, 0), (1, 0), (-1, -1), (-1, 1), (1, -1), (1, 1)]
-            for dr, dc in directions:
-                for i in range(1, BOARD_SIZE):
-                    r, c = current_row + i*dr, current_col + i*dc
-                    if not (0 <= r < BOARD_SIZE and 0 <= c < BOARD_SIZE):
-                        break
-                    if chess_board[r][c] is None:
-                        available_moves.append((r, c))
-                    elif chess_board[r][c].color != self.color:
-                        available_moves.append((r, c))
-                        break
-                    else:
-                        break
-        
-        elif self.type == PieceType.KING:
-            directions = [(0, -1), (0, 1), (-1, 0), (1, 0), (-1, -1), (-1, 1), (1, -1), (1, 1)]
-            for dr, dc in directions:
-                r, c = current_row + dr, current_col + dc
-                if 0 <= r < BOARD_SIZE and 0 <= c < BOARD_SIZE:
-                    if chess_board[r][c] is None or chess_board[r][c].color != self.color:
-                        available_moves.append((r, c))
-            
-            if not self.has_moved and not self.is_in_check(chess_board):
-                if current_col + 3 < BOARD_SIZE and chess_board[current_row][current_col+3] is not None and \
-                   chess_board[current_row][current_col+3].type == PieceType.ROOK and \
-                   not chess_board[current_row][current_col+3].has_moved and \
-                   chess_board[current_row][current_col+1] is None and chess_board[current_row][current_col+2] is None:
-                    if not self.would_be_in_check(chess_board, (current_row, current_col+1)) and \
-                       not self.would_be_in_check(chess_board, (current_row, current_col+2)):
-                        available_moves.append((current_row, current_col+2))
-                
-                if current_col - 4 >= 0 and chess_board[current_row][current_col-4] is not None and \
-                   chess_board[current_row][current_col-4].type == PieceType.ROOK and \
-                   not chess_board[current_row][current_col-4].has_moved and \
-                   chess_board[current_row][current_col-1] is None and chess_board[current_row][current_col-2] is None and \
-                   chess_board[current_row][current_col-3] is None:
-                    if not self.would_be_in_check(chess_board, (current_row, current_col-1)) and \
-                       not self.would_be_in_check(chess_board, (current_row, current_col-2)):
-                        available_moves.append((current_row, current_col-2))
-        
-        if validate_check:
-            legal_moves = []
-            for move in available_moves:
-                if not self.move_would_cause_check(chess_board, move):
-                    legal_moves.append(move)
-            return legal_moves
-        
-        return available_moves
-    
-    def move_would_cause_check(self, board, move):
-        # Create a copy of the board
-        board_copy = [row[:] for row in board]
-        
-        # Get the king
-        king = None
-        for r in range(BOARD_SIZE):
-            for c in range(BOARD_SIZE):
-                if board_copy[r][c] and board_copy[r][c].type == PieceType.KING and \
-                   board_copy[r][c].color == self.color:
-                    king = board_copy[r][c]
-                    break
-            if king:
-                break
-        
-        # Make the move on the copy
-        old_row, old_col = self.position
-        new_row, new_col = move
-        
-        # Handle en passant capture
-        captured_piece = board_copy[new_row][new_col]
-        if self.type == PieceType.PAWN and old_col != new_col and not captured_piece:
-            # This is an en passant capture
-            captured_piece = board_copy[old_row][new_col]
-            board_copy[old_row][new_col] = None
-        
-        # Move the piece
-        board_copy[new_row][new_col] = self
-        board_copy[old_row][old_col] = None
-        
-        # Update king position if we're moving the king
-        if self.type == PieceType.KING:
-            king.position = move
-        
-        # Check if the king is in check after the move
-        return king.is_in_check(board_copy)
-    
-    def is_in_check(self, board):
-        # Only kings can be in check
-        if self.type != PieceType.KING:
-            return False
-        
-        row, col = self.position
-        
-        # Check for attacks from each direction
-        
-        # Knight attacks
-        knight_moves = [
-            (row-2, col-1), (row-2, col+1),
-            (row-1, col-2), (row-1, col+2),
-            (row+1, col-2), (row+1, col+2),
-            (row+2, col-1), (row+2, col+1)
-        ]
-        
-        for r, c in knight_moves:
-            if 0 <= r < BOARD_SIZE and 0 <= c < BOARD_SIZE:
-                piece = board[r][c]
-                if piece and piece.color != self.color and piece.type == PieceType.KNIGHT:
-                    return True
-        
-        # Pawn attacks
-        pawn_direction = 1 if self.color == Color.WHITE else -1
-        for c_offset in [-1, 1]:
-            r, c = row + pawn_direction, col + c_offset
-            if 0 <= r < BOARD_SIZE and 0 <= c < BOARD_SIZE:
-                piece = board[r][c]
-                if piece and piece.color != self.color and piece.type == PieceType.PAWN:
-                    return True
-        
-        # Rook/Queen attacks (horizontal and vertical)
-        directions = [(0, -1), (0, 1), (-1, 0), (1, 0)]
-        for dr, dc in directions:
-            for i in range(1, BOARD_SIZE):
-                r, c = row + i*dr, col + i*dc
-                if not (0 <= r < BOARD_SIZE and 0 <= c < BOARD_SIZE):
-                    break
-                piece = board[r][c]
-                if piece:
-                    if piece.color != self.color and (piece.type == PieceType.ROOK or piece.type == PieceType.QUEEN):
-                        return True
-                    break
-        
-        # Bishop/Queen attacks (diagonal)
-        directions = [(-1, -1), (-1, 1), (1, -1), (1, 1)]
-        for dr, dc in directions:
-            for i in range(1, BOARD_SIZE):
-                r, c = row + i*dr, col + i*dc
-                if not (0 <= r < BOARD_SIZE and 0 <= c < BOARD_SIZE):
-                    break
-                piece = board[r][c]
-                if piece:
-                    if piece.color != self.color and (piece.type == PieceType.BISHOP or piece.type == PieceType.QUEEN):
-                        return True
-                    break
-        
-        # King attacks (for adjacent kings)
-        directions = [(0, -1), (0, 1), (-1, 0), (1, 0), (-1, -1), (-1, 1), (1, -1), (1, 1)]
-        for dr, dc in directions:
-            r, c = row + dr, col + dc
-            if 0 <= r < BOARD_SIZE and 0 <= c < BOARD_SIZE:
-                piece = board[r][c]
-                if piece and piece.color != self.color and piece.type == PieceType.KING:
-                    return True
-        
-        return False
-    
-    def would_be_in_check(self, board, position):
-        # Create a copy of the board
-        board_copy = [row[:] for row in board]
-        
-        # Move the king to the new position
-        old_row, old_col = self.position
-        new_row, new_col = position
-        
-        board_copy[new_row][new_col] = self
-        board_copy[old_row][old_col] = None
-        
-        # Create a temporary king at the new position
-        temp_king = Piece(PieceType.KING, self.color, position)
-        
-        # Check if the king would be in check
-        return temp_king.is_in_check(board_copy)
-
-class ChessAI:
-    def __init__(self, difficulty=AIDifficulty.MEDIUM):
-        self.difficulty = difficulty
-        self.piece_values = {
-            PieceType.PAWN: 10,
-            PieceType.KNIGHT: 30,
-            PieceType.BISHOP: 30,
-            PieceType.ROOK: 50,
-            PieceType.QUEEN: 90,
-            PieceType.KING: 900
-        }
-        
-        # Position evaluation tables to encourage good piece positioning
-        self.position_values = {
-            PieceType.PAWN: [
-                [0, 0, 0, 0, 0, 0, 0, 0],
-                [50, 50, 50, 50, 50, 50, 50, 50],
-                [10, 10, 20, 30, 30, 20, 10, 10],
-                [5, 5, 10, 25, 25, 10, 5, 5],
-                [0, 0, 0, 20, 20, 0, 0, 0],
-                [5, -5, -10, 0, 0, -10, -5, 5],
-                [5, 10, 10, -20, -20, 10, 10, 5],
-                [0, 0, 0, 0, 0, 0, 0, 0]
-            ],
-            PieceType.KNIGHT: [
-                [-50, -40, -30, -30, -30, -30, -40, -50],
-                [-40, -20, 0, 0, 0, 0, -20, -40],
-                [-30, 0, 10, 15, 15, 10, 0, -30],
-                [-30, 5, 15, 20, 20, 15, 5, -30],
-                [-30, 0, 15, 20, 20, 15, 0, -30],
-                [-30, 5, 10, 15, 15, 10, 5, -30],
-                [-40, -20, 0, 5, 5, 0, -20, -40],
-                [-50, -40, -30, -30, -30, -30, -40, -50]
-            ],
-            PieceType.BISHOP: [
-                [-20, -10, -10, -10, -10, -10, -10, -20],
-                [-10, 0, 0, 0, 0, 0, 0, -10],
-                [-10, 0, 10, 10, 10, 10, 0, -10],
-                [-10, 5, 5, 10, 10, 5, 5, -10],
-                [-10, 0, 5, 10, 10, 5, 0, -10],
-                [-10, 10, 10, 10, 10, 10, 10, -10],
-                [-10, 5, 0, 0, 0, 0, 5, -10],
-                [-20, -10, -10, -10, -10, -10, -10, -20]
-            ],
-            PieceType.ROOK: [
-                [0, 0, 0, 0, 0, 0, 0, 0],
-                [5, 10, 10, 10, 10, 10, 10, 5],
-                [-5, 0, 0, 0, 0, 0, 0, -5],
-                [-5, 0, 0, 0, 0, 0, 0, -5],
-                [-5, 0, 0, 0, 0, 0, 0, -5],
-                [-5, 0, 0, 0, 0, 0, 0, -5],
-                [-5, 0, 0, 0, 0, 0, 0, -5],
-                [0, 0, 0, 5, 5, 0, 0, 0]
-            ],
-            PieceType.QUEEN: [
-                [-20, -10, -10, -5, -5, -10, -10, -20],
-                [-10, 0, 0, 0, 0, 0, 0, -10],
-                [-10, 0, 5, 5, 5, 5, 0, -10],
-                [-5, 0, 5, 5, 5, 5, 0, -5],
-                [0, 0, 5, 5, 5, 5, 0, -5],
-                [-10, 5, 5, 5, 5, 5, 0, -10],
-                [-10, 0, 5, 0, 0, 0, 0, -10],
-                [-20, -10, -10, -5, -5, -10, -10, -20]
-            ],
-            PieceType.KING: [
-                [-30, -40, -40, -50, -50, -40, -40, -30],
-                [-30, -40, -40, -50, -50, -40, -40, -30],
-                [-30, -40, -40, -50, -50, -40, -40, -30],
-                [-30, -40, -40, -50, -50, -40, -40, -30],
-                [-20, -30, -30, -40, -40, -30, -30, -20],
-                [-10, -20, -20, -20, -20, -20, -20, -10],
-                [20, 20, 0, 0, 0, 0, 20, 20],
-                [20, 30, 10, 0, 0, 10, 30, 20]
-            ]
-        }
-    
-    def get_move(self, game):
-        # Make a deep copy of the game to avoid modifying the original
-        game_copy = deepcopy(game)
-        
-        # Get the depth based on difficulty
-        depth = self.difficulty.value
-        
-        # Get all possible moves for the AI
-        all_moves = []
-        for row in range(BOARD_SIZE):
-            for col in range(BOARD_SIZE):
-                piece = game_copy.board[row][col]
-                if piece and piece.color == game_copy.turn:
-                    moves = piece.get_possible_moves(game_copy.board, game_copy.last_move)
-                    for move in moves:
-                        all_moves.append((piece, move))
-        
-        if not all_moves:
-            return None
-        
-        # For easy difficulty, just make a random move
-        if self.difficulty == AIDifficulty.EASY:
-            return random.choice(all_moves)
-        
-        # For other difficulties, use minimax with alpha-beta pruning
-        best_score = float('-inf')
-        best_move = None
-        alpha = float('-inf')
-        beta = float('inf')
-        
-        for piece, move in all_moves:
-            # Make the move
-            old_row, old_col = piece.position
-            new_row, new_col = move
-            
-            # Save the state
-            captured_piece = game_copy.board[new_row][new_col]
-            
-            # Handle en passant capture
-            if piece.type == PieceType.PAWN and old_col != new_col and not captured_piece:
-                # This is an en passant capture
-                captured_piece = game_copy.board[old_row][new_col]
-                game_copy.board[old_row][new_col] = None
-            
-            # Move the piece
-            game_copy.board[new_row][new_col] = piece
-            game_copy.board[old_row][old_col] = None
-            piece.position = move
-            piece.has_moved = True
-            
-            # Update last move
-            last_move = {
-                'piece': piece,
-                'from': (old_row, old_col),
-                'to': move,
-                'captured': captured_piece
-            }
-            
-            # Switch turns
-            game_copy.turn = game_copy.turn.opposite
-            
-            # Evaluate the move
-            score = -self.minimax(game_copy, depth - 1, -beta, -alpha, False, last_move)
-            
-            # Restore the state
-            game_copy.board[old_row][old_col] = piece
-            game_copy.board[new_row][new_col] = captured_piece
-            if piece.type == PieceType.PAWN and old_col != new_col and not captured_piece:
-                game_copy.board[old_row][new_col] = last_move['captured']
-            piece.position = (old_row, old_col)
-            game_copy.turn = game_copy.turn.opposite
-            
-            if score > best_score:
-                best_score = score
-                best_move = (piece, move)
-            
-            alpha = max(alpha, score)
-            if alpha >= beta:
-                break
-        
-        return best_move
-    
-    def minimax(self, game, depth, alpha, beta, maximizing, last_move):
-        # If we've reached the maximum depth or the game is over, evaluate the board
-        if depth == 0 or game.is_game_over():
-            return self.evaluate_board(game)
-        
-        if maximizing:
-            max_eval = float('-inf')
-            for row in range(BOARD_SIZE):
-                for col in range(BOARD_SIZE):
-                    piece = game.board[row][col]
-                    if piece and piece.color == game.turn:
-                        moves = piece.get_possible_moves(game.board, last_move)
-                        for move in moves:
-                            # Make the move
-                            old_row, old_col = piece.position
-                            new_row, new_col = move
-                            
-                            # Save the state
-                            captured_piece = game.board[new_row][new_col]
-                            
-                            # Handle en passant capture
-                            if piece.type == PieceType.PAWN and old_col != new_col and not captured_piece:
-                                # This is an en passant capture
-                                captured_piece = game.board[old_row][new_col]
-                                game.board[old_row][new_col] = None
-                            
-                            # Move the piece
-                            game.board[new_row][new_col] = piece
-                            game.board[old_row][old_col] = None
-                            piece.position = move
-                            piece.has_moved = True
-                            
-                            # Update last move
-                            new_last_move = {
-                                'piece': piece,
-                                'from': (old_row, old_col),
-                                'to': move,
-                                'captured': captured_piece
-                            }
-                            
-                            # Switch turns
-                            game.turn = game.turn.opposite
-                            
-                            # Evaluate the move
-                            eval = self.minimax(game, depth - 1, alpha, beta, False, new_last_move)
-                            
-                            # Restore the state
-                            game.board[old_row][old_col] = piece
-                            game.board[new_row][new_col] = captured_piece
-                            if piece.type == PieceType.PAWN and old_col != new_col and not captured_piece:
-                                game.board[old_row][new_col] = new_last_move['captured']
-                            piece.position = (old_row, old_col)
-                            game.turn = game.turn.opposite
-                            
-                            max_eval = max(max_eval, eval)
-                            alpha = max(alpha, eval)
-                            if beta <= alpha:
-                                break
-            
-            return max_eval
-        else:
-            min_eval = float('inf')
-            for row in range(BOARD_SIZE):
-                for col in range(BOARD_SIZE):
-                    piece = game.board[row][col]
-                    if piece and piece.color == game.turn:
-                        moves = piece.get_possible_moves(game.board, last_move)
-                        for move in moves:
-                            # Make the move
-                            old_row, old_col = piece.position
-                            new_row, new_col = move
-                            
-                            # Save the state
-                            captured_piece = game.board[new_row][new_col]
-                            
-                            # Handle en passant capture
-                            if piece.type == PieceType.PAWN and old_col != new_col and not captured_piece:
-                                # This is an en passant capture
-                                captured_piece = game.board[old_row][new_col]
-                                game.board[old_row][new_col] = None
-                            
-                            # Move the piece
-                            game.board[new_row][new_col] = piece
-                            game.board[old_row][old_col] = None
-                            piece.position = move
-                            piece.has_moved = True
-                            
-                            # Update last move
-                            new_last_move = {
-                                'piece': piece,
-                                'from': (old_row, old_col),
-                                'to': move,
-                                'captured': captured_piece
-                            }
-                            
-                            # Switch turns
-                            game.turn = game.turn.opposite
-                            
-                            # Evaluate the move
-                            eval = self.minimax(game, depth - 1, alpha, beta, True, new_last_move)
-                            
-                            # Restore the state
-                            game.board[old_row][old_col] = piece
-                            game.board[new_row][new_col] = captured_piece
-                            if piece.type == PieceType.PAWN and old_col != new_col and not captured_piece:
-                                game.board[old_row][new_col] = new_last_move['captured']
-                            piece.position = (old_row, old_col)
-                            game.turn = game.turn.opposite
-                            
-                            min_eval = min(min_eval, eval)
-                            beta = min(beta, eval)
-                            if beta <= alpha:
-                                break
-            
-            return min_eval
-    
-    def evaluate_board(self, game):
-        score = 0
-        
-        # Count material
-        for row in range(BOARD_SIZE):
-            for col in range(BOARD_SIZE):
-                piece = game.board[row][col]
-                if piece:
-                    # Material value
-                    piece_value = self.piece_values[piece.type]
-                    
-                    # Position value (flipped for black)
-                    position_table = self.position_values[piece.type]
-                    position_row = row if piece.color == Color.BLACK else 7 - row
-                    position_value = position_table[position_row][col]
-                    
-                    # Add to score (positive for AI, negative for opponent)
-                    value = piece_value + position_value
-                    if piece.color == game.turn:
-                        score += value
-                    else:
-                        score -= value
-        
-        return score
-
-class ChessGame:
+class ChessGame(GameState):
     def __init__(self, mode=GameMode.PLAYER_VS_PLAYER, ai_difficulty=AIDifficulty.MEDIUM):
-        self.board = [[None for _ in range(BOARD_SIZE)] for _ in range(BOARD_SIZE)]
-        self.turn = Color.WHITE
         self.selected_piece = None
         self.possible_moves = []
-        self.game_over = False
-        self.winner = None
-        self.mode = mode
-        self.ai = ChessAI(ai_difficulty)
-        self.ai_thinking = False
-        self.move_history = []
-        self.last_move = None
-        self.in_check = False
-        self.checkmate = False
-        self.stalemate = False
-        self.create_piece_images()
-        self.setup_board()
+        self.analysis_ai = ChessAI(AIDifficulty.EXPERT)
+        self.analysis_thread = None
+        self.analysis_stop = None
+        self.analysis_position = None
+        # None while analysis is off, else (depth, formatted lines)
+        self.analysis = None
+        # Piece images are loaded on the first draw, so a headless ChessGame never touches the art
+        super().__init__(mode, ai_difficulty)
         self.create_buttons()
+        self.create_static_layers()
+    
+    def atlas_path(self):
+        return os.path.join(PIECE_CACHE_DIR, f"pieces-v{PIECE_ATLAS_VERSION}-{SQUARE_SIZE}.png")
+    
+    def piece_image(self, image_key):
+        if not IMAGES:
+            self.load_piece_images()
+        return IMAGES[image_key]
+    
+    def load_piece_images(self):
+        """Fill IMAGES from the atlas on disk, drawing (and saving) the atlas only if it is missing or stale"""
+        piece_size = SQUARE_SIZE - 8
+        atlas_size = (piece_size * len(ATLAS_PIECE_TYPES), piece_size * len(ATLAS_COLORS))
+        path = self.atlas_path()
+        atlas = None
+        if os.path.exists(path):
+            try:
+                atlas = pygame.image.load(path)
+            except pygame.error:
+                atlas = None
+            if atlas is not None and atlas.get_size() != atlas_size:
+                atlas = None
+        
+        if atlas is None:
+            self.create_piece_images()
+            atlas = pygame.Surface(atlas_size, pygame.SRCALPHA)
+            for row, color in enumerate(ATLAS_COLORS):
+                for col, piece_type in enumerate(ATLAS_PIECE_TYPES):
+                    atlas.blit(IMAGES[f"{color.value}{piece_type.value}"], (col * piece_size, row * piece_size))
+            try:
+                os.makedirs(PIECE_CACHE_DIR, exist_ok=True)
+                # Write to a temporary file first so a concurrent reader never sees half an atlas
+                temporary_path = path + '.tmp.png'
+                pygame.image.save(atlas, temporary_path)
+                os.replace(temporary_path, path)
+            except (OSError, pygame.error):
+                # The cache is only an optimization; keep the freshly drawn images
+                pass
+            return
+        
+        if pygame.display.get_surface() is not None:
+            atlas = atlas.convert_alpha()
+        for row, color in enumerate(ATLAS_COLORS):
+            for col, piece_type in enumerate(ATLAS_PIECE_TYPES):
+                cell = pygame.Rect(col * piece_size, row * piece_size, piece_size, piece_size)
+                IMAGES[f"{color.value}{piece_type.value}"] = atlas.subsurface(cell)
     
     def create_piece_images(self):
         """Create realistic chess piece images that look like traditional Staunton chess pieces"""
@@ -1079,44 +637,74 @@ class ChessGame:
         # New game button
         self.buttons.append(Button(WINDOW_SIZE + 20, 300, 160, 30, "New Game", self.new_game))
     
-    def set_game_mode(self, mode):
-        self.mode = mode
-        self.new_game()
-    
-    def set_ai_difficulty(self, difficulty):
-        self.ai.difficulty = difficulty
-        if self.mode == GameMode.PLAYER_VS_AI:
-            self.new_game()
-    
     def new_game(self):
-        self.board = [[None for _ in range(BOARD_SIZE)] for _ in range(BOARD_SIZE)]
-        self.turn = Color.WHITE
         self.selected_piece = None
         self.possible_moves = []
-        self.game_over = False
-        self.winner = None
-        self.move_history = []
-        self.last_move = None
-        self.in_check = False
-        self.checkmate = False
-        self.stalemate = False
-        self.setup_board()
+        super().new_game()
     
-    def setup_board(self):
-        # Set up pawns
-        for col in range(BOARD_SIZE):
-            self.board[1][col] = Piece(PieceType.PAWN, Color.BLACK, (1, col))
-            self.board[6][col] = Piece(PieceType.PAWN, Color.WHITE, (6, col))
-        
-        # Set up other pieces
-        back_row = [
-            PieceType.ROOK, PieceType.KNIGHT, PieceType.BISHOP, PieceType.QUEEN,
-            PieceType.KING, PieceType.BISHOP, PieceType.KNIGHT, PieceType.ROOK
-        ]
+    def toggle_analysis(self):
+        if self.analysis is None:
+            self.analysis = (0, ())
+            self.update_analysis()
+        else:
+            self.stop_analysis()
+            self.analysis = None
+    
+    def update_analysis(self):
+        """Restart the background search whenever the position has changed"""
+        if self.analysis is None:
+            return
+        position = (self.zobrist_key, len(self.move_history))
+        if position == self.analysis_position:
+            return
+        self.stop_analysis()
+        self.analysis_position = position
+        self.analysis = (0, ())
+        if self.game_over:
+            return
+        # The thread gets its own copy; the GUI keeps playing on this one
+        snapshot = self.copy()
+        self.analysis_stop = threading.Event()
+        self.analysis_thread = threading.Thread(target=self.run_analysis, args=(snapshot, self.analysis_stop),
+                                                daemon=True)
+        self.analysis_thread.start()
+    
+    def stop_analysis(self):
+        if self.analysis_thread is not None:
+            self.analysis_stop.set()
+            self.analysis_thread.join()
+            self.analysis_thread = None
+        self.analysis_position = None
+    
+    def run_analysis(self, snapshot, stop_event):
+        def publish(depth, lines):
+            if stop_event.is_set():
+                return
+            formatted = tuple(self.format_analysis_line(snapshot, score, pv) for score, pv in lines)
+            self.analysis = (depth, formatted)
+            pygame.event.post(pygame.event.Event(ANALYSIS_EVENT))
         
-        for col, piece_type in enumerate(back_row):
-            self.board[0][col] = Piece(piece_type, Color.BLACK, (0, col))
-            self.board[7][col] = Piece(piece_type, Color.WHITE, (7, col))
+        self.analysis_ai.search(snapshot, max_depth=MAX_SEARCH_DEPTH, stop_event=stop_event,
+                                multipv=ANALYSIS_LINES, lines_callback=publish)
+    
+    def format_analysis_line(self, snapshot, score, pv):
+        """Score from white's side plus the line in SAN, e.g. '+0.35 e4 e5 Nf3'"""
+        if snapshot.turn == Color.BLACK:
+            score = -score
+        if abs(score) >= MATE_SCORE - MAX_SEARCH_DEPTH:
+            moves = (MATE_SCORE - abs(score) + 1) // 2
+            text = f"#{moves}" if score > 0 else f"#-{moves}"
+        else:
+            # Evaluation units are tenths of a pawn
+            text = f"{score / 10:+.2f}"
+        undo_stack = []
+        for from_pos, to_pos in pv:
+            piece = snapshot.board[from_pos[0]][from_pos[1]]
+            text += " " + move_to_san(snapshot, piece, to_pos)
+            undo_stack.append(snapshot.make_move(piece, to_pos))
+        while undo_stack:
+            snapshot.unmake_move(undo_stack.pop())
+        return text
     
     def handle_click(self, pos):
         # Check if a button was clicked
@@ -1150,7 +738,7 @@ class ChessGame:
                 # If clicked on another piece of the same color
                 if self.board[row][col] is not None and self.board[row][col].color == self.turn:
                     self.selected_piece = self.board[row][col]
-                    self.possible_moves = self.selected_piece.get_possible_moves(self.board, self.last_move)
+                    self.possible_moves = self.legal_moves_for(self.selected_piece)
                 else:
                     self.selected_piece = None
                     self.possible_moves = []
@@ -1158,145 +746,37 @@ class ChessGame:
             # Select a piece
             if self.board[row][col] is not None and self.board[row][col].color == self.turn:
                 self.selected_piece = self.board[row][col]
-                self.possible_moves = self.selected_piece.get_possible_moves(self.board, self.last_move)
+                self.possible_moves = self.legal_moves_for(self.selected_piece)
     
-    def move_piece(self, piece, new_pos):
-        old_row, old_col = piece.position
-        new_row, new_col = new_pos
-        
-        # Record the move
-        captured = self.board[new_row][new_col]
-        
-        # Handle en passant capture
-        if piece.type == PieceType.PAWN and old_col != new_col and not captured:
-            # This is an en passant capture
-            captured = self.board[old_row][new_col]
-            self.board[old_row][new_col] = None
+    def create_static_layers(self):
+        """Pre-render everything that never changes into one background surface"""
+        self.background = pygame.Surface((WINDOW_WIDTH, WINDOW_SIZE))
+        self.background.fill(pure_white)
         
-        self.last_move = {
-            'piece': piece,
-            'from': (old_row, old_col),
-            'to': new_pos,
-            'captured': captured
-        }
-        
-        self.move_history.append(self.last_move)
-        
-        # Check for castling
-        if piece.type == PieceType.KING and abs(old_col - new_col) > 1:
-            # Kingside castling
-            if new_col > old_col:
-                rook = self.board[old_row][7]
-                self.board[old_row][5] = rook
-                self.board[old_row][7] = None
-                rook.position = (old_row, 5)
-                rook.has_moved = True
-            # Queenside castling
-            else:
-                rook = self.board[old_row][0]
-                self.board[old_row][3] = rook
-                self.board[old_row][0] = None
-                rook.position = (old_row, 3)
-                rook.has_moved = True
-        
-        # Check for pawn promotion
-        if piece.type == PieceType.PAWN and (new_row == 0 or new_row == 7):
-            piece.type = PieceType.QUEEN
-            piece.image_key = f"{piece.color.value}q"
-        
-        # Move the piece
-        self.board[new_row][new_col] = piece
-        self.board[old_row][old_col] = None
-        piece.position = new_pos
-        piece.has_moved = True
-        
-        # Switch turns
-        self.turn = self.turn.opposite
-        
-        # Check for check, checkmate, or stalemate
-        self.check_game_state()
-    
-    def make_ai_move(self):
-        # Get the AI's move
-        ai_move = self.ai.get_move(self)
-        
-        if ai_move:
-            piece, move = ai_move
-            self.move_piece(piece, move)
-        else:
-            # If AI can't move, it's either checkmate or stalemate
-            self.game_over = True
-        
-        self.ai_thinking = False
-    
-    def is_game_over(self):
-        return self.game_over
-    
-    def check_game_state(self):
-        """Check if the current player is in check, checkmate, or stalemate"""
-        # Find the king
-        king = None
-        for row in range(BOARD_SIZE):
-            for col in range(BOARD_SIZE):
-                piece = self.board[row][col]
-                if piece and piece.type == PieceType.KING and piece.color == self.turn:
-                    king = piece
-                    break
-            if king:
-                break
-        
-        # Check if the king is in check
-        self.in_check = king.is_in_check(self.board)
-        
-        # Check if the player has any legal moves
-        has_legal_moves = False
-        for row in range(BOARD_SIZE):
-            for col in range(BOARD_SIZE):
-                piece = self.board[row][col]
-                if piece and piece.color == self.turn:
-                    moves = piece.get_possible_moves(self.board, self.last_move)
-                    if moves:
-                        has_legal_moves = True
-                        break
-            if has_legal_moves:
-                break
-        
-        # If no legal moves, it's either checkmate or stalemate
-        if not has_legal_moves:
-            self.game_over = True
-            if self.in_check:
-                self.checkmate = True
-                self.winner = self.turn.opposite
-            else:
-                self.stalemate = True
-                self.winner = None
-    
-    def draw(self, screen):
-        # Draw the board with border and coordinates
+        # Board with border and coordinates
         board_rect = (10, 10, WINDOW_SIZE - 20, WINDOW_SIZE - 20)
-        pygame.draw.rect(screen, BORDER_COLOR, (0, 0, WINDOW_SIZE, WINDOW_SIZE))
-        pygame.draw.rect(screen, LIGHT_SQUARE, board_rect)
+        pygame.draw.rect(self.background, BORDER_COLOR, (0, 0, WINDOW_SIZE, WINDOW_SIZE))
+        pygame.draw.rect(self.background, LIGHT_SQUARE, board_rect)
         
         # Draw coordinate labels
-        font = pygame.font.SysFont('Times New Roman', 16, bold=True)
         
         # Draw files (a-h) at bottom
         for col in range(BOARD_SIZE):
             file_label = chr(ord('a') + col)
-            text = font.render(file_label, True, BORDER_COLOR)
+            text = render_text(file_label, 16, BORDER_COLOR, bold=True)
             x = col * SQUARE_SIZE + SQUARE_SIZE//2 - text.get_width()//2
             y = WINDOW_SIZE - 25
-            screen.blit(text, (x, y))
+            self.background.blit(text, (x, y))
         
         # Draw ranks (1-8) on left side
         for row in range(BOARD_SIZE):
             rank_label = str(8 - row)
-            text = font.render(rank_label, True, BORDER_COLOR)
+            text = render_text(rank_label, 16, BORDER_COLOR, bold=True)
             x = 5
             y = row * SQUARE_SIZE + SQUARE_SIZE//2 - text.get_height()//2
-            screen.blit(text, (x, y))
+            self.background.blit(text, (x, y))
         
-        # Draw the squares with subtle gradient effect
+        # Draw the squares with subtle 3D effect
         for row in range(BOARD_SIZE):
             for col in range(BOARD_SIZE):
                 x = col * SQUARE_SIZE
@@ -1310,93 +790,218 @@ class ChessGame:
                     base_color = DARK_SQUARE
                     shadow_color = tuple(max(0, c - 20) for c in DARK_SQUARE)
                 
-                # Draw square with subtle 3D effect
-                square_rect = (x, y, SQUARE_SIZE, SQUARE_SIZE)
-                pygame.draw.rect(screen, base_color, square_rect)
+                pygame.draw.rect(self.background, base_color, (x, y, SQUARE_SIZE, SQUARE_SIZE))
                 
                 # Add subtle border for depth
-                pygame.draw.line(screen, shadow_color, (x, y + SQUARE_SIZE - 1), (x + SQUARE_SIZE - 1, y + SQUARE_SIZE - 1), 1)
-                pygame.draw.line(screen, shadow_color, (x + SQUARE_SIZE - 1, y), (x + SQUARE_SIZE - 1, y + SQUARE_SIZE - 1), 1)
-                
-                # Highlight selected piece with golden glow
-                if self.selected_piece and self.selected_piece.position == (row, col):
-                    glow_surface = pygame.Surface((SQUARE_SIZE, SQUARE_SIZE), pygame.SRCALPHA)
-                    glow_surface.fill(HIGHLIGHT)
-                    screen.blit(glow_surface, (x, y))
-                    # Add golden border
-                    pygame.draw.rect(screen, GOLD, square_rect, 4)
-                
-                # Highlight possible moves with green dots and subtle glow
-                if (row, col) in self.possible_moves:
-                    move_surface = pygame.Surface((SQUARE_SIZE, SQUARE_SIZE), pygame.SRCALPHA)
-                    move_surface.fill(MOVE_HIGHLIGHT)
-                    screen.blit(move_surface, (x, y))
-                    # Draw a green circle in the center
-                    circle_center = (x + SQUARE_SIZE//2, y + SQUARE_SIZE//2)
-                    pygame.draw.circle(screen, (34, 139, 34), circle_center, SQUARE_SIZE//6)
-                    pygame.draw.circle(screen, (0, 100, 0), circle_center, SQUARE_SIZE//6, 3)
-                
-                # Highlight king in check with pulsing red effect
-                piece = self.board[row][col]
-                if piece and piece.type == PieceType.KING and piece.color == self.turn and self.in_check:
-                    check_surface = pygame.Surface((SQUARE_SIZE, SQUARE_SIZE), pygame.SRCALPHA)
-                    check_surface.fill(CHECK_HIGHLIGHT)
-                    screen.blit(check_surface, (x, y))
-                    # Add red border
-                    pygame.draw.rect(screen, (220, 20, 60), square_rect, 5)
-                
-                # Highlight last move with orange glow
-                if self.last_move:
-                    last_from = self.last_move['from']
-                    last_to = self.last_move['to']
-                    if (row, col) == last_from or (row, col) == last_to:
-                        last_surface = pygame.Surface((SQUARE_SIZE, SQUARE_SIZE), pygame.SRCALPHA)
-                        last_surface.fill(LAST_MOVE_HIGHLIGHT)
-                        screen.blit(last_surface, (x, y))
-                
-                # Draw pieces with shadow effect
-                if piece:
-                    img = IMAGES[piece.image_key]
-                    # Draw shadow first
-                    shadow_offset = 2
-                    shadow_surface = pygame.Surface(img.get_size(), pygame.SRCALPHA)
-                    shadow_surface.fill((0, 0, 0, 50))
-                    shadow_rect = img.get_rect(center=(x + SQUARE_SIZE//2 + shadow_offset, y + SQUARE_SIZE//2 + shadow_offset))
-                    screen.blit(shadow_surface, shadow_rect)
-                    # Draw the piece
-                    img_rect = img.get_rect(center=(x + SQUARE_SIZE//2, y + SQUARE_SIZE//2))
-                    screen.blit(img, img_rect)
+                pygame.draw.line(self.background, shadow_color, (x, y + SQUARE_SIZE - 1), (x + SQUARE_SIZE - 1, y + SQUARE_SIZE - 1), 1)
+                pygame.draw.line(self.background, shadow_color, (x + SQUARE_SIZE - 1, y), (x + SQUARE_SIZE - 1, y + SQUARE_SIZE - 1), 1)
         
-        # Draw elegant sidebar with wood texture effect
+        # Elegant sidebar with wood texture effect
         sidebar_rect = (WINDOW_SIZE, 0, SIDEBAR_WIDTH, WINDOW_SIZE)
-        pygame.draw.rect(screen, SIDEBAR_BG, sidebar_rect)
+        pygame.draw.rect(self.background, SIDEBAR_BG, sidebar_rect)
         # Add wood grain lines
+        line_color = tuple(min(255, c + 10) for c in SIDEBAR_BG)
         for i in range(0, WINDOW_SIZE, 20):
-            line_color = tuple(min(255, c + 10) for c in SIDEBAR_BG)
-            pygame.draw.line(screen, line_color, (WINDOW_SIZE, i), (WINDOW_SIZE + SIDEBAR_WIDTH, i), 1)
+            pygame.draw.line(self.background, line_color, (WINDOW_SIZE, i), (WINDOW_SIZE + SIDEBAR_WIDTH, i), 1)
         
         # Add vertical border
-        pygame.draw.line(screen, BORDER_COLOR, (WINDOW_SIZE, 0), (WINDOW_SIZE, WINDOW_SIZE), 3)
+        pygame.draw.line(self.background, BORDER_COLOR, (WINDOW_SIZE, 0), (WINDOW_SIZE, WINDOW_SIZE), 3)
         
-        # Draw buttons with improved styling
-        for button in self.buttons:
-            button.draw(screen)
+        # Buttons are baked into the sidebar in their normal state; only hovered ones are drawn on top
+        draw_buttons(self.background, [button for button in self.buttons if not button.hovered])
+        self.baked_buttons = [button.cache_key() for button in self.buttons]
         
-        # Draw game info with elegant typography
-        title_font = pygame.font.SysFont('Times New Roman', 24, bold=True)
-        info_font = pygame.font.SysFont('Times New Roman', 18)
-        small_font = pygame.font.SysFont('Times New Roman', 14)
+        # The title overlaps the first button, so it is re-blitted whenever that button is redrawn
+        self.title_surface = render_text("Made by jihad", 24, GOLD, bold=True)
+        self.title_rect = self.title_surface.get_rect(centerx=WINDOW_SIZE + SIDEBAR_WIDTH//2, y=10)
+        self.background.blit(self.title_surface, self.title_rect)
         
-        # Title
-        title_text = "Made by jihad"
-        title_surf = title_font.render(title_text, True, GOLD)
-        title_rect = title_surf.get_rect(centerx=WINDOW_SIZE + SIDEBAR_WIDTH//2, y=10)
-        screen.blit(title_surf, title_rect)
+        # Nothing is on screen yet: the next render() repaints everything
+        self.rendered_state = None
+    
+    def invalidate(self):
+        """Force a full repaint on the next render() (e.g. after the window was exposed)"""
+        self.rendered_state = None
+    
+    def square_state(self, row, col):
+        """Everything that decides how one square looks"""
+        piece = self.board[row][col]
+        last_move_square = bool(self.last_move) and (row, col) in (self.last_move['from'], self.last_move['to'])
+        return (
+            piece.image_key if piece else None,
+            bool(self.selected_piece) and self.selected_piece.position == (row, col),
+            (row, col) in self.possible_moves,
+            bool(piece) and piece.type == PieceType.KING and piece.color == self.turn and self.in_check,
+            last_move_square,
+        )
+    
+    def sidebar_state(self):
+        """Everything shown in the game info panel"""
+        dots = int(time.time() * 2) % 4 if self.ai_thinking else None
+        return (self.turn, self.in_check, self.mode, self.ai.difficulty, dots,
+                self.last_move_text(), len(self.move_history))
+    
+    def game_over_state(self):
+        return (self.game_over, self.checkmate, self.stalemate, self.draw_reason, self.winner)
+    
+    def ai_to_move(self):
+        return self.mode == GameMode.PLAYER_VS_AI and self.turn == Color.BLACK and not self.game_over
+    
+    def frame_rate(self, max_fps=MAX_FPS):
+        """Frames per second the main loop should run at; 0 means wait for the next event"""
+        if self.ai_thinking or self.ai_to_move():
+            return max_fps
+        return 0
+    
+    def render(self, screen):
+        """Redraw only the squares and widgets that changed since the last call.
+        
+        Returns the list of dirty rectangles for pygame.display.update(); the
+        list is empty when nothing changed.
+        """
+        squares = [self.square_state(row, col) for row in range(BOARD_SIZE) for col in range(BOARD_SIZE)]
+        if [button.cache_key() for button in self.buttons] != self.baked_buttons:
+            # A button's text, size or theme changed: rebuild the sidebar layer
+            self.create_static_layers()
+        buttons = [button.hovered for button in self.buttons]
+        sidebar = self.sidebar_state()
+        game_over = self.game_over_state()
+        analysis = self.analysis
+        
+        previous = self.rendered_state
+        self.rendered_state = (squares, buttons, sidebar, game_over, analysis)
+        if previous is None:
+            self.draw(screen)
+            return [screen.get_rect()]
+        
+        previous_squares, previous_buttons, previous_sidebar, previous_game_over, previous_analysis = previous
+        dirty = []
+        
+        if game_over != previous_game_over or (self.game_over and squares != previous_squares):
+            # The game over overlay covers the whole board
+            for row in range(BOARD_SIZE):
+                for col in range(BOARD_SIZE):
+                    self.draw_square(screen, row, col)
+            if self.game_over:
+                self.draw_game_over(screen)
+            dirty.append(pygame.Rect(0, 0, WINDOW_SIZE, WINDOW_SIZE))
+        else:
+            for index, state in enumerate(squares):
+                if state != previous_squares[index]:
+                    row, col = divmod(index, BOARD_SIZE)
+                    self.draw_square(screen, row, col)
+                    dirty.append(pygame.Rect(col * SQUARE_SIZE, row * SQUARE_SIZE, SQUARE_SIZE, SQUARE_SIZE))
+        
+        for button, hovered, previously_hovered in zip(self.buttons, buttons, previous_buttons):
+            if hovered != previously_hovered:
+                dirty.append(self.draw_button(screen, button))
+        
+        if sidebar != previous_sidebar:
+            screen.blit(self.background, INFO_PANEL_RECT, INFO_PANEL_RECT)
+            self.draw_info_panel(screen)
+            dirty.append(INFO_PANEL_RECT)
+        
+        if analysis != previous_analysis:
+            screen.blit(self.background, ANALYSIS_PANEL_RECT, ANALYSIS_PANEL_RECT)
+            self.draw_analysis_panel(screen, analysis)
+            dirty.append(ANALYSIS_PANEL_RECT)
+        
+        return dirty
+    
+    def draw(self, screen):
+        """Repaint the whole window"""
+        screen.blit(self.background, (0, 0))
         
+        for row in range(BOARD_SIZE):
+            for col in range(BOARD_SIZE):
+                self.draw_square(screen, row, col)
+        
+        # Buttons in their normal state are part of the background
+        for button in self.buttons:
+            if button.hovered:
+                self.draw_button(screen, button)
+        
+        self.draw_info_panel(screen)
+        self.draw_analysis_panel(screen, self.analysis)
+        
+        if self.game_over:
+            self.draw_game_over(screen)
+    
+    def draw_button(self, screen, button):
+        """Restore a button's area from the background and draw its hover state; returns the area"""
+        area = button.rect.inflate(2, 2)
+        screen.blit(self.background, area, area)
+        if button.hovered:
+            button.draw(screen)
+            # Clip so the anti-aliased title edge is not blended twice
+            screen.set_clip(button.get_surface().get_rect(topleft=button.rect.topleft))
+            screen.blit(self.title_surface, self.title_rect)
+            screen.set_clip(None)
+        return area
+    
+    def draw_square(self, screen, row, col):
+        """Draw one square (background, highlights and piece) over whatever was there"""
+        x = col * SQUARE_SIZE
+        y = row * SQUARE_SIZE
+        square_rect = (x, y, SQUARE_SIZE, SQUARE_SIZE)
+        screen.blit(self.background, (x, y), square_rect)
+        
+        # Highlight selected piece with golden glow
+        if self.selected_piece and self.selected_piece.position == (row, col):
+            screen.blit(get_overlay('selected', (SQUARE_SIZE, SQUARE_SIZE), HIGHLIGHT), (x, y))
+            # Add golden border
+            pygame.draw.rect(screen, GOLD, square_rect, 4)
+        
+        # Highlight possible moves with green dots and subtle glow
+        if (row, col) in self.possible_moves:
+            screen.blit(get_overlay('move', (SQUARE_SIZE, SQUARE_SIZE), MOVE_HIGHLIGHT), (x, y))
+            # Draw a green circle in the center
+            circle_center = (x + SQUARE_SIZE//2, y + SQUARE_SIZE//2)
+            pygame.draw.circle(screen, (34, 139, 34), circle_center, SQUARE_SIZE//6)
+            pygame.draw.circle(screen, (0, 100, 0), circle_center, SQUARE_SIZE//6, 3)
+        
+        # Highlight king in check with pulsing red effect
+        piece = self.board[row][col]
+        if piece and piece.type == PieceType.KING and piece.color == self.turn and self.in_check:
+            screen.blit(get_overlay('check', (SQUARE_SIZE, SQUARE_SIZE), CHECK_HIGHLIGHT), (x, y))
+            # Add red border
+            pygame.draw.rect(screen, (220, 20, 60), square_rect, 5)
+        
+        # Highlight last move with orange glow
+        if self.last_move:
+            last_from = self.last_move['from']
+            last_to = self.last_move['to']
+            if (row, col) == last_from or (row, col) == last_to:
+                screen.blit(get_overlay('last_move', (SQUARE_SIZE, SQUARE_SIZE), LAST_MOVE_HIGHLIGHT), (x, y))
+        
+        # Draw pieces with shadow effect
+        if piece:
+            img = self.piece_image(piece.image_key)
+            # Draw shadow first
+            shadow_offset = 2
+            shadow_surface = get_overlay('shadow', img.get_size(), (0, 0, 0, 50))
+            shadow_rect = img.get_rect(center=(x + SQUARE_SIZE//2 + shadow_offset, y + SQUARE_SIZE//2 + shadow_offset))
+            screen.blit(shadow_surface, shadow_rect)
+            # Draw the piece
+            img_rect = img.get_rect(center=(x + SQUARE_SIZE//2, y + SQUARE_SIZE//2))
+            screen.blit(img, img_rect)
+    
+    def last_move_text(self):
+        """Last move in chess notation, or None before the first move"""
+        if not self.last_move:
+            return None
+        from_row, from_col = self.last_move['from']
+        to_row, to_col = self.last_move['to']
+        piece_symbol = {'p': '♟', 'r': '♜', 'n': '♞', 'b': '♝', 'q': '♛', 'k': '♚'}
+        piece_char = piece_symbol.get(self.last_move['piece'].type.value, '')
+        return f"Last: {piece_char}{chr(97+from_col)}{8-from_row}→{chr(97+to_col)}{8-to_row}"
+    
+    def draw_info_panel(self, screen):
+        """Draw game info with elegant typography"""
         # Current turn with icon
         turn_color = "White" if self.turn == Color.WHITE else "Black"
         turn_text = f"Turn: {turn_color}"
-        turn_surf = info_font.render(turn_text, True, TEXT_COLOR)
+        turn_surf = render_text(turn_text, 18, TEXT_COLOR)
         screen.blit(turn_surf, (WINDOW_SIZE + 20, 350))
         
         # Draw a small piece icon next to turn
@@ -1410,54 +1015,64 @@ class ChessGame:
         # Check status with dramatic styling
         if self.in_check:
             check_text = "⚠ CHECK! ⚠"
-            check_surf = title_font.render(check_text, True, (255, 69, 0))
+            check_surf = render_text(check_text, 24, (255, 69, 0), bold=True)
             check_rect = check_surf.get_rect(centerx=WINDOW_SIZE + SIDEBAR_WIDTH//2, y=380)
             screen.blit(check_surf, check_rect)
         
         # Game mode
         mode_text = f"Mode: {'Player vs Player' if self.mode == GameMode.PLAYER_VS_PLAYER else 'Player vs AI'}"
-        mode_surf = small_font.render(mode_text, True, TEXT_COLOR)
+        mode_surf = render_text(mode_text, 14, TEXT_COLOR)
         screen.blit(mode_surf, (WINDOW_SIZE + 20, 410))
         
         # AI difficulty if in PvAI mode
         if self.mode == GameMode.PLAYER_VS_AI:
             diff_text = f"AI Level: {self.ai.difficulty.name}"
-            diff_surf = small_font.render(diff_text, True, TEXT_COLOR)
+            diff_surf = render_text(diff_text, 14, TEXT_COLOR)
             screen.blit(diff_surf, (WINDOW_SIZE + 20, 430))
         
         # AI thinking message with animation dots
         if self.ai_thinking:
-            import time
             dots = "." * (int(time.time() * 2) % 4)
             thinking_text = f"AI thinking{dots}"
-            thinking_surf = info_font.render(thinking_text, True, GOLD)
+            thinking_surf = render_text(thinking_text, 18, GOLD)
             screen.blit(thinking_surf, (WINDOW_SIZE + 20, 460))
         
         # Last move in chess notation
-        if self.last_move:
-            from_row, from_col = self.last_move['from']
-            to_row, to_col = self.last_move['to']
-            piece_symbol = {'p': '♟', 'r': '♜', 'n': '♞', 'b': '♝', 'q': '♛', 'k': '♚'}
-            piece_char = piece_symbol.get(self.last_move['piece'].type.value, '')
-            last_move_text = f"Last: {piece_char}{chr(97+from_col)}{8-from_row}→{chr(97+to_col)}{8-to_row}"
-            last_move_surf = small_font.render(last_move_text, True, TEXT_COLOR)
+        last_move_text = self.last_move_text()
+        if last_move_text:
+            last_move_surf = render_text(last_move_text, 14, TEXT_COLOR)
             screen.blit(last_move_surf, (WINDOW_SIZE + 20, 490))
         
         # Move count
         move_count = len(self.move_history)
         move_text = f"Moves: {move_count//2 + 1}"
-        move_surf = small_font.render(move_text, True, TEXT_COLOR)
+        move_surf = render_text(move_text, 14, TEXT_COLOR)
         screen.blit(move_surf, (WINDOW_SIZE + 20, 510))
-        
+    
+    def draw_analysis_panel(self, screen, analysis):
+        """Top engine lines, cut to the sidebar width"""
+        x = WINDOW_SIZE + 20
+        max_width = SIDEBAR_WIDTH - 30
+        if analysis is None:
+            screen.blit(render_text("Press A to analyse", 14, TEXT_COLOR), (x, ANALYSIS_PANEL_RECT.top + 5))
+            return
+        depth, lines = analysis
+        header = f"Analysis depth {depth}" if depth else "Analysing..."
+        screen.blit(render_text(header, 14, GOLD, bold=True), (x, ANALYSIS_PANEL_RECT.top + 5))
+        font = get_font(14)
+        for index, line in enumerate(lines):
+            words = f"{index + 1}. {line}".split()
+            while len(words) > 2 and font.size(' '.join(words))[0] > max_width:
+                words.pop()
+            screen.blit(render_text(' '.join(words), 14, TEXT_COLOR), (x, ANALYSIS_PANEL_RECT.top + 27 + index * 20))
+    
+    def draw_game_over(self, screen):
         # Game over message with elegant styling
         if self.game_over:
             # Create semi-transparent overlay
-            overlay = pygame.Surface((WINDOW_SIZE, WINDOW_SIZE), pygame.SRCALPHA)
-            overlay.fill((0, 0, 0, 150))
-            screen.blit(overlay, (0, 0))
+            screen.blit(get_overlay('game_over', (WINDOW_SIZE, WINDOW_SIZE), (0, 0, 0, 150)), (0, 0))
             
             # Main message
-            game_over_font = pygame.font.SysFont('Times New Roman', 48, bold=True)
             if self.checkmate:
                 winner_name = "White" if self.winner == Color.WHITE else "Black"
                 main_text = f"Checkmate!"
@@ -1467,13 +1082,17 @@ class ChessGame:
                 main_text = "Stalemate!"
                 sub_text = "Draw Game"
                 text_color = SILVER
+            elif self.draw_reason:
+                main_text = "Draw!"
+                sub_text = self.draw_reason.capitalize()
+                text_color = SILVER
             else:
                 main_text = "Game Over!"
                 sub_text = ""
                 text_color = TEXT_COLOR
             
             # Draw main text
-            main_surf = game_over_font.render(main_text, True, text_color)
+            main_surf = render_text(main_text, 48, text_color, bold=True)
             main_rect = main_surf.get_rect(center=(WINDOW_SIZE//2, WINDOW_SIZE//2 - 30))
             
             # Draw background for text
@@ -1485,23 +1104,68 @@ class ChessGame:
             
             # Draw sub text
             if sub_text:
-                sub_font = pygame.font.SysFont('Times New Roman', 24)
-                sub_surf = sub_font.render(sub_text, True, text_color)
+                sub_surf = render_text(sub_text, 24, text_color)
                 sub_rect = sub_surf.get_rect(center=(WINDOW_SIZE//2, WINDOW_SIZE//2 + 20))
                 screen.blit(sub_surf, sub_rect)
 
-def main():
+def measure_frame_times(screen, game, frames=200):
+    """Average milliseconds per frame for several ways of drawing the same position.
+
+    'uncached repaint' drops the font, text and overlay caches before each
+    frame, which is what every frame cost before the render caches existed.
+    """
+    def timed(prepare, draw):
+        start = time.perf_counter()
+        for frame in range(frames):
+            prepare(frame)
+            draw()
+        return (time.perf_counter() - start) * 1000 / frames
+
+    def toggle_hover(frame):
+        game.buttons[0].hovered = frame % 2 == 0
+
+    results = {
+        'uncached repaint': timed(lambda frame: clear_render_caches(), lambda: game.draw(screen)),
+        'cached repaint': timed(lambda frame: None, lambda: game.draw(screen)),
+        'dirty render (idle)': timed(lambda frame: None, lambda: game.render(screen)),
+        'dirty render (hover)': timed(toggle_hover, lambda: game.render(screen)),
+    }
+    game.buttons[0].hovered = False
+    game.invalidate()
+    return results
+
+def benchmark():
+    screen = pygame.display.set_mode((WINDOW_WIDTH, WINDOW_SIZE))
+    game = ChessGame(mode=GameMode.PLAYER_VS_PLAYER)
+    for name, milliseconds in measure_frame_times(screen, game).items():
+        print(f"{name:>22}: {milliseconds:7.3f} ms/frame")
+    pygame.quit()
+
+def main(max_fps=MAX_FPS):
     screen = pygame.display.set_mode((WINDOW_WIDTH, WINDOW_SIZE))
     pygame.display.set_caption("Made by jihad")
     
     game = ChessGame(mode=GameMode.PLAYER_VS_PLAYER)
+    analysis_cache = AnalysisCache(ANALYSIS_CACHE_PATH)
+    game.ai.analysis_cache = analysis_cache
     
     mouse_pos = (0, 0)
     
     clock = pygame.time.Clock()
+    pygame.display.update(game.render(screen))
     running = True
     while running:
-        for event in pygame.event.get():
+        frame_rate = game.frame_rate(max_fps)
+        if frame_rate:
+            # Something is animating or the AI has work to do: run at the frame cap
+            clock.tick(frame_rate)
+            events = pygame.event.get()
+        else:
+            # Idle: block until the user does something
+            event = pygame.event.wait(IDLE_WAIT_MS)
+            events = [event] + pygame.event.get() if event.type != pygame.NOEVENT else []
+        
+        for event in events:
             if event.type == pygame.QUIT:
                 running = False
             elif event.type == pygame.MOUSEBUTTONDOWN:
@@ -1512,25 +1176,38 @@ def main():
                 # Update button hover states
                 for button in game.buttons:
                     button.check_hover(mouse_pos)
+            elif event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_a:
+                    game.toggle_analysis()
+            elif event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+                # The window contents were lost: repaint everything
+                game.invalidate()
         
         # Make AI move if it's AI's turn
-        if game.mode == GameMode.PLAYER_VS_AI and game.turn == Color.BLACK and not game.game_over and game.ai_thinking:
+        if game.ai_to_move() and game.ai_thinking:
             game.make_ai_move()
         
         # Schedule AI to think on the next frame if it's AI's turn
-        if game.mode == GameMode.PLAYER_VS_AI and game.turn == Color.BLACK and not game.game_over and not game.ai_thinking:
+        if game.ai_to_move() and not game.ai_thinking:
             game.ai_thinking = True
         
-        # Draw everything
-        screen.fill(pure_white)
-        game.draw(screen)
-        pygame.display.flip()
+        # Follow the current position with the background analysis
+        game.update_analysis()
         
-        # Cap the frame rate
-        clock.tick(60)
+        # Redraw only what changed since the last frame
+        dirty_rects = game.render(screen)
+        if dirty_rects:
+            pygame.display.update(dirty_rects)
     
+    game.stop_analysis()
+    analysis_cache.close()
     pygame.quit()
     sys.exit()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    if '--benchmark' in sys.argv:
+        benchmark()
+    elif '--fps' in sys.argv:
+        main(max_fps=int(sys.argv[sys.argv.index('--fps') + 1]))
+    else:
+        main()
\ No newline at end of file
@@ -0,0 +1,48 @@
+"""Analysis cache answers for node-budgeted searches."""
+
+import time
+
+from chess_engine.ai import AIDifficulty, ChessAI
+from chess_engine.cache import MAX_NODE_BUDGET, AnalysisCache
+from chess_engine.game import GameState
+
+MIDDLEGAME = "r1bq1rk1/pp2bppp/2n1pn2/3p4/2PP4/2N1PN2/PP2BPPP/R2QKB1R w KQ - 0 8"
+
+def searcher(cache):
+    ai = ChessAI(AIDifficulty.HARD)
+    ai.analysis_cache = cache
+    game = GameState()
+    game.load_fen(MIDDLEGAME)
+    return ai, game
+
+def test_time_limited_search_counts_its_own_nodes(tmp_path):
+    with AnalysisCache(str(tmp_path / 'analysis.cache')) as cache:
+        ai, game = searcher(cache)
+        ai.search(game, max_depth=20, deadline=time.time() + 0.2, node_limit=10 ** 6)
+        searched = ai.nodes
+        assert 0 < searched < 10 ** 6
+        assert cache.get(ai.cache_key(game))[3] == searched
+
+        # The same budget again: the stored answer did not use it all
+        ai.search(game, max_depth=20, node_limit=10 ** 6, deadline=time.time() + 0.05)
+        assert ai.nodes > 0
+
+def test_cached_move_hit_after_time_limited_search(tmp_path):
+    with AnalysisCache(str(tmp_path / 'analysis.cache')) as cache:
+        ai, game = searcher(cache)
+        piece, target = ai.search(game, max_depth=20, deadline=time.time() + 0.2)
+        searched, depth, move = ai.nodes, ai.last_depth, (piece.position, target)
+
+        piece, target = ai.search(game, max_depth=20, node_limit=searched)
+        assert ai.nodes == 0
+        assert ai.last_depth == depth and (piece.position, target) == move
+
+def test_complete_search_satisfies_any_budget(tmp_path):
+    with AnalysisCache(str(tmp_path / 'analysis.cache')) as cache:
+        ai, game = searcher(cache)
+        # White mates in one with Qxf7
+        game.load_fen("r1bqkb1r/pppp1ppp/2n2n2/4p2Q/2B1P3/8/PPPP1PPP/RNB1K1NR w KQkq - 4 4")
+        ai.search(game, max_depth=4)
+        assert cache.get(ai.cache_key(game))[3] == MAX_NODE_BUDGET
+        ai.search(game, max_depth=20, node_limit=10 ** 6)
+        assert ai.nodes == 0
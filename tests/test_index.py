@@ -0,0 +1,42 @@
+"""Position index lookups by FEN."""
+
+from chess_engine.index import PositionIndex, build_index
+
+ARCHIVE = """[Event "one"]
+[Result "1-0"]
+
+1. e4 e5 2. Nf3 Nc6 1-0
+
+[Event "two"]
+[Result "0-1"]
+
+1. e4 c5 2. d4 cxd4 0-1
+"""
+
+# The query in the chess_engine.index docstring: after 1. e4, where no en
+# passant capture is possible, so other tools write '-' for the square
+AFTER_E4 = "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq - 0 1"
+
+def build(tmp_path):
+    pgn_path = tmp_path / 'games.pgn'
+    pgn_path.write_text(ARCHIVE)
+    index_dir = str(tmp_path / 'games.idx')
+    build_index(index_dir, [str(pgn_path)])
+    return PositionIndex(index_dir)
+
+def test_docstring_query_after_double_push(tmp_path):
+    with build(tmp_path) as index:
+        assert sorted(index.games(AFTER_E4)) == [(0, 1), (1, 1)]
+        assert index.games(AFTER_E4.replace(' - 0 1', ' e3 0 1')) == index.games(AFTER_E4)
+        moves = sorted((entry['move'], entry['games']) for entry in index.move_stats(AFTER_E4))
+        assert moves == [('c7c5', 1), ('e7e5', 1)]
+
+def test_legal_en_passant_square_is_kept(tmp_path):
+    pgn_path = tmp_path / 'games.pgn'
+    pgn_path.write_text('[Result "*"]\n\n1. e4 a6 2. e5 d5 *\n')
+    index_dir = str(tmp_path / 'games.idx')
+    build_index(index_dir, [str(pgn_path)])
+    with PositionIndex(index_dir) as index:
+        after_d5 = "rnbqkbnr/1pp1pppp/p7/3pP3/8/8/PPPP1PPP/RNBQKBNR w KQkq d6 0 3"
+        assert index.games(after_d5) == [(0, 4)]
+        assert index.games(after_d5.replace(' d6 ', ' - ')) == []
@@ -0,0 +1,38 @@
+"""Malformed FENs are rejected with ValueError before the game is touched."""
+
+import pytest
+
+from chess_engine.game import STARTING_FEN, GameState
+from chess_engine.notation import parse_square
+
+@pytest.mark.parametrize('fen', [
+    "8/8/8/8/8/8/8/8 w - - 0 1",
+    "4k3/8/8/8/8/8/8/8 w - - 0 1",
+    "4k3/8/8/8/8/8/8/3KK3 w - - 0 1",
+])
+def test_fen_without_one_king_per_side(fen):
+    game = GameState()
+    with pytest.raises(ValueError):
+        game.load_fen(fen)
+    assert game.to_fen() == STARTING_FEN
+
+@pytest.mark.parametrize('fen', [
+    "4k3/8/8/8/8/8/8/4K3 w - e 0 1",
+    "4k3/8/8/8/8/8/8/4K3 w - e33 0 1",
+    "4k3/8/8/8/8/8/8/4K3 w - i3 0 1",
+])
+def test_fen_with_malformed_en_passant_square(fen):
+    game = GameState()
+    with pytest.raises(ValueError):
+        game.load_fen(fen)
+    assert game.to_fen() == STARTING_FEN
+
+@pytest.mark.parametrize('name', ['', 'e', 'e0', 'e9', 'i3', 'e33', '3e'])
+def test_parse_square_rejects_non_squares(name):
+    with pytest.raises(ValueError):
+        parse_square(name)
+
+def test_parse_square():
+    assert parse_square('a8') == (0, 0)
+    assert parse_square('e2') == (6, 4)
+    assert parse_square('h1') == (7, 7)
@@ -0,0 +1,51 @@
+"""The search hot loop allocates nothing per node, so its memory stays flat as the tree grows."""
+
+import tracemalloc
+
+from chess_engine.ai import DIFFICULTY_PROFILES, AIDifficulty, ChessAI, DifficultyProfile
+from chess_engine.game import GameState
+from chess_engine.notation import decode_move, encode_move
+from chess_engine.pieces import MOVE_CODES, SQUARE_COORDS
+
+KIWIPETE = "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1"
+
+# Allowed growth of the peak between the shallowest and deepest search
+PEAK_SLACK_BYTES = 8 * 1024
+
+def measure_search_memory(game, max_depth, difficulty=AIDifficulty.HARD):
+    """Search game once under tracemalloc; returns nodes, peak_bytes and retained_bytes.
+
+    The search runs without the transposition table, the one structure that
+    is meant to grow, after a warm-up search has created the per-ply
+    buffers. peak_bytes is the most memory held at once above the starting
+    point and retained_bytes what is still allocated afterwards.
+    """
+    profile = DIFFICULTY_PROFILES[difficulty]
+    ai = ChessAI(difficulty, DifficultyProfile(max_depth, eval_noise=profile.eval_noise,
+                                               features=profile.features - {'transposition'}))
+    ai.search(game, max_depth=1)
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        start, _ = tracemalloc.get_traced_memory()
+        ai.search(game, max_depth=max_depth)
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'nodes': ai.nodes, 'peak_bytes': peak - start, 'retained_bytes': current - start}
+
+def test_peak_memory_flat_as_nodes_grow():
+    game = GameState()
+    game.load_fen(KIWIPETE)
+    shallow = measure_search_memory(game, 2)
+    deep = measure_search_memory(game, 4)
+    assert deep['nodes'] > 8 * shallow['nodes']
+    assert deep['peak_bytes'] - shallow['peak_bytes'] < PEAK_SLACK_BYTES
+    assert deep['retained_bytes'] - shallow['retained_bytes'] < PEAK_SLACK_BYTES
+
+def test_move_codes_match_encode_move():
+    for from_index, from_pos in enumerate(SQUARE_COORDS):
+        for to_index, to_pos in enumerate(SQUARE_COORDS):
+            code = MOVE_CODES[from_index][to_index]
+            assert code == encode_move(from_pos, to_pos)
+            assert decode_move(code) == (from_pos, to_pos, None)
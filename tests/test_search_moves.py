@@ -0,0 +1,24 @@
+"""Root searches restricted with search_moves."""
+
+from chess_engine.ai import AIDifficulty, ChessAI
+from chess_engine.game import GameState
+
+KIWIPETE = "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1"
+# Qxf6, giving the queen for a knight
+PLAYED = ((5, 5), (2, 5))
+
+def test_restricted_search_leaves_root_entry_alone():
+    game = GameState()
+    game.load_fen(KIWIPETE)
+    ai = ChessAI(AIDifficulty.EXPERT)
+    ai.search(game, max_depth=3)
+    best_score = ai.last_score
+    root_entry = ai.transposition_table.get(game.position_key())
+
+    ai.search(game, max_depth=3, search_moves=[PLAYED])
+    assert ai.last_score < best_score
+    assert ai.last_pv[0] == PLAYED
+    assert ai.transposition_table.get(game.position_key()) == root_entry
+
+    ai.search(game, max_depth=3)
+    assert ai.last_score == best_score
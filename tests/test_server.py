@@ -0,0 +1,68 @@
+"""Game server behaviour when the AI's search fails."""
+
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from chess_engine import server
+from chess_engine.server import AI_MOVE_ATTEMPTS, GameServer
+
+class FlakyWorker:
+    """choose_ai_move stand-in that fails a given number of times, then plays a fixed move"""
+
+    def __init__(self, failures):
+        self.failures = failures
+        self.calls = 0
+
+    def __call__(self, task):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise RuntimeError("worker crashed")
+        return 'e7e5'
+
+async def exchange(requests_after_failure=()):
+    game_server = GameServer(port=0, workers=1)
+    await game_server.start()
+    # Threads see the monkeypatched worker function
+    game_server.pool.shutdown()
+    game_server.pool = ThreadPoolExecutor(1)
+    reader, writer = await asyncio.open_connection(game_server.host, game_server.port)
+    messages = []
+
+    async def receive(predicate):
+        while True:
+            message = json.loads(await asyncio.wait_for(reader.readline(), 10))
+            messages.append(message)
+            if predicate(message):
+                return message
+
+    try:
+        writer.write(b'{"op": "new", "mode": "ai", "ai_color": "b"}\n')
+        writer.write(b'{"op": "move", "game": 1, "move": "e2e4"}\n')
+        await writer.drain()
+        await receive(lambda message: message['type'] in ('error', 'state') and
+                      (message['type'] == 'error' or len(message['moves']) == 2))
+        for request in requests_after_failure:
+            writer.write(json.dumps(request).encode() + b'\n')
+            await writer.drain()
+            await receive(lambda message: message['type'] == 'state' and len(message['moves']) == 2)
+    finally:
+        writer.close()
+        await game_server.close()
+    return messages
+
+def test_failed_ai_move_is_retried(monkeypatch):
+    worker = FlakyWorker(AI_MOVE_ATTEMPTS - 1)
+    monkeypatch.setattr(server, 'choose_ai_move', worker)
+    messages = asyncio.run(exchange())
+    assert messages[-1]['moves'] == ['e2e4', 'e7e5']
+    assert not any(message['type'] == 'error' for message in messages)
+
+def test_failed_ai_move_is_reported_and_resumable(monkeypatch):
+    worker = FlakyWorker(AI_MOVE_ATTEMPTS)
+    monkeypatch.setattr(server, 'choose_ai_move', worker)
+    messages = asyncio.run(exchange([{'op': 'resume', 'game': 1}]))
+    errors = [message for message in messages if message['type'] == 'error']
+    assert len(errors) == 1 and errors[0]['game'] == 1 and 'worker crashed' in errors[0]['error']
+    assert messages[-1]['moves'] == ['e2e4', 'e7e5']
+    assert not messages[-1]['ai_thinking']